@@ -24,6 +24,7 @@ import ara_explorer_UI
 from skimage import measure
 
 from ARA_plotter import ARA_plotter
+from areaTreeModel import areaTreeModel, areaSearchIndex
 
 
 class plugin(ARA_plotter, lasagna_plugin, QtGui.QWidget, ara_explorer_UI.Ui_ara_explorer): 
@@ -52,6 +53,9 @@ class plugin(ARA_plotter, lasagna_plugin, QtGui.QWidget, ara_explorer_UI.Ui_ara_
         #The root node index of the ARA
         self.rootNode=8  
 
+        #The area tree is expanded to show the search results if there are no more than this many
+        self.maxAreasToExpand=200
+
         #Warn and quit if there are no paths
         if len(self.prefs['ara_paths'])==0:
            self.warnAndQuit('Please fill in preferences file at<br>%s<br><a href="http://raacampbell.github.io/lasagna/ara_explorer_plugin.html">http://raacampbell.github.io/lasagna/ara_explorer_plugin.html</a>' % self.pref_file)
@@ -63,11 +67,10 @@ class plugin(ARA_plotter, lasagna_plugin, QtGui.QWidget, ara_explorer_UI.Ui_ara_
         self.statusBarName_checkBox.setChecked(self.prefs['enableNameInStatusBar'])
         self.highlightArea_checkBox.setChecked(self.prefs['enableOverlay'])
         
-        self.brainArea_itemModel = QtGui.QStandardItemModel(self.brainArea_treeView)
-        self.brainArea_treeView.setModel(self.brainArea_itemModel)
-
-        #Link the selections in the tree view to a slot in order to allow highlighting of the selected area
-        self.brainArea_treeView.selectionModel().selectionChanged[QtCore.QItemSelection, QtCore.QItemSelection].connect(self.highlightSelectedAreaFromList)
+        #The model of the brain area tree and its search index are made when the labels are loaded (see setAreaTreeModel)
+        self.brainArea_itemModel = None
+        self.brainArea_searchIndex = None
+        self.areaSearch_lineEdit.textChanged.connect(self.areaSearch_lineEdit_slot)
 
 
         #Link signals to slots
@@ -310,7 +313,7 @@ class plugin(ARA_plotter, lasagna_plugin, QtGui.QWidget, ara_explorer_UI.Ui_ara_
         self.data['labels'] = self.loadLabels(paths['labels']) #see ARA_plotter.py
 
 
-        self.addAreaDataToTreeView(self.data['labels'],self.rootNode,self.brainArea_itemModel.invisibleRootItem())
+        self.setAreaTreeModel(self.data['labels'])
 
         self.lasagna.loadImageStack(paths['atlas'])
         
@@ -345,60 +348,61 @@ class plugin(ARA_plotter, lasagna_plugin, QtGui.QWidget, ara_explorer_UI.Ui_ara_
 
     #---------------
     #Methods to handle the tree 
-    def addAreaDataToTreeView(self,thisTree,nodeID,parent):
+    def setAreaTreeModel(self,thisTree):
         """
-        Add a tree structure of area names to the QListView
+        Show the areas below the root node of thisTree in the tree view. Areas are read from the tree as the
+        view needs them (see areaTreeModel.py).
         """
+        (oldModel,oldSelectionModel) = (self.brainArea_itemModel, self.brainArea_treeView.selectionModel())
 
-        children = thisTree[nodeID].children
-        for child in sorted(children):
-            child_item = QtGui.QStandardItem(thisTree[child].data['name'])
-            child_item.setData(child) #Store index. Can be retrieved by: child_item.data().toInt()[0] NOT USING THIS RIGHT NOW
-            parent.appendRow(child_item)
-            self.addAreaDataToTreeView(thisTree, child, child_item)
+        self.brainArea_itemModel = areaTreeModel(thisTree, self.rootNode, self.brainArea_treeView)
+        self.brainArea_searchIndex = areaSearchIndex(thisTree, thisTree.descendants(self.rootNode))
+        self.brainArea_treeView.setModel(self.brainArea_itemModel)
+
+        #The view does not delete the model and selection model it replaces. Each old model holds a label tree.
+        for thisObject in (oldSelectionModel, oldModel):
+            if thisObject is not None:
+                thisObject.deleteLater()
 
+        #Link the selections in the tree view to a slot in order to allow highlighting of the selected area
+        self.brainArea_treeView.selectionModel().selectionChanged[QtCore.QItemSelection, QtCore.QItemSelection].connect(self.highlightSelectedAreaFromList)
 
-    def AreaName2NodeID(self,thisTree,name,nodeID=None):
+        if len(self.areaSearch_lineEdit.text())>0:
+            self.areaSearch_lineEdit_slot(self.areaSearch_lineEdit.text())
+
+
+    def areaSearch_lineEdit_slot(self,text):
         """
-        Searches the tree for a brain area called name and returns the node ID (atlas index value)
-        Breaks out of the search loop if the area is found and propagates the value back through
-        the recursive function calls
+        Show only the areas whose name or acronym contains the search text (and the areas above them)
         """
-        if nodeID is None:
-            nodeID = self.rootNode
-        
-        children = thisTree[nodeID].children
-        for child in sorted(children):
-            if thisTree[child].data['name']==name:
-                return child
-            else:
-                returnVal = self.AreaName2NodeID(thisTree=thisTree, name=name, nodeID=child)
-                if returnVal != False:
-                    return returnVal
+        if self.brainArea_itemModel is None:
+            return
 
-        return False
+        text = str(text).strip()
+        if len(text)==0:
+            self.brainArea_itemModel.setFilter(None)
+            return
+
+        matches = self.brainArea_searchIndex.search(text)
+        self.brainArea_itemModel.setFilter(matches)
+        if len(matches) <= self.maxAreasToExpand:
+            self.brainArea_treeView.expandAll()
 
 
     def highlightSelectedAreaFromList(self):
         """
         This slot is run when the user clicks on a brain area in the list
         """
-        getFromModel = False #It would be great to get the area ID from the model, but I can't figure out how to get the sub-model that houses the data
-
-        index = self.brainArea_treeView.selectedIndexes()[0]
+        selected = self.brainArea_treeView.selectedIndexes()
+        if len(selected)==0:
+            return
 
         #Get the image stack, as we need to feed it to drawAreaHighlight
         araName = str(self.araName_comboBox.itemText(self.araName_comboBox.currentIndex()))
         atlasLayerName = self.paths[araName]['atlas'].split(os.path.sep)[-1]
         imageStack = self.lasagna.returnIngredientByName(atlasLayerName).raw_data()
 
-        if getFromModel:
-            #The following row and column indexes are also correct, but index.model() is the root model and this is wrong.
-            treeIndex = index.model().item(index.row(),index.column()).data().toInt()[0] 
-            print("treeIndex (%d,%d): %d" % (index.row(),index.column(),treeIndex))
-        else: #so we do it the stupid way from the reee
-            areaName = index.data()
-            treeIndex = self.AreaName2NodeID(self.data['labels'],areaName)
+        treeIndex = self.brainArea_itemModel.areaID(selected[0]) #Each index of the model holds its area ID
 
         if treeIndex != None:
             #print "highlighting %d" % treeIndex
@@ -9,6 +9,7 @@ import lasagna_helperFunctions as lasHelp
 import numpy as np
 import pyqtgraph as pg
 import os.path
+from collections import OrderedDict
 
 
 
@@ -20,6 +21,8 @@ import ara_json, tree
 #For contour drawing
 from skimage import measure
 
+contourCacheSize = 512 #The number of area contours, each for one axis, slice and area, kept by ARA_plotter.areaContours
+
 class ARA_plotter(object): #must inherit lasagna_plugin first
     def __init__(self,lasagna):
         super(ARA_plotter,self).__init__(lasagna)
@@ -27,6 +30,10 @@ class ARA_plotter(object): #must inherit lasagna_plugin first
         self.lasagna = lasagna
         self.contourName = 'aracontour' #The ingredient name for the ARA contour
 
+        #Area contours in lasagna coordinates, most recently used last, keyed by (axis,slice,area) for the atlas _contourAtlas
+        self._contourCache = OrderedDict()
+        self._contourAtlas = None
+
 
 
     #--------------------------------------
@@ -52,8 +59,7 @@ class ARA_plotter(object): #must inherit lasagna_plugin first
             return tree.importData(fname,colSep=colSep, headerLine=True)
 
         if fname.lower().endswith('.json'):
-            (flattened,colNames) = ara_json.importData(fname)
-            return tree.importData(flattened.split('\n'), colSep='|', headerLine=colNames)
+            return ara_json.importTree(fname)
 
 
     def guessFileSep(self,fname):
@@ -159,12 +165,56 @@ class ARA_plotter(object): #must inherit lasagna_plugin first
 
         imageStack = np.swapaxes(imageStack,0,axisNumber)
         thisSlice = self.lasagna.axes2D[axisNumber].currentSlice  #This is the current slice in this axis
-        tmpImage = np.array(imageStack[thisSlice]) #So this is the image associated with that slice
+        plane = imageStack[thisSlice]
+
+        #Only the area's bounding box, and a pixel either side of it, is needed to trace around the area
+        inArea = plane==value
+        rows = np.flatnonzero(inArea.any(axis=1))
+        if len(rows)==0:
+            return []
+        cols = np.flatnonzero(inArea.any(axis=0))
+        (r0,r1) = (max(rows[0]-1,0), min(rows[-1]+2,plane.shape[0]))
+        (c0,c1) = (max(cols[0]-1,0), min(cols[-1]+2,plane.shape[1]))
+        tmpImage = np.array(plane[r0:r1,c0:c1])
 
         #Make a copy of the image and set values lower than our value to a greater number
         #since the countour finder will draw around everything less than our value
         tmpImage[tmpImage<value] = value+10
-        return measure.find_contours(tmpImage, value)
+        return [thisContour + (r0,c0) for thisContour in measure.find_contours(tmpImage, value)]
+
+
+    def areaContours(self, imageStack, axisNumber, value):
+        """
+        Return the contours of area value in the current slice of axis axisNumber as an n by 3 array of 
+        vertices in lasagna coordinates, with a row of NaNs after each contour. Contours are kept in a 
+        cache of the contourCacheSize most recently used, which is emptied when the atlas changes.
+        """
+        if imageStack is not self._contourAtlas:
+            self._contourCache.clear()
+            self._contourAtlas = imageStack
+
+        thisSlice = self.lasagna.axes2D[axisNumber].currentSlice
+        key = (axisNumber, thisSlice, value)
+        if key in self._contourCache:
+            self._contourCache.move_to_end(key)
+            return self._contourCache[key]
+
+        contours = self.getContoursFromAxis(imageStack,axisNumber=axisNumber,value=value)
+
+        #The two in-plane columns of the contours in lasagna's (z,x,y) order
+        planeColumns = {0:[1,2], 1:[0,2], 2:[1,0]}[axisNumber]
+        vertices = np.full((sum([len(thisContour)+1 for thisContour in contours]),3), np.nan)
+        row = 0
+        for thisContour in contours:
+            rows = slice(row, row+len(thisContour))
+            vertices[rows,axisNumber] = thisSlice
+            vertices[rows,planeColumns] = thisContour
+            row += len(thisContour)+1 #Terminate each contour with nans so that they are not linked
+
+        self._contourCache[key] = vertices
+        if len(self._contourCache) > contourCacheSize:
+            self._contourCache.popitem(last=False)
+        return vertices
 
 
     def drawAreaHighlight(self, imageStack, value, highlightOnlyCurrentAxis=False):
@@ -174,44 +224,33 @@ class ARA_plotter(object): #must inherit lasagna_plugin first
         if value<=0:
             return
 
-        nans = np.array([np.nan, np.nan, np.nan]).reshape(1,3)
-        allContours = nans
-
+        pieces = [np.full((1,3), np.nan)]
         for axNum in range(len(self.lasagna.axes2D)):
-            contours = self.getContoursFromAxis(imageStack,axisNumber=axNum,value=value)
-
+            if highlightOnlyCurrentAxis == True  and  axNum != self.lasagna.inAxis:
+                contours = []
+            else:
+                contours = self.areaContours(imageStack,axNum,value)
 
-            if (highlightOnlyCurrentAxis == True  and  axNum != self.lasagna.inAxis) or len(contours)==0:
-                tmpNan =  np.array([np.nan, np.nan, np.nan]).reshape(1,3)
+            if len(contours)==0:
+                tmpNan =  np.full((1,3), np.nan)
                 tmpNan[0][axNum]=self.lasagna.axes2D[axNum].currentSlice #ensure nothing is plotted in this layer
-                allContours = np.append(allContours,tmpNan,axis=0)
+                pieces.append(tmpNan)
                 continue
 
-            #print "Plotting area %d in plane %d" % (value,self.lasagna.axes2D[axNum].currentSlice)
-            for thisContour in contours:
-                tmp = np.ones(thisContour.shape[0]*3).reshape(thisContour.shape[0],3)*self.lasagna.axes2D[axNum].currentSlice
-
-                if axNum==0:
-                    tmp[:,1:] = thisContour
-
-                elif axNum==1:
-                    tmp[:,0] = thisContour[:,0]
-                    tmp[:,2] = thisContour[:,1]
-
-                elif axNum==2:
-                    tmp[:,1] = thisContour[:,0]
-                    tmp[:,0] = thisContour[:,1]
-
-                tmp = np.append(tmp,nans,axis=0) #Terminate each contour with nans so that they are not  linked
-                allContours = np.append(allContours,tmp,axis=0)
-
+            pieces.append(contours)
             if highlightOnlyCurrentAxis:
                 self.lastValue = value 
-        
-            
-        #Replace the data in the ingredient so they are plotted
+
+        #Gather the contours into one array
+        allContours = np.empty((sum([len(thisPiece) for thisPiece in pieces]),3))
+        row = 0
+        for thisPiece in pieces:
+            allContours[row:row+len(thisPiece)] = thisPiece
+            row += len(thisPiece)
+
+        #Replace the data in the ingredient and redraw only the contour
         self.lasagna.returnIngredientByName(self.contourName)._data = allContours
-        self.lasagna.initialiseAxes()
+        self.lasagna.redrawIngredient(self.contourName)
             
 
     def setARAcolors(self):
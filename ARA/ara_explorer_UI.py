@@ -56,6 +56,10 @@ class Ui_ara_explorer(object):
         self.overlayTemplate_checkBox.setChecked(False)
         self.overlayTemplate_checkBox.setObjectName("overlayTemplate_checkBox")
         self.verticalLayout.addWidget(self.frame)
+        self.areaSearch_lineEdit = QtWidgets.QLineEdit(ara_explorer)
+        self.areaSearch_lineEdit.setClearButtonEnabled(True)
+        self.areaSearch_lineEdit.setObjectName("areaSearch_lineEdit")
+        self.verticalLayout.addWidget(self.areaSearch_lineEdit)
         self.brainArea_treeView = QtWidgets.QTreeView(ara_explorer)
         self.brainArea_treeView.setObjectName("brainArea_treeView")
         self.verticalLayout.addWidget(self.brainArea_treeView)
@@ -70,4 +74,5 @@ class Ui_ara_explorer(object):
         self.statusBarName_checkBox.setText(_translate("ara_explorer", "show name in status bar"))
         self.highlightArea_checkBox.setText(_translate("ara_explorer", "highlight area"))
         self.overlayTemplate_checkBox.setText(_translate("ara_explorer", "overlay template"))
+        self.areaSearch_lineEdit.setPlaceholderText(_translate("ara_explorer", "search area names and acronyms"))
 
@@ -0,0 +1,204 @@
+"""
+A Qt item model of the brain area hierarchy and a search index over the area names.
+
+areaTreeModel serves the label tree (see ara_json.importTree) to a QTreeView on demand: the children of
+an area are looked up only when the view expands it, so loading an atlas does not build an item for every
+area. Each model index holds the tree position of its area, so the area ID of a selected index is a
+look-up rather than a search by name.
+
+areaSearchIndex finds the areas whose name or acronym starts with, or contains, some text. It is meant
+for filtering as the user types: each search only looks within the matches of the previous one if the
+new text extends the old.
+"""
+
+from bisect import bisect_left, bisect_right
+import numpy as np
+from PyQt5 import QtCore
+
+
+class areaTreeModel(QtCore.QAbstractItemModel):
+    """
+    A read-only, one column model of the areas below rootNode in a label tree. Areas are sorted by ID.
+    The area ID of an index is returned by areaID and by data with role QtCore.Qt.UserRole.
+    """
+
+    def __init__(self, labels, rootNode, parent=None):
+        super(areaTreeModel,self).__init__(parent)
+        self.labels = labels
+        self.rootNode = rootNode
+        self._rootPosition = labels.positionOf(rootNode)
+        self._visible = None   #boolean array of the positions shown, or None to show all. See setFilter
+        self._children = {}    #position: list of the positions of the children shown
+        self._row = {}         #position: row under its parent
+
+
+    def childPositions(self, position):
+        if position not in self._children:
+            children = self.labels.childPositions(position)
+            if self._visible is not None:
+                children = [child for child in children if self._visible[child]]
+            ids = self.labels.identifiers(children)
+            children = [child for (thisID,child) in sorted(zip(ids,children))]
+            self._children[position] = children
+            self._row.update([(child,row) for (row,child) in enumerate(children)])
+        return self._children[position]
+
+
+    def positionOfIndex(self, index):
+        if not index.isValid():
+            return self._rootPosition
+        return index.internalId()
+
+
+    def areaID(self, index):
+        """
+        Return the area ID of index or None if it is not valid
+        """
+        if not index.isValid():
+            return None
+        return self.labels.identifiers([index.internalId()])[0]
+
+
+    def setFilter(self, areaIDs=None):
+        """
+        Show only the areas in areaIDs and the areas above them. If areaIDs is None, all areas are shown.
+        """
+        self.beginResetModel()
+        if areaIDs is None:
+            self._visible = None
+        else:
+            #An area is shown if one of the matches is within its subtree: entry <= matchEntry < exit
+            (order,entry,exit) = self.labels.eulerIndex()
+            matchEntry = np.sort(entry[[self.labels.positionOf(thisID) for thisID in areaIDs]])
+            self._visible = np.searchsorted(matchEntry, exit) > np.searchsorted(matchEntry, entry)
+        self._children = {}
+        self._row = {}
+        self.endResetModel()
+
+
+    #Methods of QAbstractItemModel
+    def index(self, row, column, parent=QtCore.QModelIndex()):
+        children = self.childPositions(self.positionOfIndex(parent))
+        if column != 0 or row < 0 or row >= len(children):
+            return QtCore.QModelIndex()
+        return self.createIndex(row, column, children[row])
+
+
+    def parent(self, index):
+        if not index.isValid():
+            return QtCore.QModelIndex()
+        parentPosition = self.labels.arrays()[0][index.internalId()]
+        if parentPosition == self._rootPosition:
+            return QtCore.QModelIndex()
+        return self.createIndex(self._row[parentPosition], 0, int(parentPosition))
+
+
+    def rowCount(self, parent=QtCore.QModelIndex()):
+        if parent.column() > 0:
+            return 0
+        return len(self.childPositions(self.positionOfIndex(parent)))
+
+
+    def columnCount(self, parent=QtCore.QModelIndex()):
+        return 1
+
+
+    def data(self, index, role=QtCore.Qt.DisplayRole):
+        if not index.isValid():
+            return None
+        areaID = self.areaID(index)
+        if role == QtCore.Qt.DisplayRole:
+            return self.labels[areaID].data['name']
+        if role == QtCore.Qt.ToolTipRole:
+            return self.labels[areaID].data['acronym']
+        if role == QtCore.Qt.UserRole:
+            return areaID
+        return None
+
+
+    def flags(self, index):
+        if not index.isValid():
+            return QtCore.Qt.NoItemFlags
+        return QtCore.Qt.ItemIsEnabled | QtCore.Qt.ItemIsSelectable
+
+
+
+
+class areaSearchIndex(object):
+    """
+    Case-insensitive search of the names and acronyms of the areas in a label tree
+    """
+
+    def __init__(self, labels, areaIDs, columns=('name','acronym')):
+        self.areaIDs = list(areaIDs)
+
+        #Each area's names, in lower case, one after the other with a separator that is not typed, so
+        #a substring search of all names is one pass through a string
+        keys = [[str(labels[thisID].data[column]).lower() for column in columns] for thisID in self.areaIDs]
+        pieces = ['\n' + '\n'.join(theseKeys) for theseKeys in keys]
+        self._text = ''.join(pieces)
+        self._starts = np.concatenate(([0], np.cumsum([len(piece) for piece in pieces])))[:-1].tolist() #index in _text of each area
+
+        #Names sorted, for prefix search by bisection
+        sortedKeys = sorted([(key,area) for (area,theseKeys) in enumerate(keys) for key in theseKeys])
+        self._sortedKeys = [key for (key,area) in sortedKeys]
+        self._sortedAreas = [area for (key,area) in sortedKeys]
+
+        self._lastText = None
+        self._lastMatches = None
+
+
+    def prefixMatches(self, text):
+        """
+        Return the set of areas (indices into areaIDs) with a name or acronym that starts with text
+        """
+        first = bisect_left(self._sortedKeys, text)
+        last = bisect_right(self._sortedKeys, text + '\uffff')
+        return set(self._sortedAreas[first:last])
+
+
+    def substringMatches(self, text, candidates=None):
+        """
+        Return the set of areas (indices into areaIDs) with a name or acronym that contains text.
+        If candidates is supplied only these areas are checked.
+        """
+        if candidates is not None:
+            return set([area for area in candidates if text in self._areaText(area)])
+
+        matches = set()
+        start = self._text.find(text)
+        while start >= 0:
+            area = bisect_right(self._starts, start) - 1
+            matches.add(area)
+            #Carry on from the next area
+            start = self._text.find(text, self._areaEnd(area))
+        return matches
+
+
+    def _areaEnd(self, area):
+        return self._starts[area+1] if area+1 < len(self._starts) else len(self._text)
+
+
+    def _areaText(self, area):
+        return self._text[self._starts[area]:self._areaEnd(area)]
+
+
+    def search(self, text):
+        """
+        Return the IDs of the areas whose name or acronym contains text: those that start with it
+        first, then the others, each in the order of areaIDs.
+        """
+        text = text.strip().lower()
+        if len(text) == 0:
+            return list(self.areaIDs)
+
+        #Text that extends the last search can only match areas that matched it
+        if self._lastText is not None and text.startswith(self._lastText):
+            matches = self.substringMatches(text, self._lastMatches)
+        else:
+            matches = self.substringMatches(text)
+        (self._lastText, self._lastMatches) = (text, matches)
+
+        prefix = self.prefixMatches(text) & matches
+        ordered = sorted(prefix) + sorted(matches - prefix)
+        return [self.areaIDs[area] for area in ordered]
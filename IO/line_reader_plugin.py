@@ -11,12 +11,17 @@ No header.
 
 The loader creates a list of lists, where all points within each list are linked. 
 All points bearing the same lineseries_id are grouped into the same list. 
+
+Lines may also be read from the binary point set files described in points_io (.npz).
+Here the series array holds the lineseries_id of each point.
 """
 
 import os
 from lasagna_plugin import lasagna_plugin
 import numpy as np
-from PyQt5 import QtGui
+from points_io import is_binary_points_file, read_points, lines_from_series
+from text_io import read_numeric_text
+from PyQt5 import QtGui, QtCore
 import lasagna_helperFunctions as lasHelp # Module the provides a variety of import functions (e.g. preference file handling)
 
 
@@ -54,55 +59,57 @@ class loaderClass(lasagna_plugin):
         If the file name is valid, it loads the base stack using the load method.
         """
         if fname is None or fname == False:
-            fname = self.lasagna.showFileLoadDialog(fileFilter="Text Files (*.txt *.csv)")
+            fname = self.lasagna.showFileLoadDialog(fileFilter="Line Files (*.txt *.csv *.npz *.npy)")
     
         if fname is None or fname == False:
             return
 
-        if os.path.isfile(fname): 
-            with open(str(fname),'r') as fid:
-                contents = fid.read()
-    
-
-            # a list of strings with each string being one line from the file
-            # add nans between lineseries
-            asList = contents.split('\n')
-
-            data=[]
-            lastLineSeries=None
-            n=0
-            expectedCols = 4 
-            for ii in range(len(asList)):
-                if len(asList[ii])==0:
-                    continue
+        if os.path.isfile(fname) and is_binary_points_file(fname):
+            try:
+                contents = read_points(str(fname))
+            except (ValueError, IOError) as e:
+                self.lasagna.statusBar.showMessage("Unable to read %s: %s" % (fname, str(e)))
+                return
+            series = contents['series']
+            if series is None:
+                series = np.zeros(len(contents['points']), dtype=int) #a single line
+            self.addLines(fname, lines_from_series(contents['points'], series))
+
+        elif os.path.isfile(fname): 
+            # Parse all rows in one pass then join consecutive rows with the same lineseries_id
+            data = read_numeric_text(str(fname), progress=self.showReadProgress)
+            if data is not None and len(data) == 0:
+                self.lasagna.statusBar.showMessage("No lines in " + str(fname))
+                return
+            if data is None or data.shape[1] != 4:
+                #All rows should have a length of 4, since this is what a line series needs
+                print("Lines data file %s appears corrupt" % fname)
+                return
+
+            self.addLines(fname, lines_from_series(data[:,1:], data[:,0]))
 
-                thisLineAsFloats = [float(x) for x in asList[ii].split(',')]
-                if not len(thisLineAsFloats)==expectedCols:
-                    #Check that all rows have a length of 4, since this is what a line series needs
-                    print("Lines data file %s appears corrupt" % fname)
-                    return                     
-
-                if lastLineSeries is None:
-                    lastLineSeries=thisLineAsFloats[0]
-
-                if lastLineSeries != thisLineAsFloats[0]:
-                    n+=1
-                    data.append([np.nan, np.nan, np.nan])
-
-                lastLineSeries=thisLineAsFloats[0]
-                data.append(thisLineAsFloats[1:])
+        else:
+            self.lasagna.statusBar.showMessage("Unable to find " + str(fname))
 
 
-            objName=fname.split(os.path.sep)[-1]
-            self.lasagna.addIngredient(objectName=objName, 
-                        kind=self.kind,
-                        data=np.asarray(data), 
-                        fname=fname,
-                        )
+    def addLines(self, fname, data):
+        """
+        Add a lines ingredient holding data, with rows of NaNs between the lines, named after fname
+        """
+        objName=fname.split(os.path.sep)[-1]
+        self.lasagna.addIngredient(objectName=objName, 
+                    kind=self.kind,
+                    data=data, 
+                    fname=fname,
+                    )
 
-            self.lasagna.returnIngredientByName(objName).addToPlots() #Add item to all three 2D plots
-            self.lasagna.initialiseAxes()
+        self.lasagna.returnIngredientByName(objName).addToPlots() #Add item to all three 2D plots
+        self.lasagna.initialiseAxes()
 
 
-        else:
-            self.lasagna.statusBar.showMessage("Unable to find " + str(fname))
+    def showReadProgress(self, fraction):
+        """
+        Report progress whilst a large file is read
+        """
+        self.lasagna.statusBar.showMessage("Reading lines: %d%%" % (fraction*100))
+        QtCore.QCoreApplication.processEvents()
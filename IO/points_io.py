@@ -0,0 +1,155 @@
+"""
+Read and write point sets in a compact binary format
+
+A point set file is an uncompressed .npz file holding:
+points - n by 3 float32 array of (z,x,y) positions, in lasagna order
+series - optional length n int32 array with the series (e.g. cell type or line ID) of each point
+attr_<name> - optional length n arrays of per-point attributes (e.g. attr_volume, attr_intensity)
+
+As the file is not compressed, each array is stored contiguously and is memory-mapped on reading
+rather than loaded. So even tables of tens of millions of points open instantly and only the
+parts that are plotted are read from disk. Plain .npy files holding an n by 3 array (or n by 4,
+with the series in the last column) can also be read.
+"""
+import os
+import zipfile
+import numpy as np
+
+
+binary_extensions = ('.npz', '.npy')
+
+
+def is_binary_points_file(file_name):
+    return file_name.lower().endswith(binary_extensions)
+
+
+def write_points(file_name, points, series=None, attributes=None):
+    """ Write a point set file
+
+    :param file_name: target file. '.npz' is appended if it has no extension
+    :param points: n by 3 array of (z,x,y) positions
+    :param series: optional length n array of integer series IDs
+    :param attributes: optional dictionary of length n arrays
+    :return: the name of the file written
+    """
+    if len(os.path.splitext(file_name)[1]) == 0:
+        file_name += '.npz'
+
+    points = np.asarray(points, dtype=np.float32).reshape(-1, 3)
+    arrays = {'points': points}
+    if series is not None:
+        arrays['series'] = np.asarray(series, dtype=np.int32)
+    for (name, values) in (attributes or dict()).items():
+        arrays['attr_' + name] = np.asarray(values)
+
+    for (name, values) in arrays.items():
+        if len(values) != len(points):
+            raise ValueError('%s has %i rows but there are %i points' % (name, len(values), len(points)))
+
+    np.savez(file_name, **arrays)  # savez does not compress, so the arrays can be memory-mapped
+    return file_name
+
+
+def mmap_npz(file_name):
+    """ Memory-map each array in an uncompressed npz file
+
+    :param file_name: npz file
+    :return: dictionary of read-only np.memmap arrays. Compressed arrays are read into memory.
+    """
+    arrays = dict()
+    with zipfile.ZipFile(file_name) as archive, open(file_name, 'rb') as in_file:
+        for info in archive.infolist():
+            name = info.filename[:-4] if info.filename.endswith('.npy') else info.filename
+
+            header = None
+            if info.compress_type == zipfile.ZIP_STORED:
+                # The member's data follow its local header, whose name and extra fields have variable length
+                in_file.seek(info.header_offset)
+                local_header = in_file.read(30)
+                name_length = int.from_bytes(local_header[26:28], 'little')
+                extra_length = int.from_bytes(local_header[28:30], 'little')
+                in_file.seek(info.header_offset + 30 + name_length + extra_length)
+
+                version = np.lib.format.read_magic(in_file)
+                if version == (1, 0):
+                    header = np.lib.format.read_array_header_1_0(in_file)
+                elif version == (2, 0):
+                    header = np.lib.format.read_array_header_2_0(in_file)
+
+            if header is None or header[2].hasobject:
+                # Compressed, or in a form that can not be mapped, so read it the normal way
+                with archive.open(info) as member:
+                    arrays[name] = np.lib.format.read_array(member)
+                continue
+
+            (shape, fortran_order, dtype) = header
+            if np.prod(shape) == 0:
+                arrays[name] = np.zeros(shape, dtype=dtype)
+                continue
+            arrays[name] = np.memmap(file_name, dtype=dtype, mode='r', offset=in_file.tell(), shape=shape,
+                                     order='F' if fortran_order else 'C')
+    return arrays
+
+
+def read_points(file_name, mmap=True):
+    """ Read a point set file
+
+    :param file_name: .npz point set file (see write_points) or .npy file
+    :param mmap: memory-map the arrays rather than reading them into memory (default True)
+    :return: dictionary with keys 'points' (n by 3), 'series' (length n or None) and 'attributes' (dictionary)
+    """
+    if file_name.lower().endswith('.npy'):
+        data = np.load(file_name, mmap_mode='r' if mmap else None)
+        if data.ndim != 2 or data.shape[1] not in (3, 4):
+            raise ValueError('%s should hold an n by 3 or n by 4 array' % file_name)
+        series = data[:, 3].astype(np.int32) if data.shape[1] == 4 else None
+        return {'points': data[:, :3], 'series': series, 'attributes': dict()}
+
+    if mmap:
+        arrays = mmap_npz(file_name)
+    else:
+        with np.load(file_name) as contents:
+            arrays = dict(contents)
+
+    if 'points' not in arrays:
+        raise ValueError('%s has no points array' % file_name)
+
+    return {'points': arrays['points'],
+            'series': arrays.get('series'),
+            'attributes': dict([(name[5:], values) for (name, values) in arrays.items() if name.startswith('attr_')])}
+
+
+def split_by_series(series, *arrays):
+    """ Group the rows of arrays by their series ID
+
+    :param series: length n array of series IDs
+    :param arrays: arrays with n rows (e.g. points and attributes)
+    :return: a list of (series ID, [rows of each array]) tuples, sorted by ID. Rows keep their original order.
+    """
+    order = np.argsort(series, kind='stable')
+    (ids, starts) = np.unique(np.asarray(series)[order], return_index=True)
+    groups = [np.split(np.asarray(thisArray)[order], starts[1:]) for thisArray in arrays]
+    return [(thisID, [thisGroup[ii] for thisGroup in groups]) for (ii, thisID) in enumerate(ids)]
+
+
+def lines_from_series(points, series):
+    """ Convert points grouped by series into the lines format: one array with a row of NaNs between series
+
+    :param points: n by 3 array
+    :param series: length n array of line IDs. Consecutive points with the same ID are joined.
+    :return: array of lines data as used by the lines ingredient
+    """
+    breaks = np.flatnonzero(np.diff(series) != 0) + 1
+    return np.insert(np.asarray(points, dtype=np.float64), breaks, np.nan, axis=0)
+
+
+def series_from_lines(data):
+    """ The inverse of lines_from_series
+
+    :param data: lines data with rows of NaNs between lines
+    :return: (points, series)
+    """
+    data = np.asarray(data, dtype=np.float64).reshape(-1, 3)
+    is_break = np.any(np.isnan(data), axis=1)
+    series = np.cumsum(is_break)
+    return (data[~is_break], series[~is_break])
@@ -26,6 +26,9 @@ All points with the same scalar value are grouped together as one ingredient.
 This allows points of different sorts to be overlaid easily on the same 
 image and have their properties changed together. 
 
+Points may also be read from the binary point set files described in points_io (.npz or .npy).
+These are memory-mapped, so they load quickly however many points they hold. Per-point
+attributes in these files are attached to the ingredients (see sparsepoints.attributes).
 
 """
 
@@ -33,8 +36,10 @@ image and have their properties changed together.
 import os
 from lasagna_plugin import lasagna_plugin
 from elastix_io import read_pts_file
+from text_io import read_numeric_text, split_series
+from points_io import is_binary_points_file, read_points, split_by_series
 import numpy as np
-from PyQt5 import QtGui
+from PyQt5 import QtGui, QtCore
 
 
 class loaderClass(lasagna_plugin):
@@ -70,27 +75,30 @@ class loaderClass(lasagna_plugin):
         """
         
         if fname is None or fname is False:
-            fname = self.lasagna.showFileLoadDialog(fileFilter="Text Files (*.txt *.csv *.pts)")
+            fname = self.lasagna.showFileLoadDialog(fileFilter="Point Files (*.txt *.csv *.pts *.npz *.npy)")
 
         if fname is None or fname is False:
             return
 
         if os.path.isfile(fname):
+            if is_binary_points_file(fname):
+                self.loadBinary(fname)
+                return
+
             if fname.endswith('.pts'):
                 data, roi_type = read_pts_file(fname)
+                data = np.asarray(data)
                 if roi_type == 'point':
                     print('!!! WARNING points are set in real world coordinates. I assume a pixel size of 1')
             else:
-                with open(str(fname), 'r') as fid:
-                    contents = fid.read()
+                data = read_numeric_text(str(fname), progress=self.showReadProgress)
+                if data is None:
+                    self.lasagna.statusBar.showMessage("Unable to read " + str(fname))
+                    return
 
-                # a list of strings with each string being one line from the file
-                asList = contents.split('\n')
-                data = []
-                for ii in range(len(asList)):
-                    if len(asList[ii]) == 0:
-                        continue
-                    data.append([float(x) for x in asList[ii].split(',')])
+            if len(data) == 0:
+                self.lasagna.statusBar.showMessage("No points in " + str(fname))
+                return
 
             # A point series should be a list of lists where each list has a length of 3,
             # corresponding to the position of each point in 3D space. However, point
@@ -98,12 +106,12 @@ class loaderClass(lasagna_plugin):
             # value is the index of the series. This allows a single file to hold multiple
             # different point series. We handle these two cases differently. First we deal
             # with the the standard case:
-            if len(data[0]) == 3:
+            if data.shape[1] == 3:
                 # Create an ingredient with the same name as the file name 
                 objName = fname.split(os.path.sep)[-1]
                 self.lasagna.addIngredient(objectName=objName,
                                            kind=self.kind,
-                                           data=np.asarray(data),
+                                           data=data,
                                            fname=fname
                                            )
                 # Add this ingredient to all three plots
@@ -111,19 +119,9 @@ class loaderClass(lasagna_plugin):
                 # Update the plots
                 self.lasagna.initialiseAxes()
 
-            elif len(data[0]) == 4:
-                # What are the unique data series values?
-                dSeries = [x[3] for x in data]
-                dSeries = list(set(dSeries))
-                
-                # Loop through these unique series and add as separate sparse point objects
-
-                for thisIndex in dSeries:
-                    tmp = []
-                    for thisRow in data:
-                        if thisRow[3] == thisIndex:
-                            tmp.append(thisRow[:3])
-
+            elif data.shape[1] == 4:
+                # Split the rows by their series value and add each series as a separate sparse point object
+                for (thisIndex,tmp) in split_series(data, 3):
                     print("Adding point series %d with %d points" % (thisIndex,len(tmp)))
 
                     # Create an ingredient with the same name as the file name 
@@ -131,18 +129,66 @@ class loaderClass(lasagna_plugin):
 
                     self.lasagna.addIngredient(objectName=objName,
                                                kind=self.kind,
-                                               data=np.asarray(tmp),
+                                               data=tmp,
                                                fname=fname
                                                )
 
                     # Add this ingredient to all three plots
                     self.lasagna.returnIngredientByName(objName).addToPlots() 
 
-                    # Update the plots
-                    self.lasagna.initialiseAxes()
+                # Update the plots once all series are added
+                self.lasagna.initialiseAxes()
 
             else:
-                print(("Point series has %d columns. Only 3 or 4 columns are supported" % len(data[1])))
+                print(("Point series has %d columns. Only 3 or 4 columns are supported" % data.shape[1]))
 
         else:
             self.lasagna.statusBar.showMessage("Unable to find " + str(fname))
+
+
+    def loadBinary(self, fname):
+        """
+        Load a binary point set file. Each series becomes a separate ingredient.
+        """
+        try:
+            contents = read_points(str(fname))
+        except (ValueError, IOError) as e:
+            self.lasagna.statusBar.showMessage("Unable to read %s: %s" % (fname, str(e)))
+            return
+
+        points = contents['points']
+        if len(points) == 0:
+            self.lasagna.statusBar.showMessage("No points in " + str(fname))
+            return
+
+        attributeNames = list(contents['attributes'].keys())
+        attributes = [contents['attributes'][thisName] for thisName in attributeNames]
+        shortName = fname.split(os.path.sep)[-1]
+
+        if contents['series'] is None:
+            # Keep the memory-mapped arrays as they are
+            series = [(shortName, points, attributes)]
+        else:
+            series = [("%s #%d" % (shortName, thisIndex), arrays[0], arrays[1:])
+                      for (thisIndex, arrays) in split_by_series(contents['series'], points, *attributes)]
+
+        for (objName, data, theseAttributes) in series:
+            print("Adding point series %s with %d points" % (objName, len(data)))
+            self.lasagna.addIngredient(objectName=objName,
+                                       kind=self.kind,
+                                       data=data,
+                                       fname=fname
+                                       )
+            ingredient = self.lasagna.returnIngredientByName(objName)
+            ingredient.attributes = dict(zip(attributeNames, theseAttributes))
+            ingredient.addToPlots()
+
+        self.lasagna.initialiseAxes()
+
+
+    def showReadProgress(self, fraction):
+        """
+        Report progress whilst a large file is read
+        """
+        self.lasagna.statusBar.showMessage("Reading points: %d%%" % (fraction*100))
+        QtCore.QCoreApplication.processEvents()
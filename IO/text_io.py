@@ -0,0 +1,107 @@
+"""
+Fast reading of numeric text files such as the sparse points and lines CSV files
+"""
+import os
+import numpy as np
+
+
+def read_numeric_text(file_name, chunk_bytes=64*1024**2, progress=None):
+    """ Read a text file of numbers, one row per line, into a 2D float array
+
+    Values may be separated by commas and/or white space. Empty lines are ignored.
+    The file is parsed in C (by np.fromstring) a chunk of lines at a time.
+
+    :param file_name: file to read
+    :param chunk_bytes: approximate number of bytes parsed at once
+    :param progress: optional function called with the fraction of the file read after each chunk
+    :return: an n by m float array, where m is the number of values in the first row.
+             Returns None if the rows do not all have the same number of values or a value is not a number.
+    """
+
+    file_size = max(os.path.getsize(file_name), 1)
+    n_cols = None
+    chunks = []
+    with open(file_name, 'rb') as in_file:
+        remainder = b''
+        while True:
+            block = in_file.read(chunk_bytes)
+            text = remainder + block
+            if len(block) > 0:
+                # Only parse complete lines. The rest is carried over to the next chunk
+                last_newline = text.rfind(b'\n')
+                if last_newline < 0:
+                    remainder = text
+                    continue
+                (text, remainder) = (text[:last_newline+1], text[last_newline+1:])
+
+            if n_cols is None:
+                n_cols = count_columns(text)
+
+            if n_cols is not None:
+                per_line = values_per_line(text)
+                if np.any(per_line[per_line > 0] != n_cols):
+                    print('!!! %s does not have %i values in every row' % (file_name, n_cols))
+                    return None
+                try:
+                    values = np.fromstring(text.replace(b',', b' ').decode('latin-1'), dtype=np.float64, sep=' ')
+                except ValueError:
+                    values = np.zeros(0)
+                if len(values) != n_cols * np.count_nonzero(per_line):
+                    print('!!! %s has values that are not numbers' % file_name)
+                    return None
+                chunks.append(values.reshape(-1, n_cols))
+
+            if progress is not None:
+                progress(min(in_file.tell() / file_size, 1.0))
+            if len(block) == 0:
+                break
+
+    if len(chunks) == 0:
+        return np.zeros((0, n_cols or 0))
+    return np.concatenate(chunks)
+
+
+def count_columns(text):
+    """ Return the number of values in the first non-empty line of text (bytes), or None if there is none
+    """
+    start = 0
+    while start < len(text):
+        end = text.find(b'\n', start)
+        end = len(text) if end < 0 else end
+        row = text[start:end].replace(b',', b' ').split()
+        if len(row) > 0:
+            return len(row)
+        start = end+1
+    return None
+
+
+def values_per_line(text):
+    """ Return an array with the number of values on each line of text (bytes). Values are separated by commas
+    and/or white space. Empty lines have no values.
+    """
+    chars = np.frombuffer(text, dtype=np.uint8)
+    newlines = np.flatnonzero(chars == ord('\n'))
+    is_separator = _separator_table[chars]
+    # A value starts at each character that is not a separator and follows a separator or the start of the text
+    starts = ~is_separator
+    starts[1:] &= is_separator[:-1]
+    return np.bincount(np.searchsorted(newlines, np.flatnonzero(starts)), minlength=len(newlines) + 1)
+
+
+_separator_table = np.zeros(256, dtype=bool)  # True for the bytes that separate values
+_separator_table[np.frombuffer(b', \t\r\n\v\f', dtype=np.uint8)] = True
+
+
+def split_series(data, column):
+    """ Split rows into groups with the same value in one column
+
+    :param data: an n by m array
+    :param column: index of the column holding the series ID
+    :return: a list of (series ID, rows) tuples, sorted by ID. Rows keep their original order
+             within each series and do not include the ID column.
+    """
+    order = np.argsort(data[:, column], kind='stable')
+    ordered = data[order]
+    (ids, starts) = np.unique(ordered[:, column], return_index=True)
+    ordered = np.delete(ordered, column, axis=1)
+    return list(zip(ids, np.split(ordered, starts[1:])))
@@ -19,6 +19,7 @@ import numpy as np
 from PyQt5 import QtGui
 import lasagna_helperFunctions as lasHelp # Module the provides a variety of import functions (e.g. preference file handling)
 from tree import importData
+from points_io import lines_from_series
 
 
 class loaderClass(lasagna_plugin):
@@ -46,24 +47,11 @@ class loaderClass(lasagna_plugin):
         self.loadAction.triggered.connect(self.showLoadDialog) #Link the action to the slot
 
 
-    def dataFromPath(self,tree,path):
+    def dataFromPositions(self,tree,positions):
         """
-        Get the data from the tree given a path.
+        Get the (z,x,y) data of the nodes at positions in the tree as an n by 3 array
         """
-
-        z=[]
-        x=[]
-        y=[]
-
-        for thisNode in path:
-            if thisNode==0:
-                continue
-            z.append(tree.nodes[thisNode].data['z'])
-            x.append(tree.nodes[thisNode].data['x'])
-            y.append(tree.nodes[thisNode].data['y'])
-
-
-        return (z,x,y)
+        return np.column_stack([tree.columns[thisColumn][positions] for thisColumn in ('z','x','y')]).astype(float)
 
 
     #Slots follow
@@ -84,63 +72,36 @@ class loaderClass(lasagna_plugin):
             return
 
         if os.path.isfile(fname): 
-            with open(str(fname),'r') as fid:
-
-                #import the tree 
-                if verbose:
-                    print("tree_reader_plugin.showLoadDialog - importing %s" % fname)
-
-                dataTree = importData(fname,headerLine=['id','parent','z','x','y'],verbose=verbose)
-                if not dataTree:
-                    print("No data loaded from %s" % fname)
-                    return
-
-                #We now have an array of unique paths (segments)
-                paths=[]
-                for thisSegment in dataTree.findSegments():
-                    paths.append(thisSegment)
-
+            #import the tree 
+            if verbose:
+                print("tree_reader_plugin.showLoadDialog - importing %s" % fname)
 
-                ii=0
-                asList=[] #list of list data (one item per node)
-                for thisPath in paths:
-                    data = self.dataFromPath(dataTree,thisPath)
-                    for jj in range(len(data[0])):
-                        tmp = [ii,data[0][jj],data[1][jj],data[2][jj]]
-                        tmp = [float(x) for x in tmp] #convert to floats
-                        asList.append(tmp)
-                    ii += 1
+            dataTree = importData(fname,headerLine=['id','parent','z','x','y'],verbose=verbose)
+            if not dataTree:
+                print("No data loaded from %s" % fname)
+                return
 
+            #The unique paths (segments) through the tree, as one array of node positions
+            (positions, starts) = dataTree.segmentPositions()
+            isStart = np.zeros(len(positions), dtype=int)
+            isStart[starts[1:]] = 1
+            series = np.cumsum(isStart)
 
+            #Node 0 is the root added by importData. It has no data.
+            keep = positions != dataTree.positionOf(0)
+            points = self.dataFromPositions(dataTree, positions[keep])
 
             # add nans between lineseries
-            data=[]
-            lastLineSeries=None
-            n=0
-            for ii in range(len(asList)):
-                if len(asList[ii])==0:
-                    continue
-
-                thisLine = asList[ii]
-                if lastLineSeries is None:
-                    lastLineSeries=thisLine[0]
-
-                if lastLineSeries != thisLine[0]:
-                    n+=1
-                    data.append([np.nan, np.nan, np.nan])
-
-                lastLineSeries=thisLine[0]
-                data.append(thisLine[1:])
-
+            data = lines_from_series(points, series[keep])
 
             if verbose:
-                print("Divided tree into %d segments" % n)
+                print("Divided tree into %d segments" % len(starts))
 
             #print data         
             objName=fname.split(os.path.sep)[-1]
             self.lasagna.addIngredient(objectName=objName, 
                         kind=self.kind,
-                        data=np.asarray(data), 
+                        data=data, 
                         fname=fname,
                         )
 
@@ -1,16 +1,39 @@
 import json
 import os
 import sys
+import hashlib
+import tempfile
+import numpy as np
+import lasagna_helperFunctions as lasHelp
+import statsCache
+import tree
 """
-Dumps ARA JSON as a flattened file that we can feed into our tree reader
+Reads the ARA JSON labels file into a tree, or dumps it as a flattened file that we can feed into our tree reader
+
+importTree converts the JSON to the tree in a single pass, with no flattened text in between, and
+keeps the result in a small binary cache file (one per labels file) in the labelsCache directory of the
+lasagna preferences directory. The cache entry is ignored if the JSON file has changed since it was written.
 """
 
+colNames = ['id','parent','atlas_id','acronym','name','color']
+jsonKeys = ['id','parent_structure_id','atlas_id','acronym','name','color_hex_triplet'] #The JSON key of each column
+
 
 def importData(fname,verbose=False):
     """
     Import from ARA JSON
     """
 
+    obj = readJSON(fname)
+    if obj is None:
+        return
+
+    flattenedTree = tree_flatten(obj['msg'][0])
+    colNames = 'id|parent|atlas_id|acronym|name|color'
+    return (flattenedTree,colNames)
+
+
+def readJSON(fname):
     #Error check
     if os.path.exists(fname)==False:
         print("Can not find file " + fname)
@@ -20,36 +43,138 @@ def importData(fname,verbose=False):
         print("Data should be a JSON file")
         return
 
-    #Build tree
     with open(fname) as f:
-        obj = json.load(f)        
+        return json.load(f)
 
 
-    flattenedTree = tree_flatten(obj['msg'][0])
-    colNames = 'id|parent|atlas_id|acronym|name|color'
-    return (flattenedTree,colNames)
+def tree_flatten(obj):
+    """
+    Return the tree of areas under obj as lines of id|parent|atlas_id|acronym|name|color
+    """
+    columns = flattenColumns(obj)
+    rows = zip(*[columns[name] for name in colNames])
+    return ''.join(["{}|{}|{}|{}|{}|{}\n".format(*row) for row in rows])
 
 
+def flattenColumns(obj):
+    """
+    Walk the tree of areas under obj (depth-first, children in order) and return a dictionary of lists, one
+    per column in colNames. The parent of the root is 0.
+    """
+    columns = dict([(name,[]) for name in colNames])
+    stack = [obj]
+    while len(stack)>0:
+        area = stack.pop()
+        for (name,key) in zip(colNames,jsonKeys):
+            columns[name].append(area[key])
+        stack.extend(reversed(area.get('children',[])))
 
+    columns['parent'] = [0 if parent is None else parent for parent in columns['parent']]
+    return columns
 
-def tree_flatten(obj,flattened=''):
-    if obj['parent_structure_id'] is None:
-        obj['parent_structure_id']=0
 
-    flattened = flattened+"{id}|{parent_id}|{atlas_id}|{acronym}|{name}|{color}\n".format( 
-            id=obj['id'],
-            parent_id=obj['parent_structure_id'],
-            atlas_id=obj['atlas_id'],
-            acronym=obj['acronym'],
-            name=obj['name'],
-            color=obj['color_hex_triplet'])
+def importTree(fname, useCache=True, verbose=False):
+    """
+    Import the ARA JSON labels file fname as a tree.Tree. Node 0 is the root added by tree.importData and
+    the node data are stored in columns atlas_id, acronym, name and color. The values keep their JSON type.
+    If useCache is True the tree is read from the cache when the file has not changed.
+    """
+    columns = loadCache(fname) if useCache else None
+    if columns is None:
+        obj = readJSON(fname)
+        if obj is None:
+            return
+        columns = flattenColumns(obj['msg'][0])
+        if useCache:
+            saveCache(fname, columns)
+    elif verbose:
+        print("Read labels from the cache for %s" % fname)
+
+    labels = tree.Tree()
+    labels.add_node(0)
+    labels.add_nodes(list(columns['id']), list(columns['parent']),
+                     columns=dict([(name,columnArray(columns[name])) for name in colNames[2:]]))
+    return labels
+
+
+def columnArray(values):
+    """
+    Return a list of column values as an array. Integer columns with missing values (None) are object arrays.
+    """
+    if any([value is None for value in values]):
+        return np.array(list(values), dtype=object)
+    return np.array(values)
 
-    for child in obj.get('children',[]):
-        flattened = tree_flatten(child,  flattened=flattened)
 
-    return flattened
+#----------------------------------------------------------------------------
+#The binary cache
+def cacheFileName(fname):
+    path = os.path.join(lasHelp.getLasagna_prefDir(), 'labelsCache')
+    if not os.path.exists(path):
+        os.makedirs(path)
+    absPath = os.path.abspath(fname)
+    return os.path.join(path, hashlib.sha1(absPath.encode('utf-8')).hexdigest() + '.npz')
 
 
+def loadCache(fname):
+    """
+    Return the columns of the cached tree for fname or None if there is no valid cache entry
+    """
+    try:
+        cacheFile = cacheFileName(fname)
+        if not os.path.exists(cacheFile):
+            return None
+        with np.load(cacheFile, allow_pickle=False) as arrays:
+            arrays = dict(arrays)
+    except Exception as e:
+        print("ara_json failed to read the labels cache for %s: %s" % (fname,str(e)))
+        return None
+
+    if (str(arrays['path']), int(arrays['size']), int(arrays['mtime'])) != statsCache.fileSignature(fname):
+        return None
+
+    columns = dict()
+    for name in colNames:
+        values = arrays[name].tolist()
+        if name+'_isNone' in arrays:
+            values = [None if isNone else value for (value,isNone) in zip(values,arrays[name+'_isNone'])]
+        columns[name] = values
+    return columns
+
+
+def saveCache(fname, columns):
+    """
+    Write columns (see flattenColumns) to the cache for fname. Missing values are stored as a mask
+    alongside each column so that the file needs no pickling.
+    """
+    signature = statsCache.fileSignature(fname)
+    if signature is None:
+        return False
+
+    arrays = {'path':np.array(signature[0]), 'size':np.array(signature[1]), 'mtime':np.array(signature[2])}
+    for name in colNames:
+        values = columns[name]
+        isNone = np.array([value is None for value in values], dtype=bool)
+        if isNone.any():
+            arrays[name+'_isNone'] = isNone
+            fill = next((value for value in values if value is not None), 0)
+            values = [fill if value is None else value for value in values]
+        arrays[name] = np.array(values)
+
+    tmpName = None
+    try:
+        cacheFile = cacheFileName(fname)
+        (handle,tmpName) = tempfile.mkstemp(dir=os.path.dirname(cacheFile), suffix='.npz')
+        with os.fdopen(handle,'wb') as stream:
+            np.savez(stream, **arrays)
+        os.replace(tmpName, cacheFile)
+    except Exception as e:
+        print("ara_json failed to write the labels cache for %s: %s" % (fname,str(e)))
+        if tmpName is not None and os.path.exists(tmpName):
+            os.remove(tmpName) #Do not leave a partly written file in the cache directory
+        return False
+
+    return True
 
 
 #----------------------------------------------------------------------------
@@ -58,16 +183,13 @@ if __name__ == '__main__':
         fname = sys.argv[1]
 
 
-    (flattened,colNames) = importData(fname)
+    (flattened,header) = importData(fname)
 
     returnTree=True
 
     #Optionally run flattened structure through tree
     if returnTree:
-        import tree
-        tree.importData(flattened.split('\n'),colSep='|',displayTree=True,headerLine=colNames)
+        tree.importData(flattened.split('\n'),colSep='|',displayTree=True,headerLine=header)
 
     else:
         print(flattened)
-
-
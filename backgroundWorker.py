@@ -0,0 +1,96 @@
+"""
+Run slow computations away from the GUI thread.
+
+Two thread pools are kept:
+1. A small pool for whole tasks (e.g. building a slab projection or a histogram).
+   The result of each task is handed back to a callback that runs on the GUI thread,
+   so the callback may safely touch Qt objects.
+2. A compute pool, sized to the number of CPUs, that tasks use to split their work
+   into chunks or tiles (see parallelMap). Jobs submitted to the compute pool must not
+   themselves submit to the compute pool.
+
+NumPy releases the GIL for most array operations so the compute pool does give
+real parallelism for chunked array work.
+"""
+
+import os
+from concurrent.futures import ThreadPoolExecutor
+from PyQt5 import QtCore
+
+
+_taskPool = None
+_computePool = None
+_relay = None
+
+
+def numWorkers():
+    """
+    Number of threads used by the compute pool
+    """
+    return max(1, os.cpu_count() or 1)
+
+
+def taskPool():
+    global _taskPool
+    if _taskPool is None:
+        _taskPool = ThreadPoolExecutor(max_workers=2)
+    return _taskPool
+
+
+def computePool():
+    global _computePool
+    if _computePool is None:
+        _computePool = ThreadPoolExecutor(max_workers=numWorkers())
+    return _computePool
+
+
+class _resultRelay(QtCore.QObject):
+    """
+    Lives in the GUI thread. Signals emitted from worker threads are queued by Qt
+    and delivered here, on the GUI thread.
+    """
+    finished = QtCore.pyqtSignal(object, object) #callback, result
+
+    def __init__(self):
+        super(_resultRelay,self).__init__()
+        self.finished.connect(self.deliver)
+
+    def deliver(self, callback, result):
+        callback(result)
+
+
+def runInBackground(func, *args, onFinished=None):
+    """
+    Run func(*args) in the task pool. If onFinished is supplied it is called
+    with the return value of func on the GUI thread once func completes.
+    Must be called from the GUI thread. Returns a concurrent.futures.Future
+    """
+    global _relay
+    if _relay is None:
+        _relay = _resultRelay()
+
+    future = taskPool().submit(func, *args)
+
+    if onFinished is not None:
+        relay = _relay
+        def emitResult(f):
+            if f.cancelled():
+                return
+            if f.exception() is not None:
+                print("backgroundWorker task %s failed: %s" % (str(func), str(f.exception())))
+                return
+            relay.finished.emit(onFinished, f.result())
+        future.add_done_callback(emitResult)
+
+    return future
+
+
+def parallelMap(func, items):
+    """
+    Apply func to each element of items using the compute pool.
+    Returns a list of results in the same order as items.
+    """
+    items = list(items)
+    if len(items) < 2:
+        return [func(thisItem) for thisItem in items]
+    return list(computePool().map(func, items))
@@ -1,4 +1,6 @@
 import re
+import warnings
+import numpy as np
 
 """
 Module to infer data type from string or convert a string to a data type. 
@@ -39,6 +41,43 @@ def convertString(string):
 
 
 
+
+def convertColumn(strings, sampleSize=100):
+	"""
+	converts a list of strings, all from one column of a table, to a numpy array. The type is inferred
+	once for the whole column, starting from a sample of its strings:
+	numbers - the whole column is parsed by numpy as int (if no value has a decimal point or exponent) or float
+	text - the column is kept as an object array of str if none of its strings is a number
+	a mixture - each string is converted by convertString, as before, into an object array
+	A column that looks numeric (or text) from its sample but is not is also converted by convertString.
+	"""
+	sample = [isNumber(string) for string in strings[:sampleSize]]
+
+	if all(sample):
+		joined = ' '.join(strings)
+		with warnings.catch_warnings():
+			warnings.simplefilter('ignore') #np.fromstring warns when it meets a string that is not a number
+			values = np.fromstring(joined, dtype=np.float64, sep=' ')
+		if len(values) == len(strings): #every string was one number
+			if re.search('[.eEnN]', joined) is None:
+				return values.astype(np.int64)
+			return values
+
+	elif not any(sample) and not any([isNumber(string) for string in strings[sampleSize:]]):
+		return np.array(strings, dtype=object)
+
+	return np.array([convertString(string) for string in strings], dtype=object)
+
+
+def isNumber(string):
+	try:
+		float(string)
+		return True
+	except ValueError:
+		return False
+
+
+
 if __name__ == '__main__':
 	#testing code
 	if dataTypeFromString('32423') != int:
@@ -66,6 +105,19 @@ if __name__ == '__main__':
 		print('failed str test 4')
 
 
+	if convertColumn(['1','-2','30']).dtype != np.int64:
+		print('failed int column test')
+
+	if convertColumn(['1','-2.5','3e2']).dtype != np.float64:
+		print('failed float column test')
+
+	if convertColumn(['1','FFFFFF']).dtype != object:
+		print('failed str column test')
+
+	if convertColumn(['AB%d' % ii for ii in range(149)] + ['000123'])[-1] != 123:
+		print('failed mixed column test')
+
+
 	#try some conversions
 	conversions = ['123','1','1.1','1.2.2','hello']
 	for c in conversions:
@@ -1 +1 @@
-from . import coreFunctions
\ No newline at end of file
+from . import coreFunctions, slabProjection, obliqueSlice, histogram, display, sliceIndex, pointIndex, lineSimplification
@@ -0,0 +1,99 @@
+"""
+Functions that turn image data into the colours that are displayed.
+
+Image stacks are displayed as integers (see quantise) that index a look-up table (see levelsLUT)
+combining the display range with a colour map. These functions do not need a window, so are used
+both by ingredients.imagestack and by the headless renderer in snapshot.py
+"""
+
+import numpy as np
+import pyqtgraph as pg
+
+
+def colorName2value(colorName,nVal=255,alpha=255):
+    """
+    Converts a colour map name to an RGBa vector
+    colorName is a color name, output is an RGBalpha vector.
+    nVal is the maximum intensity value
+    """
+    colorName = colorName.lower()
+
+    colorDict = {
+                'gray'      :   [nVal,nVal,nVal,alpha],
+                'red'       :   [nVal, 0  , 0  ,alpha],
+                'green'     :   [ 0  ,nVal, 0  ,alpha],
+                'blue'      :   [ 0  , 0  ,nVal,alpha],
+                'magenta'   :   [nVal, 0  ,nVal,alpha],
+                'cyan'      :   [ 0  ,nVal,nVal,alpha],
+                'yellow'    :   [nVal,nVal, 0  ,alpha]
+                }
+
+    if colorName in colorDict:
+        return colorDict[colorName]
+    else:
+        print(("no pre-defined colormap %s. reverting to gray " % colorName))
+        return colorDict['gray']
+
+
+def colorMapLUT(colorName,nVal=255,alpha=255):
+    """
+    Return a look-up table with nVal+1 rows that ramps from black to the colour colorName.
+    The table has an alpha column only if alpha is less than nVal.
+    """
+    pos = np.array([0.0, 1.0])
+    finalColor = colorName2value(colorName,nVal=nVal,alpha=alpha)
+    color = np.array([[ 0 , 0 , 0 ,nVal], finalColor], dtype=np.ubyte)
+    return pg.ColorMap(pos, color).getLookupTable(0.0, 1.0, nVal+1)
+
+
+def displayQuantisation(data):
+    """
+    Return (offset,scale,nLevels), which define the integers used to display data:
+    displayValue = (dataValue-offset)*scale and 0 <= displayValue < nLevels
+    uint8 and uint16 data are displayed as they are. Other integer data are offset by their
+    minimum and, like float data, are scaled to uint16 if their range is too large.
+    """
+    if data.dtype in (np.uint8, np.uint16):
+        return (0, 1, 2**(8*data.dtype.itemsize))
+
+    dataMin = float(np.nanmin(data))
+    dataMax = float(np.nanmax(data))
+    dataRange = dataMax-dataMin
+    if data.dtype.kind in 'iub' and dataRange <= 65535:
+        scale = 1.0
+    elif dataRange > 0:
+        scale = 65535.0/dataRange
+    else:
+        scale = 1.0
+    return (dataMin, scale, 65536)
+
+
+def quantise(plane,quantisation):
+    """
+    Convert a plane to the integers that index the display look-up table (see levelsLUT)
+    quantisation is the output of displayQuantisation
+    """
+    (offset,scale,nLevels) = quantisation
+    displayType = np.uint8 if nLevels == 256 else np.uint16
+
+    if plane.dtype == displayType and offset == 0 and scale == 1:
+        return plane
+
+    plane = (plane-offset)*scale if (offset != 0 or scale != 1) else plane
+    if plane.dtype.kind == 'f':
+        plane = np.rint(np.nan_to_num(plane))
+    return np.clip(plane, 0, nLevels-1).astype(displayType)
+
+
+def levelsLUT(colors,minMax,quantisation):
+    """
+    Return an (nLevels,N) look-up table that maps display values (see quantise) through the
+    display range minMax and then through the colour map colors (e.g. from colorMapLUT)
+    """
+    (offset,scale,nLevels) = quantisation
+    dataValues = np.arange(nLevels)/scale + offset
+
+    (minLevel,maxLevel) = minMax
+    levelRange = maxLevel-minLevel if maxLevel != minLevel else 1
+    colorIndex = np.clip((dataValues-minLevel) * (len(colors)/float(levelRange)), 0, len(colors)-1)
+    return colors[colorIndex.astype(np.intp)]
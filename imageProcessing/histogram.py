@@ -0,0 +1,248 @@
+"""
+Intensity statistics of image volumes computed in a single, chunked pass.
+
+volumeStats makes one pass through a volume and returns the display histogram, the
+minimum and maximum, the default display range (see imagestack.defaultHistRange) and
+a set of percentiles. The volume is split into chunks of slices that are processed in
+parallel on the compute pool (see backgroundWorker).
+
+* Integer data are counted exactly with np.bincount, which is much faster than np.histogram.
+* Float data are binned finely (fineBins) between their minimum and maximum. Coarser
+  histograms and percentiles are then derived from these counts.
+* Memory-mapped or otherwise lazily-loaded volumes larger than maxSampleBytes are
+  sampled: only evenly spaced slices are read. The results are then approximate.
+"""
+
+import numpy as np
+import backgroundWorker
+from . import coreFunctions
+
+
+displayBins = 500 #Number of bins in the histogram shown next to the image views
+rangeBins = 100 #Number of bins used to choose the default display range
+fineBins = 4000 #Float data are binned this finely. Must be a multiple of displayBins and rangeBins.
+defaultPercentiles = (0.1, 1, 50, 99, 99.9)
+maxSampleBytes = 256*1024**2
+
+
+def isLazy(volume):
+    """
+    True if reading volume will go to disk rather than memory
+    """
+    return isinstance(volume, np.memmap) or not isinstance(volume, np.ndarray)
+
+
+def chunksOf(volume, maxBytes=maxSampleBytes):
+    """
+    Return a list of index objects (slices or arrays of slice indices) along the first
+    dimension of volume, one per chunk to process. Large lazy volumes are sampled.
+    Returns (chunks, sampled)
+    """
+    nSlices = volume.shape[0]
+    nChunks = min(nSlices, backgroundWorker.numWorkers()*4)
+    sliceBytes = volume.nbytes // max(1,nSlices)
+
+    if isLazy(volume) and volume.nbytes > maxBytes:
+        nToRead = max(1, int(maxBytes // max(1,sliceBytes)))
+        indices = np.unique(np.linspace(0, nSlices-1, nToRead).astype(np.intp))
+        chunks = [thisChunk for thisChunk in np.array_split(indices, min(nChunks,len(indices))) if len(thisChunk)>0]
+        return (chunks, True)
+
+    edges = np.linspace(0, nSlices, nChunks+1).astype(np.intp)
+    chunks = [slice(edges[ii],edges[ii+1]) for ii in range(nChunks) if edges[ii+1]>edges[ii]]
+    return (chunks, False)
+
+
+def _finite(chunk):
+    chunk = np.asarray(chunk)
+    if chunk.dtype.kind == 'f':
+        return chunk[np.isfinite(chunk)]
+    return chunk.ravel()
+
+
+def valueCounts(volume, chunks):
+    """
+    Count the values in volume. Returns (firstValue, binWidth, counts) where counts[i] is the number of
+    voxels with values from firstValue+i*binWidth up to firstValue+(i+1)*binWidth. Integer data have
+    binWidth 1 so the counts are exact. Returns (0,1,[0]) if there are no finite values.
+    """
+    dtype = volume.dtype
+
+    #Small unsigned integers can be counted without first finding the range
+    if dtype in (np.uint8, np.uint16, np.bool_):
+        minLength = 2 if dtype == np.bool_ else 2**(8*dtype.itemsize)
+        counts = np.sum(backgroundWorker.parallelMap(
+                        lambda ind: np.bincount(np.asarray(volume[ind]).ravel(), minlength=minLength), chunks), axis=0)
+        return trimCounts(0, 1, counts)
+
+    #Everything else needs the range first
+    def chunkLimits(ind):
+        chunk = _finite(volume[ind])
+        if chunk.size == 0:
+            return (np.inf,-np.inf)
+        return (chunk.min(),chunk.max())
+
+    limits = backgroundWorker.parallelMap(chunkLimits, chunks)
+    dataMin = min([thisLimit[0] for thisLimit in limits])
+    dataMax = max([thisLimit[1] for thisLimit in limits])
+    if dataMin > dataMax:
+        return (0, 1, np.zeros(1,dtype=np.int64))
+
+    if dtype.kind in 'iu' and int(dataMax)-int(dataMin) < 2**24:
+        offset = int(dataMin)
+        counts = np.sum(backgroundWorker.parallelMap(
+                        lambda ind: np.bincount((np.asarray(volume[ind]).ravel().astype(np.int64)-offset),
+                                                minlength=int(dataMax)-offset+1), chunks), axis=0)
+        return trimCounts(offset, 1, counts)
+
+    dataMin = float(dataMin)
+    dataMax = float(dataMax)
+    if dataMax == dataMin:
+        nVoxels = sum(backgroundWorker.parallelMap(lambda ind: _finite(volume[ind]).size, chunks))
+        return (dataMin, 1, np.array([nVoxels],dtype=np.int64)) #a single exact value
+
+    counts = np.sum(backgroundWorker.parallelMap(
+                    lambda ind: np.histogram(_finite(volume[ind]), bins=fineBins, range=(dataMin,dataMax))[0], chunks), axis=0)
+    return (dataMin, (dataMax-dataMin)/fineBins, counts)
+
+
+def trimCounts(firstValue, binWidth, counts):
+    """
+    Remove empty bins from either end of counts
+    """
+    nonZero = np.flatnonzero(counts)
+    if len(nonZero) == 0:
+        return (firstValue, binWidth, counts[:1])
+    return (firstValue+nonZero[0]*binWidth, binWidth, counts[nonZero[0]:nonZero[-1]+1])
+
+
+def isExact(binWidth):
+    """
+    Integer counts (see valueCounts) have an integer bin width of 1. Float data have a float bin width.
+    """
+    return isinstance(binWidth, (int,np.integer))
+
+
+def dataMaximum(firstValue, binWidth, counts):
+    if isExact(binWidth):
+        return firstValue + len(counts)-1
+    return firstValue + len(counts)*binWidth #The last fine bin ends at the data maximum
+
+
+def countsToHistogram(firstValue, binWidth, counts, nBins):
+    """
+    Combine counts into nBins equal bins spanning the data, as np.histogram(data,bins=nBins) would.
+    Returns (y,edges) where edges has length nBins+1
+    """
+    dataMin = firstValue
+    dataMax = dataMaximum(firstValue, binWidth, counts)
+
+    if dataMax == dataMin:
+        edges = np.linspace(dataMin-0.5, dataMax+0.5, nBins+1)
+    else:
+        edges = np.linspace(dataMin, dataMax, nBins+1)
+
+    #Assign each value (or fine bin centre) to a bin
+    if isExact(binWidth):
+        values = dataMin + np.arange(len(counts))
+    else:
+        values = dataMin + (np.arange(len(counts))+0.5)*binWidth
+    ind = np.floor((values-edges[0]) / (edges[-1]-edges[0]) * nBins).astype(np.intp)
+    ind = np.clip(ind, 0, nBins-1)
+
+    y = np.bincount(ind, weights=counts, minlength=nBins).astype(np.int64)
+    return (y,edges)
+
+
+def percentilesFromCounts(firstValue, binWidth, counts, percentiles):
+    """
+    Return a dictionary of percentile:value. For binned float data the values are accurate to one fine bin.
+    """
+    cumulative = np.cumsum(counts)
+    if cumulative[-1] == 0:
+        return dict([(p,firstValue) for p in percentiles])
+    ind = np.searchsorted(cumulative, np.asarray(percentiles)/100.0*cumulative[-1], side='left')
+    ind = np.clip(ind, 0, len(counts)-1)
+    return dict([(p,firstValue+ii*binWidth) for (p,ii) in zip(percentiles,ind)])
+
+
+def autoRangeFromCounts(firstValue, binWidth, counts, logY=False):
+    """
+    The default maximum display value. See imagestack.defaultHistRange.
+    """
+    (y,x) = countsToHistogram(firstValue, binWidth, counts, rangeBins)
+    y = np.append(y,0)
+
+    #Remove negative numbers from the calculation. Sometimes these happen with registered images
+    y = y[x>0]
+    x = x[x>0]
+    if len(x) == 0 or np.sum(x*y) == 0:
+        return x[-1] if len(x) else dataMaximum(firstValue, binWidth, counts)
+
+    if logY==True:
+        y=np.log10(y+0.1)
+
+    return coreFunctions.defaultHistRange(y,x)
+
+
+def sliceSummaries(volume, chunks):
+    """
+    Return a dictionary with the 'index', 'min', 'max' and 'mean' of each slice (along the
+    first dimension) that is included in chunks
+    """
+    def summariseChunk(ind):
+        chunk = np.asarray(volume[ind])
+        chunk = chunk.reshape(chunk.shape[0],-1)
+        if chunk.dtype.kind == 'f':
+            return (np.nanmin(chunk,axis=1), np.nanmax(chunk,axis=1), np.nanmean(chunk,axis=1))
+        return (chunk.min(axis=1), chunk.max(axis=1), chunk.mean(axis=1))
+
+    summaries = backgroundWorker.parallelMap(summariseChunk, chunks)
+    index = np.concatenate([np.arange(volume.shape[0])[ind] for ind in chunks])
+    return {
+            'index' : index,
+            'min' : np.concatenate([thisSummary[0] for thisSummary in summaries]),
+            'max' : np.concatenate([thisSummary[1] for thisSummary in summaries]),
+            'mean' : np.concatenate([thisSummary[2] for thisSummary in summaries]),
+            }
+
+
+def volumeStats(volume, percentiles=defaultPercentiles, maxBytes=maxSampleBytes):
+    """
+    Compute intensity statistics of volume in a single pass. Safe to run in a worker thread.
+
+    Returns a dictionary with keys:
+    'histogram' - {'x','y'}: the display histogram. x holds the left edge of each bin.
+    'min', 'max' - the data range
+    'autoRange' - the default maximum display value
+    'percentiles' - dictionary of percentile:value
+    'dtype' - the data type as a string
+    'sampled' - True if only some slices were read, in which case the statistics are approximate
+    'counts' - (firstValue,binWidth,counts) from valueCounts, from which other histograms can be made
+    'slices' - the min, max and mean of each slice that was read (see sliceSummaries)
+    """
+    (chunks,sampled) = chunksOf(volume, maxBytes)
+    (firstValue,binWidth,counts) = valueCounts(volume, chunks)
+
+    (y,x) = countsToHistogram(firstValue, binWidth, counts, displayBins)
+
+    return {
+            'histogram' : {'x':x[0:-1], 'y':y}, #chop off last edge
+            'min' : firstValue,
+            'max' : dataMaximum(firstValue, binWidth, counts),
+            'autoRange' : autoRangeFromCounts(firstValue, binWidth, counts),
+            'percentiles' : percentilesFromCounts(firstValue, binWidth, counts, percentiles),
+            'dtype' : str(volume.dtype),
+            'sampled' : sampled,
+            'counts' : (firstValue,binWidth,counts),
+            'slices' : sliceSummaries(volume, chunks),
+            }
+
+
+def quickStats(volume):
+    """
+    Approximate statistics from the middle slice of a volume. This is fast enough to run
+    on the GUI thread and provides provisional values whilst volumeStats runs.
+    """
+    middle = np.asarray(volume[volume.shape[0]//2])[None]
+    return volumeStats(middle, maxBytes=np.inf)
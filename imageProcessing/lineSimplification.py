@@ -0,0 +1,116 @@
+"""
+Simplify dense lines (e.g. whole-brain axon tracings) so that a zoomed-out view does not draw
+millions of vertices that fall within the same screen pixel.
+
+Douglas-Peucker simplification keeps a vertex if it lies further than a tolerance from the
+line joining the vertices kept either side of it. Running it once and recording, for each vertex,
+the tolerance at which it would be dropped gives every level of simplification at once: the level for
+tolerance t is simply the vertices whose tolerance is greater than t. See vertexTolerance.
+
+Lines are n by 3 arrays of (z,x,y) vertices with a row of NaNs between separate lines, as used by
+the lines ingredient.
+"""
+
+import numpy as np
+from .sliceIndex import segmentIndex
+
+
+def vertexTolerance(data, minTolerance=0):
+    """
+    Return the Douglas-Peucker tolerance of each vertex in data (n by 3): the vertex is kept by a
+    simplification with any smaller tolerance. The ends of each line and the rows of NaNs that separate
+    lines are always kept (they have an infinite tolerance).
+    Ranges are not split once their tolerance is at most minTolerance. Their vertices get a tolerance of 0.
+
+    All lines are split together, one level of the recursion at a time, so the work is done by numpy.
+    """
+    data = np.asarray(data, dtype=np.float64)
+    tolerance = np.full(len(data), np.inf)
+    if len(data) < 3:
+        return tolerance
+
+    finite = np.all(np.isfinite(data),axis=1)
+    tolerance[finite] = 0
+    edges = np.diff(np.concatenate(([0],finite.astype(np.int8),[0])))
+    first = np.flatnonzero(edges==1)
+    last = np.flatnonzero(edges==-1)-1
+    tolerance[first] = np.inf
+    tolerance[last] = np.inf
+
+    #Each range is simplified between vertices lo and hi. A vertex can not outlast the vertex that
+    #split its range, so each range also carries the tolerance of that vertex (cap)
+    (lo,hi) = (first[last-first>1], last[last-first>1])
+    cap = np.full(len(lo), np.inf)
+    while len(lo)>0:
+        nInside = hi-lo-1
+        offsets = np.cumsum(nInside)-nInside
+        rangeOf = np.repeat(np.arange(len(lo)), nInside)
+        inside = np.arange(nInside.sum()) - offsets[rangeOf] + lo[rangeOf] + 1
+
+        #Distance of each vertex from the segment joining the ends of its range
+        a = data[lo][rangeOf]
+        ab = data[hi][rangeOf] - a
+        ap = data[inside] - a
+        lengthSquared = np.sum(ab**2,axis=1)
+        t = np.clip(np.sum(ap*ab,axis=1)/np.where(lengthSquared>0,lengthSquared,1), 0, 1)
+        distance = np.sqrt(np.sum((ap - t[:,None]*ab)**2, axis=1))
+
+        #The furthest vertex (the first if there is a tie) splits each range
+        furthest = np.maximum.reduceat(distance, offsets)
+        split = np.minimum.reduceat(np.where(distance==furthest[rangeOf], inside, len(data)), offsets)
+        cap = np.minimum(furthest, cap)
+        tolerance[split] = cap
+
+        lo = np.concatenate((lo,split))
+        hi = np.concatenate((split,hi))
+        cap = np.concatenate((cap,cap))
+        keep = (hi-lo>1) & (cap>minTolerance)
+        (lo,hi,cap) = (lo[keep],hi[keep],cap[keep])
+
+    return tolerance
+
+
+class lineLevels(object):
+    """
+    Multi-level simplification of lines data (n by 3). Each level is the lines simplified with a
+    tolerance, in voxels, that doubles from one level to the next. A segmentIndex is built for each level
+    the first time it is drawn.
+    """
+
+    tolerances = 2.0**np.arange(-1,8) #0.5 to 128 voxels
+
+    def __init__(self, data):
+        self.data = data
+        self._shape = data.shape
+        self.vertexTolerance = vertexTolerance(data, minTolerance=self.tolerances[0])
+        self._levels = {} #level: segmentIndex of the simplified lines
+
+
+    def isFor(self, data):
+        """
+        True if these levels were built for data. Data that have been replaced need new levels.
+        """
+        return data is self.data and data.shape == self._shape
+
+
+    def levelForPixelSize(self, pixelSize):
+        """
+        Return the coarsest level whose error is at most half a screen pixel, where a screen pixel is
+        pixelSize voxels across. Returns None if the lines should be drawn in full.
+        """
+        if pixelSize is None:
+            return None
+        levels = np.flatnonzero(self.tolerances <= pixelSize/2.0)
+        if len(levels)==0:
+            return None
+        return int(levels[-1])
+
+
+    def index(self, level):
+        """
+        Return the segmentIndex of the lines simplified at level (see tolerances)
+        """
+        if level not in self._levels:
+            simplified = self.data[self.vertexTolerance > self.tolerances[level]]
+            self._levels[level] = segmentIndex(simplified)
+        return self._levels[level]
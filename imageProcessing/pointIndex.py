@@ -0,0 +1,71 @@
+"""
+Find the points nearest to a position, for example to identify the cell under the mouse.
+
+Points are an n by 3 array of (z,x,y) positions. pointIndex builds a KD-tree (scipy.spatial.cKDTree)
+over the points once, so finding the points within a small radius of a position is a tree search
+rather than a pass through all points. This stays well under a millisecond with tens of millions of points.
+"""
+
+import numpy as np
+
+
+class pointIndex(object):
+    """
+    A KD-tree over the points of an n by 3 array. Points with a non-finite position are never returned.
+    The tree is built the first time it is queried.
+    """
+
+    def __init__(self, data):
+        self.data = data
+        self._shape = np.shape(data)
+        self._rows = None #rows of data in the tree
+        self._tree = None
+
+
+    def isFor(self, data):
+        """
+        True if this index was built for data. Data that have been replaced need a new index.
+        """
+        return data is self.data and np.shape(data) == self._shape
+
+
+    def tree(self):
+        if self._tree is None:
+            from scipy.spatial import cKDTree #imported here as scipy is slow to import and only needed for this
+            data = np.asarray(self.data, dtype=np.float64).reshape(-1,3)
+            self._rows = np.flatnonzero(np.all(np.isfinite(data),axis=1))
+            self._tree = cKDTree(data[self._rows])
+        return self._tree
+
+
+    def query(self, position, axisToPlot, radius, zRange=0):
+        """
+        Return (rows,distances) for the points whose 2D position in the view along axisToPlot is within
+        radius of position (z,x,y) and whose rounded position along axisToPlot is within zRange of the
+        slice that position is on. distances are in the plane of the view. Points are sorted nearest first.
+        """
+        tree = self.tree()
+        if tree.n == 0:
+            return (np.zeros(0,dtype=int), np.zeros(0))
+
+        position = np.asarray(position, dtype=np.float64)
+        searchRadius = np.hypot(radius, zRange+1) #rounding to slices can add up to one slice to the distance along the axis
+        candidates = np.asarray(tree.query_ball_point(position, searchRadius), dtype=int)
+        points = tree.data[candidates]
+
+        inPlane = np.delete(points-position, axisToPlot, 1)
+        distances = np.sqrt(np.sum(inPlane**2, axis=1))
+        keep = (distances <= radius) & (np.abs(np.round(points[:,axisToPlot]) - np.round(position[axisToPlot])) <= zRange)
+
+        order = np.argsort(distances[keep], kind='stable')
+        return (self._rows[candidates[keep][order]], distances[keep][order])
+
+
+    def nearest(self, position, axisToPlot, radius, zRange=0):
+        """
+        Return (row,distance) of the point nearest to position (see query) or (None,None) if there is none
+        """
+        (rows,distances) = self.query(position, axisToPlot, radius, zRange)
+        if len(rows) == 0:
+            return (None,None)
+        return (rows[0],distances[0])
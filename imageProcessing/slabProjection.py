@@ -0,0 +1,141 @@
+"""
+Thick-slab projections of an image volume.
+
+A slab projection reduces the slices sliceToPlot-halfWidth to sliceToPlot+halfWidth
+of a volume into a single plane using the maximum, mean or minimum. The slabProjector
+class makes it cheap to slide the slab through the volume:
+
+* max and min use block-wise reductions along the slicing axis that are computed once
+  (buildBlocks). A slab is then made from the whole blocks it covers plus the few loose
+  slices at either end, so about 3*sqrt(2*halfWidth+1) planes are touched per slab
+  rather than 2*halfWidth+1.
+* mean keeps a running sum of the current slab. Moving the slab adds the slices that
+  enter it and subtracts the slices that leave it.
+"""
+
+import numpy as np
+
+
+validSlabModes = ('max', 'mean', 'min')
+
+
+class slabProjector(object):
+    def __init__(self, volume, mode='max', halfWidth=5):
+        """
+        volume - the image volume. Slabs are taken along its first dimension.
+        mode - one of 'max', 'mean' or 'min'
+        halfWidth - number of slices either side of the current one that belong to the slab
+        """
+        if mode not in validSlabModes:
+            raise ValueError("slabProjector mode must be one of %s" % str(validSlabModes))
+
+        self.volume = volume
+        self.mode = mode
+        self.halfWidth = int(halfWidth)
+        self.blockSize = max(1, int(round(np.sqrt(2*self.halfWidth+1))))
+
+        self._blocks = None #block-wise reductions along axis 0. Built by buildBlocks()
+
+        #Running sum for the mean slab. The sum covers slices _sumRange[0] to _sumRange[1]-1
+        self._runningSum = None
+        self._sumRange = (0,0)
+
+
+    def needsBlocks(self):
+        """
+        True if this projector can only run quickly once buildBlocks has been called
+        """
+        return self.mode != 'mean' and self._blocks is None
+
+
+    def reduce(self, planes):
+        """
+        Reduce a stack of planes along the first dimension using the projector's mode
+        """
+        if self.mode == 'max':
+            return planes.max(axis=0)
+        elif self.mode == 'min':
+            return planes.min(axis=0)
+
+
+    def buildBlocks(self):
+        """
+        Compute the reduction of each consecutive block of self.blockSize slices.
+        This is the slow step for max and min projections and is safe to run in
+        a worker thread. Returns the projector so it can be used as a task result.
+        """
+        if self.mode == 'mean':
+            return self
+
+        nSlices = self.volume.shape[0]
+        nBlocks = int(np.ceil(nSlices / self.blockSize))
+        blocks = np.empty((nBlocks,) + self.volume.shape[1:], dtype=self.volume.dtype)
+        for ii in range(nBlocks):
+            blocks[ii] = self.reduce(self.volume[ii*self.blockSize : (ii+1)*self.blockSize])
+
+        self._blocks = blocks
+        return self
+
+
+    def slabLimits(self, sliceToPlot):
+        """
+        Return the first slice and one past the last slice of the slab centred on sliceToPlot
+        """
+        nSlices = self.volume.shape[0]
+        fromSlice = min(max(0, sliceToPlot-self.halfWidth), nSlices-1)
+        toSlice = max(min(nSlices, sliceToPlot+self.halfWidth+1), fromSlice+1)
+        return (fromSlice,toSlice)
+
+
+    def project(self, sliceToPlot):
+        """
+        Return the slab projection centred on slice sliceToPlot
+        """
+        (fromSlice,toSlice) = self.slabLimits(sliceToPlot)
+
+        if self.mode == 'mean':
+            return self._meanProjection(fromSlice,toSlice)
+
+        if self._blocks is None: #Slow path used until the blocks are available
+            return self.reduce(self.volume[fromSlice:toSlice])
+
+        #Whole blocks inside the slab
+        firstBlock = int(np.ceil(fromSlice / self.blockSize))
+        lastBlock = toSlice // self.blockSize #one past the last whole block
+        if firstBlock >= lastBlock:
+            return self.reduce(self.volume[fromSlice:toSlice])
+
+        parts = [self.reduce(self._blocks[firstBlock:lastBlock])]
+
+        #Loose slices either side of the whole blocks
+        if fromSlice < firstBlock*self.blockSize:
+            parts.append(self.reduce(self.volume[fromSlice:firstBlock*self.blockSize]))
+        if lastBlock*self.blockSize < toSlice:
+            parts.append(self.reduce(self.volume[lastBlock*self.blockSize:toSlice]))
+
+        return self.reduce(np.stack(parts))
+
+
+    def _meanProjection(self, fromSlice, toSlice):
+        """
+        Update the running sum so it covers fromSlice:toSlice and return the mean
+        """
+        (oldFrom,oldTo) = self._sumRange
+        nChanged = abs(fromSlice-oldFrom) + abs(toSlice-oldTo)
+
+        #Recompute from scratch if there is no overlap or if updating would be more work
+        if self._runningSum is None or fromSlice >= oldTo or toSlice <= oldFrom or nChanged >= toSlice-fromSlice:
+            self._runningSum = self.volume[fromSlice:toSlice].sum(axis=0, dtype=np.float64)
+        else:
+            if fromSlice < oldFrom:
+                self._runningSum += self.volume[fromSlice:oldFrom].sum(axis=0, dtype=np.float64)
+            elif fromSlice > oldFrom:
+                self._runningSum -= self.volume[oldFrom:fromSlice].sum(axis=0, dtype=np.float64)
+
+            if toSlice > oldTo:
+                self._runningSum += self.volume[oldTo:toSlice].sum(axis=0, dtype=np.float64)
+            elif toSlice < oldTo:
+                self._runningSum -= self.volume[toSlice:oldTo].sum(axis=0, dtype=np.float64)
+
+        self._sumRange = (fromSlice,toSlice)
+        return (self._runningSum / (toSlice-fromSlice)).astype(np.float32)
@@ -0,0 +1,170 @@
+"""
+Fast look-up of the points that lie within a range of slices.
+
+Points and lines are n by 3 arrays of (z,x,y) positions that are plotted in each of the three views.
+On each redraw a view needs only the points within a few slices of the one it shows. sliceIndex
+sorts the points once along each axis, keeping their 2D projection for that axis, so this is a
+binary search (np.searchsorted) rather than a pass through all points. segmentIndex does the same
+for the segments of lines, which are sorted by their extent along each axis.
+"""
+
+import numpy as np
+
+
+def projectToPlane(data, axisToPlot):
+    """
+    Return the 2D positions of points in data (n by 3) as plotted in the view along axisToPlot.
+    See, for example, ingredients.sparsepoints.data
+    """
+    data = np.delete(data,axisToPlot,1)
+    if axisToPlot==2:
+        data = np.fliplr(data)
+    return data
+
+
+class sliceIndex(object):
+    """
+    Index the points of an n by 3 array by their (rounded) position along each axis.
+    Points with a non-finite position (e.g. NaN rows that separate lines) are never returned.
+    The index for an axis is built the first time that axis is queried.
+    """
+
+    def __init__(self, data):
+        self.data = data
+        self._shape = data.shape
+        self._axes = {} #axisToPlot: (rows, z, xy), all sorted by z
+
+
+    def isFor(self, data):
+        """
+        True if this index was built for data. Data that have been replaced need a new index.
+        """
+        return data is self.data and data.shape == self._shape
+
+
+    def axisIndex(self, axisToPlot):
+        if axisToPlot not in self._axes:
+            z = np.round(self.data[:,axisToPlot])
+            rows = np.flatnonzero(np.all(np.isfinite(self.data),axis=1))
+            rows = rows[np.argsort(z[rows], kind='stable')] #stable so rows in a slice stay in their original order
+            self._axes[axisToPlot] = (rows, z[rows], projectToPlane(self.data[rows],axisToPlot))
+        return self._axes[axisToPlot]
+
+
+    def query(self, axisToPlot, fromLayer, toLayer):
+        """
+        Return (rows,z,xy) for the points whose rounded position along axisToPlot is from fromLayer to
+        toLayer inclusive. rows are the row indices into data, z the rounded positions and xy the 2D
+        positions in the view. Points are returned sorted by z.
+        """
+        (rows,z,xy) = self.axisIndex(axisToPlot)
+        first = np.searchsorted(z, fromLayer, side='left')
+        last = np.searchsorted(z, toLayer, side='right')
+        return (rows[first:last], z[first:last], xy[first:last])
+
+
+class segmentIndex(object):
+    """
+    Index the line segments of an n by 3 array of vertices by their extent along each axis.
+    Consecutive finite vertices are joined by a segment. Rows of NaNs separate lines.
+    A segment is found if any part of it lies within the queried slices, even if neither of its
+    vertices does, and it is clipped at the boundaries of those slices.
+    The index for an axis is built the first time that axis is queried.
+    """
+
+    def __init__(self, data):
+        self.data = data
+        self._shape = data.shape
+        self._starts = segmentStarts(data) #segment i joins vertices starts[i] and starts[i]+1
+        self._axes = {} #axisToPlot: (segments sorted by zMin, zMin, zMax, longest extent)
+
+
+    def isFor(self, data):
+        """
+        True if this index was built for data. Data that have been replaced need a new index.
+        """
+        return data is self.data and data.shape == self._shape
+
+
+    def axisIndex(self, axisToPlot):
+        if axisToPlot not in self._axes:
+            z0 = self.data[self._starts,axisToPlot]
+            z1 = self.data[self._starts+1,axisToPlot]
+            zMin = np.minimum(z0,z1)
+            order = np.argsort(zMin, kind='stable')
+            zMax = np.maximum(z0,z1)[order]
+            extent = np.max(zMax-zMin[order]) if len(order)>0 else 0
+            self._axes[axisToPlot] = (order, zMin[order], zMax, extent)
+        return self._axes[axisToPlot]
+
+
+    def segmentsInSlab(self, axisToPlot, zLow, zHigh):
+        """
+        Return the indices of the segments (into self._starts), in their original order, that
+        have some part from zLow to zHigh along axisToPlot
+        """
+        (order,zMin,zMax,extent) = self.axisIndex(axisToPlot)
+        #Only segments that start (at their lowest end) within the longest extent of the slab can reach it
+        first = np.searchsorted(zMin, zLow-extent, side='left')
+        last = np.searchsorted(zMin, zHigh, side='right')
+        candidates = np.arange(first,last)
+        return np.sort(order[candidates[zMax[candidates] >= zLow]])
+
+
+    def query(self, axisToPlot, fromLayer, toLayer):
+        """
+        Return the parts of the segments that lie on layers fromLayer to toLayer along axisToPlot, inclusive, as
+        the 2D positions in the view. Runs of connected segments become one line and lines are separated by a
+        row of NaNs, as expected by PlotCurveItem(connect="finite"). A layer spans +/- 0.5 around its index.
+        """
+        (zLow,zHigh) = (fromLayer-0.5, toLayer+0.5)
+        segments = self.segmentsInSlab(axisToPlot, zLow, zHigh)
+        return clipSegments(self.data, self._starts[segments], axisToPlot, zLow, zHigh)
+
+
+def segmentStarts(data):
+    """
+    Return the index of the first vertex of each line segment in data (n by 3). Consecutive finite
+    vertices are joined by a segment. Rows of NaNs separate lines.
+    """
+    finite = np.all(np.isfinite(data),axis=1)
+    return np.flatnonzero(finite[:-1] & finite[1:])
+
+
+def clipSegments(data, starts, axisToPlot, zLow, zHigh):
+    """
+    Clip the segments of data (n by 3) that begin at the vertices in starts, in increasing order, to the
+    slab from zLow to zHigh along axisToPlot. All segments should reach the slab. Return the clipped
+    segments as 2D positions in the view along axisToPlot. Runs of connected segments become one line and
+    lines are separated by a row of NaNs, as expected by PlotCurveItem(connect="finite").
+    """
+    if len(starts)==0:
+        return np.zeros((0,2))
+
+    #Clip each segment to the slab along the line's parametric form: p0 + t*(p1-p0), 0<=t<=1
+    p0 = data[starts]
+    p1 = data[starts+1]
+    dz = p1[:,axisToPlot]-p0[:,axisToPlot]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        tLow = (zLow-p0[:,axisToPlot])/dz
+        tHigh = (zHigh-p0[:,axisToPlot])/dz
+    tStart = np.where(dz==0, 0, np.clip(np.minimum(tLow,tHigh),0,1))
+    tEnd = np.where(dz==0, 1, np.clip(np.maximum(tLow,tHigh),0,1))
+    clippedStart = tStart>0
+    clippedEnd = tEnd<1
+    a = p0 + tStart[:,None]*(p1-p0)
+    b = p0 + tEnd[:,None]*(p1-p0)
+
+    #A segment continues the previous one if they share an unclipped vertex. Then only its end is added.
+    #Otherwise it starts a new line: a NaN (unless it is the first), its start and its end
+    continues = np.zeros(len(starts),dtype=bool)
+    continues[1:] = (starts[1:]==starts[:-1]+1) & ~clippedEnd[:-1] & ~clippedStart[1:]
+    nRows = np.where(continues, 1, 3)
+    nRows[0] = 2
+    ends = np.cumsum(nRows)-1
+
+    vertices = np.full((ends[-1]+1,3), np.nan)
+    vertices[ends] = b
+    newLine = ~continues
+    vertices[ends[newLine]-1] = a[newLine]
+    return projectToPlane(vertices,axisToPlot)
@@ -12,6 +12,7 @@ import struct
 import numpy as np
 import imp #to look for the presence of a module. Python 3 will require importlib
 import lasagna_helperFunctions as lasHelp 
+import statsCache
 
 
 #-------------------------------------------------------------------------------------------
@@ -60,13 +61,21 @@ def getVoxelSpacing(fname,fallBackMode=False):
   to swing something for TIFFs (e.g. by creating Icy-like metadata files)
   """
 
+  #Reading the header can be slow (e.g. if vtk has to be imported) so the ratios are cached
+  cached = statsCache.load(fname)
+  if cached is not None and 'axisRatios' in cached:
+    return cached['axisRatios']
+
   if fname.lower().endswith('.mhd'):
-    return mhd_getRatios(fname)
-  if fname.lower().endswith('.nrrd') or fname.lower().endswith('.nrd'):  
-    return nrrd_getRatios(fname)
+    ratios = mhd_getRatios(fname)
+  elif fname.lower().endswith('.nrrd') or fname.lower().endswith('.nrd'):  
+    ratios = nrrd_getRatios(fname)
   else:
     return lasHelp.readPreference('defaultAxisRatios') #defaults
 
+  statsCache.save(fname, axisRatios=ratios)
+  return ratios
+
 
 def spacingToRatio(spacing):
   """
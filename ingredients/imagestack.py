@@ -9,6 +9,11 @@ from PyQt5 import QtGui, QtCore
 import pyqtgraph as pg
 from  lasagna_ingredient import lasagna_ingredient 
 from imageStackLoader import saveStack
+import lasagna_helperFunctions as lasHelp
+from imageProcessing.slabProjection import slabProjector
+from imageProcessing import obliqueSlice, histogram, display
+import backgroundWorker
+import statsCache
 
 class imagestack(lasagna_ingredient):
     def __init__(self, parent=None, data=None, fnameAbsPath='', enable=True, objectName='', minMax=None, lut='gray'):
@@ -20,16 +25,44 @@ class imagestack(lasagna_ingredient):
 
         self.compositionMode=QtGui.QPainter.CompositionMode_Plus
 
-        #Set reasonable default for plotting the images unless different values were specified
-        if minMax is None:
-            self.minMax = [0, self.defaultHistRange()]
+        #Full-volume intensity statistics (see imageProcessing.histogram.volumeStats) are read from the 
+        #stats cache if this file has been opened before. Otherwise they are calculated in the background
+        #and, until they arrive, the histogram and default levels come from the middle slice only.
+        cached = statsCache.load(fnameAbsPath) or dict()
+        if 'stats' in cached and cached['stats']['dtype'] == str(self._data.dtype):
+            self.stats = cached['stats']
+            initialStats = self.stats
         else:
+            self.stats = None
+            initialStats = histogram.quickStats(self._data)
+        self.histogram = initialStats['histogram']
+
+        #Set reasonable default for plotting the images unless different values were specified
+        self._provisionalMinMax = None
+        if minMax is not None:
             self.minMax = minMax
+        elif 'levels' in cached: #The levels the user last chose for this file
+            self.minMax = cached['levels']
+        else:
+            self.minMax = [0, initialStats['autoRange']]
+            if self.stats is None:
+                self._provisionalMinMax = list(self.minMax) #replaced by the full-volume value unless the user changes it
 
-        self.lut=lut #The look-up table
+        self.lut=cached.get('lut',lut) #The look-up table
         self.maxColMapValue=255
         self._alpha=100 #image transparency stored here. see getters and setter at end of file
 
+        #Thick-slab projection settings for each of the three axes. slabMode is None (show a single
+        #plane) or one of 'max', 'mean', 'min'. The slab covers the plotted slice +/- slabHalfWidth
+        self.slabMode = [None, None, None]
+        self.slabHalfWidth = list(lasHelp.readPreference('defaultSlabHalfWidth'))
+        self._slabProjectors = {} #slabProjector instances keyed by axis. see slabProjection()
+
+        #Planes are shown as integers that index a look-up table combining the levels (minMax) with the colour
+        #map. So changing the levels only swaps the table and never re-scales the image data. See displayLUT()
+        self._displayQuantisation = (None,None) #(source data, (offset,scale,nLevels))
+        self._displayLUT = (None,None) #(key,lut)
+
 
         #Add to the imageStackLayers_model which is associated with the imagestack QTreeView
         name = QtGui.QStandardItem(objectName)
@@ -51,7 +84,10 @@ class imagestack(lasagna_ingredient):
         self.histPenCustomColor = False
         self.histBrushCustomColor = False
 
-        self.histogram = self.calcHistogram()
+        if self.stats is None:
+            self.calcHistogram()
+        else:
+            self._statsSource = self._data
 
     def setColorMap(self,cmap=''):
         """
@@ -67,15 +103,7 @@ class imagestack(lasagna_ingredient):
             print("valid color maps are gray, red, and green")
             return
 
-
-        pos = np.array([0.0, 1.0])
-        nVal = self.maxColMapValue
-        finalColor = self.colorName2value(cmap,nVal=nVal,alpha=self.alpha)
-        color = np.array([[ 0 , 0 , 0 ,nVal], finalColor], dtype=np.ubyte)
-        map = pg.ColorMap(pos, color)
-        lut = map.getLookupTable(0.0, 1.0, nVal+1)
-
-        return lut
+        return display.colorMapLUT(cmap,nVal=self.maxColMapValue,alpha=self.alpha)
 
 
     def colorName2value(self,colorName,nVal=255,alpha=255):
@@ -84,33 +112,40 @@ class imagestack(lasagna_ingredient):
         colorName is a color name, output is an RGBalpha vector.
         nVal is the maximum intensity value
         """
-        colorName = colorName.lower()
+        return display.colorName2value(colorName,nVal=nVal,alpha=alpha)
 
-        colorDict = {
-                    'gray'      :   [nVal,nVal,nVal,alpha],
-                    'red'       :   [nVal, 0  , 0  ,alpha],
-                    'green'     :   [ 0  ,nVal, 0  ,alpha],
-                    'blue'      :   [ 0  , 0  ,nVal,alpha],
-                    'magenta'   :   [nVal, 0  ,nVal,alpha],
-                    'cyan'      :   [ 0  ,nVal,nVal,alpha], 
-                    'yellow'    :   [nVal,nVal, 0  ,alpha]
-                    }
 
-        if colorName in colorDict:
-            return colorDict[colorName]
-        else:
-            print(("no pre-defined colormap %s. reverting to gray " % colorName)) 
-            return colorDict['gray']
+    def calcHistogram(self):
+        """
+        Calculate the histogram and other intensity statistics of the whole stack in the background.
+        The results are stored by statsReady.
+        """
+        source = self._data
+        self._statsSource = source
+        backgroundWorker.runInBackground(histogram.volumeStats, source, 
+                                         onFinished=lambda stats: self.statsReady(stats,source))
 
 
-    def calcHistogram(self):
+    def statsReady(self,stats,source):
         """
-        Calculate the histogram and store results in a variable
+        Runs on the GUI thread when the full-volume statistics are available. Replaces the provisional 
+        histogram and, if the user has not changed them, the provisional levels.
         """
-        y,x = np.histogram(self._data, bins=500)
-        x=x[0:-1] #chop off last value
+        if source is not self._statsSource or self not in self.parent.ingredientList:
+            return
 
-        return {'x':x, 'y':y}
+        self.stats = stats
+        self.histogram = stats['histogram']
+        statsCache.save(self.fnameAbsPath, stats=stats)
+
+        if self._provisionalMinMax is not None and list(self.minMax) == self._provisionalMinMax:
+            self.minMax = [0, stats['autoRange']]
+        self._provisionalMinMax = None
+
+        if self.objectName == self.parent.selectedStackName():
+            self.parent.plotImageStackHistogram() #Also applies the levels
+        else:
+            self.setLevels(self.minMax)
 
 
     def histBrushColor(self):
@@ -144,14 +179,16 @@ class imagestack(lasagna_ingredient):
         return self._data.swapaxes(0,axisToPlot)
 
 
-    def plotIngredient(self,pyqtObject,axisToPlot=0,sliceToPlot=0):
+    def plotIngredient(self,pyqtObject,axisToPlot=0,sliceToPlot=0,cropRect=None):
         """
         Plots the ingredient onto pyqtObject along axisAxisToPlot,
-        onto the object with which it is associated
+        onto the object with which it is associated.
+        cropRect - optional (xMin,xMax,yMin,yMax). Only this part of the plane is plotted. 
         """
 
         data = self.data(axisToPlot)
 
+        sliceToPlot = int(sliceToPlot)
         if data.shape[0]-1 < sliceToPlot:
             pyqtObject.setVisible(False)
             sliceToPlot = data.shape[0]-1
@@ -161,39 +198,202 @@ class imagestack(lasagna_ingredient):
         else:
             pyqtObject.setVisible(True)
 
+        plane = self.displayPlane(axisToPlot,sliceToPlot)
+
+        #Crop to the visible region, keeping at least one pixel so there is always something to plot
+        (xMin,yMin) = (0,0)
+        if cropRect is not None:
+            xMin = min(max(cropRect[0],0), plane.shape[0]-1)
+            yMin = min(max(cropRect[2],0), plane.shape[1]-1)
+            xMax = max(min(cropRect[1],plane.shape[0]), xMin+1)
+            yMax = max(min(cropRect[3],plane.shape[1]), yMin+1)
+            plane = plane[xMin:xMax, yMin:yMax]
+
+        lut = self.displayLUT()
         pyqtObject.setImage(
-                        data[sliceToPlot], 
-                        levels=self.minMax, 
+                        self.quantiseForDisplay(plane), 
+                        levels=(0,len(lut)), #identity: raw display values index the LUT directly
                         compositionMode=self.compositionMode,
-                        lut=self.setColorMap(self.lut),
+                        lut=lut,
                         )
 
+        #Place the cropped region where it belongs. This also undoes the scaling applied to oblique planes (see plotObliquePlane)
+        pyqtObject.setRect(QtCore.QRectF(xMin, yMin, plane.shape[0], plane.shape[1]))
 
-    def defaultHistRange(self,logY=False):
+
+    def plotObliquePlane(self,pyqtObject,plane,viewRange=None,step=1.0):
         """
-        Returns a reasonable values for the maximum plotted value.
-        logY if True we log the Y values
+        Plots the image stack sampled along an oblique plane onto pyqtObject.
+        plane is a dictionary with keys 'normal', 'offset' and 'interpolate' (see lasagna_axis.setObliquePlane)
+        Only the part of the plane within viewRange is sampled, with samples spaced step voxels apart.
+        """
+        (image,rect) = obliqueSlice.samplePlane(self._data, plane['normal'], plane['offset'], 
+                                                viewRange=viewRange, step=step, interpolate=plane['interpolate'])
+        if image is None:
+            pyqtObject.setVisible(False)
+            return
+
+        pyqtObject.setVisible(True)
+        lut = self.displayLUT()
+        pyqtObject.setImage(
+                        self.quantiseForDisplay(image), 
+                        levels=(0,len(lut)), 
+                        compositionMode=self.compositionMode,
+                        lut=lut,
+                        )
+        pyqtObject.setRect(QtCore.QRectF(*rect))
+
+
+    def displayQuantisation(self):
+        """
+        Return (offset,scale,nLevels), which define the integers used to display the stack: 
+        displayValue = (dataValue-offset)*scale and 0 <= displayValue < nLevels
+        uint8 and uint16 stacks are displayed as they are. Other integer stacks are offset by their 
+        minimum and, like float stacks, are scaled to uint16 if their range is too large. The 
+        quantisation is fixed for a given stack so changing the levels never re-scales the data.
+        """
+        (source,quantisation) = self._displayQuantisation
+        if source is self._data:
+            return quantisation
+
+        quantisation = display.displayQuantisation(self._data)
+        self._displayQuantisation = (self._data,quantisation)
+        return quantisation
+
+
+    def quantiseForDisplay(self,plane):
+        """
+        Convert a plane (e.g. from displayPlane) to the integers used to index the display LUT
+        """
+        return display.quantise(plane,self.displayQuantisation())
+
+
+    def displayValueToData(self,value):
+        """
+        Convert a displayed value (e.g. read from an ImageItem) back to the units of the stack
+        """
+        (offset,scale,nLevels) = self.displayQuantisation()
+        if offset == 0 and scale == 1:
+            return value
+        return value/scale + offset
+
+
+    def displayLUT(self):
+        """
+        Return an (nLevels,4) RGBA look-up table that maps display values (see quantiseForDisplay) 
+        through the current levels (self.minMax) and the colour map. The table is only rebuilt when 
+        the levels, colour map, transparency, or data change.
+        """
+        quantisation = self.displayQuantisation()
+        if isinstance(self.lut,np.ndarray):
+            key = None #can't cheaply tell if a user-supplied array has changed
+        else:
+            key = (tuple(self.minMax), self.lut, self.alpha, quantisation)
+
+        if key is not None and self._displayLUT[0] == key:
+            return self._displayLUT[1]
+
+        lut = display.levelsLUT(self.setColorMap(self.lut), self.minMax, quantisation)
+        self._displayLUT = (key,lut)
+        return lut
+
+
+    def saveDisplaySettings(self):
+        """
+        Remember the current levels and colour map so they are restored next time this file is opened
+        """
+        statsCache.save(self.fnameAbsPath, levels=self.minMax, lut=self.lut)
+
+
+    def setLevels(self,levels):
+        """
+        Set the display range (minMax) and apply it to every axis. This only swaps the look-up table 
+        of each ImageItem, so is cheap whatever the size of the image.
+        """
+        self.minMax = [levels[0], levels[1]]
+        lut = self.displayLUT()
+        for thisAxis in self.parent.axes2D:
+            pyqtObject = lasHelp.findPyQtGraphObjectNameInPlotWidget(thisAxis.view, self.objectName)
+            if pyqtObject == False:
+                continue
+            pyqtObject.setLookupTable(lut)
+
+
+    def displayPlane(self,axisToPlot=0,sliceToPlot=0):
         """
+        Returns the 2D image shown for slice sliceToPlot along axisToPlot. This is either 
+        the plane itself or, if a slab mode is set for this axis, a projection through the 
+        slab centred on that plane.
+        """
+        projector = self.slabProjection(axisToPlot)
+        if projector is None or projector.needsBlocks():
+            return self.data(axisToPlot)[sliceToPlot]
+
+        return projector.project(sliceToPlot)
+
+
+    def setSlabMode(self,mode,axes=(0,1,2),halfWidth=None):
+        """
+        Set the thick-slab projection mode for the listed axes.
+        mode - None (single plane), 'max', 'mean' or 'min'
+        halfWidth - optionally change the number of slices either side of the current one
+        """
+        for axisToPlot in axes:
+            self.slabMode[axisToPlot] = mode
+            if halfWidth is not None:
+                self.slabHalfWidth[axisToPlot] = int(halfWidth)
+
+
+    def slabProjection(self,axisToPlot):
+        """
+        Return the slabProjector for axisToPlot or None if this axis shows single planes.
+        A new projector is made if the slab settings or the image data have changed. Max and min 
+        projectors need a slow set-up step that runs in the background. The plain plane is shown
+        until it finishes, at which point the axes are re-drawn.
+        """
+        mode = self.slabMode[axisToPlot]
+        if mode is None:
+            return None
+
+        #The projector is stored along with the array it was built from so we can 
+        #tell when the stack has been flipped, rotated, etc
+        (source,projector) = self._slabProjectors.get(axisToPlot,(None,None))
+        if source is self._data and projector.mode == mode and projector.halfWidth == self.slabHalfWidth[axisToPlot]:
+            return projector
 
-        (y,x) = np.histogram(self.data(),bins=100)
-        y=np.append(y,0)
+        projector = slabProjector(self.data(axisToPlot), mode=mode, halfWidth=self.slabHalfWidth[axisToPlot])
+        self._slabProjectors[axisToPlot] = (self._data,projector)
 
-        #Remove negative numbers from the calculation. Sometimes these happen with registered images
-        y = y[x>0]
-        x = x[x>0]
+        if projector.needsBlocks():
+            print("Building %s projection for axis %d of %s" % (mode,axisToPlot,self.objectName))
+            backgroundWorker.runInBackground(projector.buildBlocks, onFinished=self.slabProjectionReady)
 
-        if logY==True:
-            y=np.log10(y+0.1)
+        return projector
 
-        #I'm sure this isn't the most robust approach but it works for now
-        thresh=0.925 #find values greater than this proportion
 
-        m = x*y
-        vals = np.cumsum(m)/np.sum(m)
+    def slabProjectionReady(self,projector):
+        """
+        Runs on the GUI thread once a slab projector has finished its set-up
+        """
+        current = [thisProjector for (source,thisProjector) in self._slabProjectors.values()]
+        if projector in current and self in self.parent.ingredientList:
+            self.parent.initialiseAxes()
+
+
+    def defaultHistRange(self,logY=False):
+        """
+        Returns a reasonable values for the maximum plotted value.
+        logY if True we log the Y values
+        """
+
+        stats = self.stats
+        if stats is not None and not logY:
+            return stats['autoRange']
 
-        vals = vals>thresh
+        if stats is None or stats['counts'] is None: #Not yet calculated or cached without the counts
+            stats = histogram.volumeStats(self._data)
 
-        return x[vals.tolist().index(True)]
+        return histogram.autoRangeFromCounts(*stats['counts'], logY=logY)
 
 
     def changeData(self,imageData,imageAbsPath,recalculateDefaultHistRange=False):
@@ -209,7 +409,7 @@ class imagestack(lasagna_ingredient):
         self.fnameAbsPath = imageAbsPath 
 
         if recalculateDefaultHistRange:
-            self.defaultHistRange()
+            self.calcHistogram()
 
         return True
 
@@ -20,12 +20,17 @@ import pyqtgraph as pg
 from  lasagna_ingredient import lasagna_ingredient 
 from PyQt5 import QtGui, QtCore
 import lasagna_helperFunctions as lasHelp
-import warnings #to disable some annoying NaN-related warnings
-from matplotlib import cm
+from imageProcessing.sliceIndex import segmentIndex
+from imageProcessing.lineSimplification import lineLevels
+import backgroundWorker
+from IO.points_io import write_points, series_from_lines
 from numpy import linspace
 from random import shuffle
 
 class lines(lasagna_ingredient):
+
+    minVerticesToSimplify = 20000 #Lines with fewer vertices are always drawn in full
+
     def __init__(self, parent=None, data=None, fnameAbsPath='', enable=True, objectName=''):
         super(lines,self).__init__(parent, data, fnameAbsPath, enable, objectName,
                                         pgObject='PlotCurveItem'
@@ -37,6 +42,10 @@ class lines(lasagna_ingredient):
         self.symbolSize = int(self.parent.markerSize_spinBox.value())
         self.alpha = int(self.parent.markerAlpha_spinBox.value())
         self.lineWidth = int(self.parent.lineWidth_spinBox.value())
+        self._segmentIndex = None #see segmentsNearSlice
+        self._lineLevels = None #Simplified versions of the lines for zoomed-out views. see simplifiedLevels
+        self._lineLevelsSource = None #The data for which simplified levels are being built
+        self._levelDrawn = {} #axisToPlot: the simplification level last drawn (None if in full)
 
         #Add to the imageStackLayers_model which is associated with the points QTreeView
         name = QtGui.QStandardItem(objectName)
@@ -56,6 +65,7 @@ class lines(lasagna_ingredient):
         #Set the colour of the object based on how many items are already present
         number_of_colors = 6
         thisNumber = (self.parent.points_Model.rowCount() - 1) % number_of_colors
+        from matplotlib import cm #imported here as matplotlib is slow to import and only needed for this
         cm_subsection = linspace(0, 1, number_of_colors)
         colors = [ cm.jet(x) for x in cm_subsection ]
         color = colors[thisNumber]
@@ -86,28 +96,21 @@ class lines(lasagna_ingredient):
             print("lines.py not proceeding because pyqtObject is false")             
             return
 
-        # check if there are data on the plot. Use `is False` because np.array == False returns an array
-        if self.data() is False or len(self.data()) == 0:
+        # check if there are data on the plot
+        if len(self._data) == 0:
             pyqtObject.setData([],[]) # make sure there are no data left on the plot
             return
 
-        #Ensure our z dimension is a whole number
-        z = np.round(self._data[:,axisToPlot])
-
-        data = self.data(axisToPlot)
-
-        #Find points within this z-plane +/- a certain region
+        #Find the parts of the line segments within this z-plane +/- a certain region, 
+        #including segments that cross the region without a vertex in it
+        #When zoomed out, draw a simplified version of the lines with no visible loss of detail
         zRange = self.parent.viewZ_spinBoxes[axisToPlot].value()-1
-        fromLayer = sliceToPlot-zRange
-        toLayer = sliceToPlot+zRange
-
-        #Now filter the data list by this Z range. Points that will not be plotted are replaced with nan
-        warnings.simplefilter(action = "ignore", category = RuntimeWarning) #To block weird run-time warnings that aren't of interest produced by the following two lines
-        data[z<fromLayer,:] = np.nan
-        data[z>toLayer,:] = np.nan
+        level = self.levelForPixelSize(viewPixelSize(pyqtObject))
+        self._levelDrawn[axisToPlot] = level
+        data = self.segmentsNearSlice(axisToPlot, sliceToPlot-zRange, sliceToPlot+zRange, level=level)
 
-        #If we have only NaNs we should not plot. 
-        if np.all(np.isnan(data))==False:
+        #If there is nothing in range we should not plot. 
+        if len(data) > 0:
             pyqtObject.setData(x=data[:,0], y=data[:,1], 
                                 pen=pg.mkPen(color=self.symbolBrush(), width=self.lineWidth), 
                                 antialias=True,
@@ -117,6 +120,66 @@ class lines(lasagna_ingredient):
             pyqtObject.setVisible(False)
 
 
+    def segmentsNearSlice(self,axisToPlot,fromLayer,toLayer,level=None):
+        """
+        Return the lines from layer fromLayer to toLayer along axisToPlot, clipped to those layers (see segmentIndex.query).
+        If level is not None, the lines simplified at that level are returned (see lineLevels).
+        The index is rebuilt only if the data have been replaced.
+        """
+        if level is not None:
+            return self._lineLevels.index(level).query(axisToPlot, fromLayer, toLayer)
+
+        if self._segmentIndex is None or not self._segmentIndex.isFor(self._data):
+            self._segmentIndex = segmentIndex(self._data)
+        return self._segmentIndex.query(axisToPlot, fromLayer, toLayer)
+
+
+    def levelForPixelSize(self,pixelSize):
+        """
+        Return the simplification level to draw when a screen pixel is pixelSize voxels across,
+        or None to draw the lines in full
+        """
+        levels = self.simplifiedLevels()
+        if levels is None:
+            return None
+        return levels.levelForPixelSize(pixelSize)
+
+
+    def needsRedraw(self,axisToPlot,pixelSize):
+        """
+        True if the view along axisToPlot has been zoomed so that a different simplification level should be drawn
+        """
+        if axisToPlot not in self._levelDrawn:
+            return False
+        return self.levelForPixelSize(pixelSize) != self._levelDrawn[axisToPlot]
+
+
+    def simplifiedLevels(self):
+        """
+        Return the simplified levels of the lines (see lineLevels) or None if they are not available.
+        Levels are built in the background the first time they are needed. The lines are drawn in full until then.
+        """
+        if len(self._data) < self.minVerticesToSimplify:
+            return None
+        if self._lineLevels is not None and self._lineLevels.isFor(self._data):
+            return self._lineLevels
+
+        if self._lineLevelsSource is not self._data:
+            self._lineLevelsSource = self._data
+            backgroundWorker.runInBackground(lineLevels, self._data, onFinished=self.simplificationReady)
+        return None
+
+
+    def simplificationReady(self,levels):
+        """
+        Runs on the GUI thread once the simplified levels have been built
+        """
+        if not levels.isFor(self._data) or self not in self.parent.ingredientList:
+            return
+        self._lineLevels = levels
+        self.parent.initialiseAxes()
+
+
     def addToList(self):
         """
         Add to list and then set UI elements
@@ -126,6 +189,20 @@ class lines(lasagna_ingredient):
         self.parent.markerAlpha_spinBox.setValue(self.alpha)
 
 
+    def save(self, path=None):
+        """
+        Save the lines as a binary point set file (see IO.points_io) in which the series of each point is its line
+        """
+        if path is None:
+            path = QtGui.QFileDialog.getSaveFileName(self.parent, 'File to save %s' % self.objectName, '',
+                                                     "Point set (*.npz)")[0]
+        if not path:
+            return
+        (points,series) = series_from_lines(self.raw_data())
+        path = write_points(path, points, series=series)
+        print(('%s saved as %s' % (self.objectName, path)))
+
+
     def symbolBrush(self):
         if isinstance(self.color,list):
             return tuple(self.color + [self.alpha])
@@ -166,3 +243,13 @@ class lines(lasagna_ingredient):
 
 
    
+
+
+def viewPixelSize(pyqtObject):
+    """
+    Return the size, in data units, of a screen pixel in the view holding pyqtObject or None if it is not in a view
+    """
+    viewBox = pyqtObject.getViewBox()
+    if viewBox is None:
+        return None
+    return max(viewBox.viewPixelSize())
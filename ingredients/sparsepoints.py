@@ -9,7 +9,9 @@ import pyqtgraph as pg
 from  lasagna_ingredient import lasagna_ingredient 
 from PyQt5 import QtGui, QtCore
 import lasagna_helperFunctions as lasHelp
-from matplotlib import cm
+from imageProcessing.sliceIndex import sliceIndex
+from imageProcessing.pointIndex import pointIndex
+from IO.points_io import write_points
 from numpy import linspace
 
 
@@ -26,6 +28,10 @@ class sparsepoints(lasagna_ingredient):
         self.symbolSize =  int(self.parent.markerSize_spinBox.value())
         self.alpha = int(self.parent.markerAlpha_spinBox.value())
         self.lineWidth = None #Not used right now
+        self._brushCache = {} #QBrush for each (color,alpha). see symbolBrushes
+        self._sliceIndex = None #see pointsNearSlice
+        self._pointIndex = None #see pointsNearPosition
+        self.attributes = {} #Optional per-point values (e.g. cell volume) read from, and saved to, binary point files
 
         #Add to the imageStackLayers_model which is associated with the points QTreeView
         name = QtGui.QStandardItem(objectName)
@@ -45,6 +51,7 @@ class sparsepoints(lasagna_ingredient):
         #Set the colour of the object based on how many items are already present
         number_of_colors = 6
         thisNumber = (self.parent.points_Model.rowCount()-1)%number_of_colors
+        from matplotlib import cm #imported here as matplotlib is slow to import and only needed for this
         cm_subsection = linspace(0, 1, number_of_colors)
         colors = [ cm.jet(x) for x in cm_subsection ]
         color = colors[thisNumber]
@@ -74,50 +81,57 @@ class sparsepoints(lasagna_ingredient):
         if pyqtObject==False:
             return
 
-        # check if there is data. Use `is False` because np.array == False returns an array
-        if self.data() is False or len(self.data()) == 0:
+        # check if there is data
+        if len(self._data) == 0:
             pyqtObject.setData([],[]) # make sure there is no left data on plot
             return
 
-        z = np.round(self._data[:,axisToPlot])
-
-        data = self.data(axisToPlot)
-
         #Find points within this z-plane +/- a certain region
         zRange = self.parent.viewZ_spinBoxes[axisToPlot].value()-1
-        fromLayer = sliceToPlot-zRange
-        toLayer = sliceToPlot+zRange
-        data = data[(z>=fromLayer) * (z<=toLayer),:]
-        z = z[(z>=fromLayer) * (z<=toLayer)]
+        (rows,z,data) = self.pointsNearSlice(axisToPlot, sliceToPlot-zRange, sliceToPlot+zRange)
 
-        #Add points, making points further from the current
-        #layer less prominent 
+        #Add points, making points further from the current layer smaller and more transparent.
         #TODO: make this settable by the user via the YAML or UI elements
-        dataToAdd = []
-        for ii in range(len(data)):
-
-            #Get size for out-of layer points
-            size = (self.symbolSize - abs(z[ii]-sliceToPlot)*2)
-            if size<1:
-                size=1
-            #Get opacity for out-of layer points
-            alpha = (self.alpha - abs(z[ii]-sliceToPlot)*20)
-            if alpha<10:
-                alpha=10
-
-
-            dataToAdd.append(
-                    {
-                     'pos': (data[ii,0],data[ii,1]),
-                     'symbol': self.symbol,
-                     'brush': self.symbolBrush(alpha=alpha),
-                     'size': size
-                     }
-                    )
-
-        pyqtObject.setData(dataToAdd)
+        distance = np.abs(z-sliceToPlot)
+        sizes = np.maximum(self.symbolSize - distance*2, 1)
+        alphas = np.maximum(self.alpha - distance*20, 10)
+
+        pyqtObject.setData(x=data[:,0], y=data[:,1], symbol=self.symbol, size=sizes, brush=self.symbolBrushes(alphas))
      
 
+    def pointsNearSlice(self,axisToPlot,fromLayer,toLayer):
+        """
+        Return (rows,z,xy) for the points from layer fromLayer to toLayer along axisToPlot (see sliceIndex.query).
+        The index is rebuilt only if the data have been replaced.
+        """
+        if self._sliceIndex is None or not self._sliceIndex.isFor(self._data):
+            self._sliceIndex = sliceIndex(self._data)
+        return self._sliceIndex.query(axisToPlot, fromLayer, toLayer)
+
+
+    def pointsNearPosition(self,position,axisToPlot,radius,zRange=0):
+        """
+        Return (rows,distances) for the points within radius of position (z,x,y) in the view along axisToPlot
+        and within zRange slices of it (see pointIndex.query). Nearest points come first.
+        The index is rebuilt only if the data have been replaced.
+        """
+        if len(self._data) == 0:
+            return (np.zeros(0,dtype=int), np.zeros(0))
+        if self._pointIndex is None or not self._pointIndex.isFor(self._data):
+            self._pointIndex = pointIndex(self._data)
+        return self._pointIndex.query(position, axisToPlot, radius, zRange)
+
+
+    def describePoint(self,row):
+        """
+        Return a short description of the point in row: its position and any attributes
+        """
+        description = "%s #%d (%s)" % (self.objectName, row, ",".join(["%g" % x for x in self._data[row]]))
+        for (name,values) in self.attributes.items():
+            description += " %s=%s" % (name, values[row])
+        return description
+
+
     def addToList(self):
         """
         Add to list and then set UI elements
@@ -127,6 +141,23 @@ class sparsepoints(lasagna_ingredient):
         self.parent.markerAlpha_spinBox.setValue(self.alpha)
             
 
+    def save(self, path=None):
+        """
+        Save the points as a binary point set file (see IO.points_io) or, if the file name
+        ends with .csv or .txt, as comma-separated text
+        """
+        if path is None:
+            path = QtGui.QFileDialog.getSaveFileName(self.parent, 'File to save %s' % self.objectName, '',
+                                                     "Point set (*.npz);;Text (*.csv *.txt)")[0]
+        if not path:
+            return
+        if path.lower().endswith(('.csv','.txt')):
+            np.savetxt(path, self.raw_data(), delimiter=',', fmt='%g')
+        else:
+            path = write_points(path, self.raw_data(), attributes=self.attributes)
+        print(('%s saved as %s' % (self.objectName, path)))
+
+
     def symbolBrush(self,alpha=False):
         """
         Returns an RGB + opacity tuple 
@@ -140,6 +171,26 @@ class sparsepoints(lasagna_ingredient):
             print(("sparsepoints.color can not cope with type " + str(type(self.color))))
 
 
+    def symbolBrushes(self,alphas):
+        """
+        Returns an array of QBrushes, one for each opacity in alphas. Opacities are rounded to 
+        whole numbers and only one brush is made for each, however many points there are.
+        """
+        if not isinstance(self.color,list):
+            print(("sparsepoints.color can not cope with type " + str(type(self.color))))
+            return None
+
+        (levels,index) = np.unique(np.round(alphas).astype(int), return_inverse=True)
+        brushes = np.empty(len(levels), dtype=object)
+        for (ii,thisAlpha) in enumerate(levels):
+            key = tuple(self.color) + (thisAlpha,)
+            if key not in self._brushCache:
+                self._brushCache[key] = pg.mkBrush(self.symbolBrush(alpha=int(thisAlpha)))
+            brushes[ii] = self._brushCache[key]
+
+        return brushes[index]
+
+
     #---------------------------------------------------------------
     #Getters and setters
 
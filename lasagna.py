@@ -20,11 +20,16 @@ __license__ = "GPL v3"
 __maintainer__ = "Rob Campbell"
 
 
+# Start timing imports before anything heavy is imported (see startupProfiler)
+import sys
+import startupProfiler
+if '--profileStartup' in sys.argv:
+    startupProfiler.enable()
+
 from PyQt5 import QtCore, QtGui, QtWidgets
 from PyQt5.QtWidgets import *
 import pyqtgraph as pg
 import numpy as np
-import sys
 import signal
 import os.path
 
@@ -48,44 +53,7 @@ import lasagna_plugin  # Needed here to build a standalone version
 
 
 
-# Parse command-line input arguments
-import argparse
-parser = argparse.ArgumentParser()
-parser.add_argument("-D", help="Load demo images", action="store_true")  # Store true makes it zero by default
-parser.add_argument("-im", nargs='+', help="file name(s) of image stacks to load")
-parser.add_argument("-S", nargs='+', help="file names of sparse points file(s) to load")
-parser.add_argument("-L", nargs='+', help="file names of lines file(s) to load")
-parser.add_argument("-T", nargs='+', help="file names of tree file(s) to load")
-parser.add_argument("-C", help="start a ipython console", action='store_true')
-parser.add_argument("-P", help="start plugin of this name. use string from plugins menu as the argument")
-args = parser.parse_args()
-
-pluginToStart = args.P
-sparsePointsToLoad = args.S
-linesToLoad = args.L
-treesToLoad = args.T
-
-# Either load the demo stacks or a user-specified stacks
-if args.D == True:
-    import tempfile
-    import urllib.request, urllib.parse, urllib.error
-
-    imStackFnamesToLoad = [tempfile.gettempdir()+os.path.sep+'reference.tiff',
-              tempfile.gettempdir()+os.path.sep+'sample.tiff']
-
-    loadUrl = 'http://mouse.vision/lasagna/'
-    for fname in imStackFnamesToLoad:
-        if not os.path.exists(fname):
-            url = loadUrl + fname.split(os.path.sep)[-1]
-            print(('Downloading %s to %s' % (url,fname)))
-            urllib.request.urlretrieve(url,fname)
-
-else:
-    imStackFnamesToLoad = args.im
-
-
-
-
+startupProfiler.phase('import modules')
 
 
 
@@ -104,6 +72,7 @@ class lasagna(QtGui.QMainWindow, lasagna_mainWindow.Ui_lasagna_mainWindow):
         self.setupUi(self)
         self.show()
         self.app=None # The QApplication handle kept here
+        startupProfiler.phase('build main window')
 
 
         # Misc. window set up
@@ -122,6 +91,8 @@ class lasagna(QtGui.QMainWindow, lasagna_mainWindow.Ui_lasagna_mainWindow):
         self.lineWidth_spinBox.setValue(lasHelp.readPreference('defaultLineWidth'))
         self.markerAlpha_spinBox.setValue(lasHelp.readPreference('defaultSymbolOpacity'))
 
+        startupProfiler.phase('read preferences')
+
         # Set up axes
         # Turn axisRatioLineEdit_x elements into a list to allow functions to iterate across them
         self.axisRatioLineEdits = [self.axisRatioLineEdit_1, self.axisRatioLineEdit_2, self.axisRatioLineEdit_3]
@@ -152,6 +123,8 @@ class lasagna(QtGui.QMainWindow, lasagna_mainWindow.Ui_lasagna_mainWindow):
                  }
 
 
+        startupProfiler.phase('create axes')
+
         # Establish links between projections for scrolling through slices [implemented by signals in main() after the GUI is instantiated]
         self.axes2D[0].linkedXprojection = self.axes2D[2]
         self.axes2D[0].linkedYprojection = self.axes2D[1]
@@ -171,6 +144,7 @@ class lasagna(QtGui.QMainWindow, lasagna_mainWindow.Ui_lasagna_mainWindow):
         self.mouseY = None
         self.inAxis = 0  # The axis the mouse is currently in [see mouseMoved()]
         self.mousePositionInStack = []  # A list defining voxel (Z,X,Y) in which the mouse cursor is currently positioned [see mouseMoved()]
+        self.pickedPoints = []  # (ingredient, row, distance) of the sparse points under the mouse at the last click [see axisClicked()]
         self.statusBarText = None
 
         #Ensure that the menu on OS X appears the same as in Linux and Windows
@@ -213,21 +187,41 @@ class lasagna(QtGui.QMainWindow, lasagna_mainWindow.Ui_lasagna_mainWindow):
         IO_Paths = list(set(IO_Paths)) #remove duplicate paths
 
         print("Adding IO module paths to Python path")
-        IO_plugins, IO_pluginPaths = pluginHandler.findPlugins(IO_Paths)
+        IO_manifest = pluginHandler.pluginManifest(IO_Paths)
         for p in IO_Paths:
             sys.path.append(p) # append to system path
             print(p)
 
-        # Add *load actions* to the Load ingredients sub-menu and add loader modules here
+        # Add *load actions* to the Load ingredients sub-menu. Loader modules are only imported when first used.
         # TODO: currently we only have code to handle load actions as no save actions are available
-        self.loadActions = {}  # actions must be attached to the lasagna object or they won't function
-        for thisIOmodule in IO_plugins:
-            IOclass, IOname = pluginHandler.getPluginInstanceFromFileName(thisIOmodule,attributeToImport='loaderClass')
-            thisInstance = IOclass(self)
-            self.loadActions[thisInstance.objectName] = thisInstance
-            print(("Added %s to load menu as object name %s" % (thisIOmodule, thisInstance.objectName)))
+        self.loadActions = pluginHandler.lazyLoaders(self)  # actions must be attached to the lasagna object or they won't function
+        self.loadPlaceholderActions = {}
+        for thisIOmodule in IO_manifest:
+            if thisIOmodule['kind'] != 'loader':
+                continue
+
+            if thisIOmodule['objectName'] is None or thisIOmodule['menuText'] is None:
+                # The manifest could not describe this loader, so import and instantiate it now
+                IOclass, IOname = pluginHandler.getPluginInstanceFromFileName(thisIOmodule['file'],attributeToImport='loaderClass')
+                thisInstance = IOclass(self)
+                self.loadActions.addInstance(thisInstance)
+                print(("Added %s to load menu as object name %s" % (thisIOmodule['file'], thisInstance.objectName)))
+                continue
+
+            objectName = thisIOmodule['objectName']
+            self.loadActions.addEntry(thisIOmodule)
+            thisAction = QtGui.QAction(thisIOmodule['menuText'], self)
+            if thisIOmodule['icon'] is not None:
+                thisIcon = QtGui.QIcon()
+                thisIcon.addPixmap(QtGui.QPixmap(thisIOmodule['icon']), QtGui.QIcon.Normal, QtGui.QIcon.Off)
+                thisAction.setIcon(thisIcon)
+            thisAction.triggered.connect(lambda checked=False, objectName=objectName: self.loadActions[objectName].showLoadDialog())
+            self.menuLoad_ingredient.addAction(thisAction)
+            self.loadPlaceholderActions[objectName] = thisAction
+            print(("Added %s to load menu as object name %s" % (thisIOmodule['file'], objectName)))
 
         print("")
+        startupProfiler.phase('build load menu')
 
         # Link other menu signals to slots
         self.actionOpen.triggered.connect(self.showStackLoadDialog)
@@ -294,11 +288,16 @@ class lasagna(QtGui.QMainWindow, lasagna_mainWindow.Ui_lasagna_mainWindow):
 
 
 
+        startupProfiler.phase('connect signals')
+
         # Plugins menu and initialisation
         # 1. Get a list of all plugins in the plugins path and add their directories to the Python path
         pluginPaths = lasHelp.readPreference('pluginPaths')
 
-        plugins, pluginPaths = pluginHandler.findPlugins(pluginPaths)
+        pluginManifest = pluginHandler.pluginManifest(pluginPaths)
+        #The directories that contain plugins, in the order of the preference (see pluginHandler.findPlugins)
+        pluginPaths = []
+        [pluginPaths.append(thisPlugin['directory']) for thisPlugin in pluginManifest if thisPlugin['directory'] not in pluginPaths]
         print("Adding plugin paths to Python path:")
         self.pluginSubMenus = {}
         for p in pluginPaths:  # print plugin paths to screen, add to path, add as sub-dir names in Plugins menu
@@ -311,20 +310,20 @@ class lasagna(QtGui.QMainWindow, lasagna_mainWindow.Ui_lasagna_mainWindow):
             self.menuPlugins.addAction(self.pluginSubMenus[dirName].menuAction())
 
         # 2. Add each plugin to a dictionary where the keys are plugin name and values are instances of the plugin.
+        #    Plugin modules are not imported until the plugin is started (see startPlugin)
         print("")
-        self.plugins = {} # A dictionary where keys are plugin names and values are plugin classes or plugin instances
+        self.plugins = {} # A dictionary where keys are plugin names and values are plugin instances or None if the plugin is not running
         self.pluginActions = {} # A dictionary where keys are plugin names and values are QActions associated with a plugin
-        for thisPlugin in plugins:
+        for thisPlugin in pluginManifest:
+            if thisPlugin['kind'] != 'plugin':
+                continue
 
-            # Get the module name and class
-            pluginClass, pluginName = pluginHandler.getPluginInstanceFromFileName(thisPlugin,None)
+            pluginName = thisPlugin['module']
 
             # Get the name of the directory in which the plugin resides so we can add it to the right sub-menu
-            dirName = os.path.dirname(pluginClass.__file__).split(os.path.sep)[-1]
+            dirName = thisPlugin['dirName']
 
-            # create instance of the plugin object and add to the self.plugins dictionary
-            print(("Creating reference to class " + pluginName +  ".plugin"))
-            self.plugins[pluginName] = pluginClass.plugin
+            self.plugins[pluginName] = None
 
             # create an action associated with the plugin and add to the self.pluginActions dictionary
             print(("Creating menu QAction for " + pluginName))
@@ -336,6 +335,7 @@ class lasagna(QtGui.QMainWindow, lasagna_mainWindow.Ui_lasagna_mainWindow):
             self.pluginActions[pluginName].triggered.connect(self.startStopPlugin)  # Connect this action's signal to the slot
 
         print("")
+        startupProfiler.phase('build plugins menu')
 
 
         self.statusBar.showMessage("Initialised")
@@ -364,7 +364,8 @@ class lasagna(QtGui.QMainWindow, lasagna_mainWindow.Ui_lasagna_mainWindow):
 
     def startPlugin(self,pluginName):
         print(("Starting " + pluginName))
-        self.plugins[pluginName] = self.plugins[pluginName](self)  # Create an instance of the plugin object
+        pluginClass, pluginName = pluginHandler.getPluginInstanceFromFileName(pluginName+".py")  # Imports the module the first time
+        self.plugins[pluginName] = pluginClass(self)  # Create an instance of the plugin object
 
     def stopPlugin(self, pluginName):
         print(("Stopping " + pluginName))
@@ -373,12 +374,10 @@ class lasagna(QtGui.QMainWindow, lasagna_mainWindow.Ui_lasagna_mainWindow):
         except:
             print(("failed to properly close plugin " + pluginName))
 
-        # delete the plugin instance and replace it in the dictionary with a reference (that what it is?) to the class
+        # delete the plugin instance. It is re-created from the (already imported) module if the plugin is started again
         # NOTE: plugins with a window do not run the following code when the window is closed. They should, however,
         # detach hooks (unless the plugin author forgot to do this)
-        del(self.plugins[pluginName])
-        pluginClass, pluginName = pluginHandler.getPluginInstanceFromFileName(pluginName+".py", None)
-        self.plugins[pluginName] = pluginClass.plugin
+        self.plugins[pluginName] = None
 
 
     def runHook(self, hookArray, *args):
@@ -736,6 +735,17 @@ class lasagna(QtGui.QMainWindow, lasagna_mainWindow.Ui_lasagna_mainWindow):
 
 
 
+    def redrawIngredient(self,objectName):
+        """
+        Redraw only the ingredient called objectName in each 2D axis. This is much faster than
+        initialiseAxes when nothing else has changed.
+        """
+        ingredient = self.returnIngredientByName(objectName)
+        if ingredient==False:
+            return
+        [axis.updatePlotItem_2D(ingredient) for axis in self.axes2D]
+
+
     def initialiseAxes(self,resetAxes=False):
         """
         Initial display of images in axes and also update other parts of the GUI.
@@ -857,6 +867,9 @@ class lasagna(QtGui.QMainWindow, lasagna_mainWindow.Ui_lasagna_mainWindow):
         action = QtGui.QAction("Delete",self)
         action.triggered.connect(self.deleteLayerPoints_Slot)
         menu.addAction(action)
+        action = QtGui.QAction("Save",self)
+        action.triggered.connect(self.saveLayerPoints_Slot)
+        menu.addAction(action)
         menu.exec_(self.points_TreeView.viewport().mapToGlobal(position))
 
 
@@ -869,6 +882,16 @@ class lasagna(QtGui.QMainWindow, lasagna_mainWindow.Ui_lasagna_mainWindow):
         print(("removed " + objName))
 
 
+    def saveLayerPoints_Slot(self):
+        """call the save method of the selected points or lines ingredient"""
+        objName = self.selectedPointsName()
+        ingr = self.returnIngredientByName(objName)
+        if hasattr(ingr, 'save'):
+            ingr.save()
+        else:
+            print(('no save method for %s'%objName))
+
+
     def pointsLayers_TreeView_slot(self):
         """
         Runs when the user selects one of the points ingredients in the list.
@@ -982,16 +1005,19 @@ class lasagna(QtGui.QMainWindow, lasagna_mainWindow.Ui_lasagna_mainWindow):
         pixelValues=[]
 
         # Get the pixel intensity of all displayed image layers under the mouse
-        # The following assumes that images have their origin at (0,0)
+        # Images may be cropped to the visible area so we find the pixel using each image's position
         for thisImageItem in imageItems:
-            imShape = thisImageItem.image.shape
-
-            if X<0 or Y<0:
-                pixelValues.append(0)
-            elif X>=imShape[0] or Y>=imShape[1]:
+            index = lasHelp.imageItemIndexAtViewPosition(thisImageItem, X, Y)
+            if index is None:
                 pixelValues.append(0)
-            else:
-                pixelValues.append(thisImageItem.image[X, Y])
+                continue
+
+            # Float stacks are quantised for display so convert back to the stack's values
+            value = thisImageItem.image[index]
+            thisStack = self.returnIngredientByName(thisImageItem.objectName)
+            if thisStack != False:
+                value = thisStack.displayValueToData(value)
+            pixelValues.append(value)
 
         # Build a text string to house these values
         valueStr = ''
@@ -1002,12 +1028,45 @@ class lasagna(QtGui.QMainWindow, lasagna_mainWindow.Ui_lasagna_mainWindow):
 
         self.statusBarText = "X=%d, Y=%d, val=[%s]" % (X, Y, valueStr)
 
+        # Report the point under the mouse, if there is one
+        pickedPoints = self.pointsUnderMouse()
+        if len(pickedPoints)>0:
+            (ingredient, row, distance) = pickedPoints[0]
+            self.statusBarText += ", point=%s" % ingredient.describePoint(row)
+
         self.runHook(self.hooks['updateStatusBar_End'])  # Hook goes here to modify or append message
 
         self.statusBar.showMessage(self.statusBarText)
 
+    def pointsUnderMouse(self):
+        """
+        Return a list of (ingredient, row, distance) for the sparse points under the mouse, nearest first.
+        A point is under the mouse if the mouse is within its symbol and the point is drawn on the current view.
+        """
+        axis = self.axes2D[self.inAxis]
+        if axis.obliquePlane is not None or len(self.mousePositionInStack) != 3:
+            return []
+
+        pointsIngredients = self.returnIngredientByType('sparsepoints')
+        if pointsIngredients == False:
+            return []
+
+        pixelSize = max(axis.view.getViewBox().viewPixelSize()) # Size of a screen pixel in voxels
+        zRange = self.viewZ_spinBoxes[axis.axisToPlot].value()-1
+        picked = []
+        for thisIngredient in pointsIngredients:
+            if not thisIngredient.enable:
+                continue
+            radius = max(thisIngredient.symbolSize/2.0, 1) * pixelSize
+            (rows, distances) = thisIngredient.pointsNearPosition(self.mousePositionInStack, axis.axisToPlot, radius, zRange)
+            picked += [(thisIngredient, row, distance) for (row, distance) in zip(rows, distances)]
+
+        return sorted(picked, key=lambda x: x[2])
+
+
     def axisClicked(self, event):
         axisID=self.sender().axisID
+        self.pickedPoints = self.pointsUnderMouse() # Available to plugins that hook into axisClicked
         self.runHook(self.hooks['axisClicked'], self.axes2D[axisID])
 
     def updateMainWindowOnMouseMove(self,axis):
@@ -1066,6 +1125,7 @@ class lasagna(QtGui.QMainWindow, lasagna_mainWindow.Ui_lasagna_mainWindow):
             self.plottedIntensityRegionObj = pg.LinearRegionItem()
             self.plottedIntensityRegionObj.setZValue(10)
             self.plottedIntensityRegionObj.sigRegionChanged.connect(self.updateAxisLevels)  # link signal slot
+            self.plottedIntensityRegionObj.sigRegionChangeFinished.connect(self.saveStackDisplaySettings_Slot)
 
         # Get the plotted range and apply to the region object
         minMax=self.returnIngredientByName(self.selectedStackName()).minMax
@@ -1115,6 +1175,20 @@ class lasagna(QtGui.QMainWindow, lasagna_mainWindow.Ui_lasagna_mainWindow):
 
         menu.addAction(changeColorMenu.menuAction())
 
+        # Thick-slab projections. These can be set for all views at once or for each view separately
+        slabMenu = QtGui.QMenu("Slab projection", self)
+        viewMenus = [("All views", (0,1,2))] + [("View %d" % (ii+1), (ii,)) for ii in range(len(self.axes2D))]
+        for (viewName, axes) in viewMenus:
+            viewMenu = QtGui.QMenu(viewName, slabMenu)
+            for (modeName, mode) in (("off",None), ("max",'max'), ("mean",'mean'), ("min",'min')):
+                action = QtGui.QAction(modeName, viewMenu)
+                # Default arguments bind the current values (a plain lambda would see only the last loop values)
+                action.triggered.connect(lambda checked=False, mode=mode, axes=axes: self.setStackSlabMode_Slot(mode,axes))
+                viewMenu.addAction(action)
+            slabMenu.addAction(viewMenu.menuAction())
+
+        menu.addAction(slabMenu.menuAction())
+
         action = QtGui.QAction("Delete",self)
         action.triggered.connect(self.deleteLayerStack_Slot)
         menu.addAction(action)
@@ -1131,10 +1205,23 @@ class lasagna(QtGui.QMainWindow, lasagna_mainWindow.Ui_lasagna_mainWindow):
         color = str(self.sender().text())
         objName = self.selectedStackName()
         self.returnIngredientByName(objName).lut=color
+        self.returnIngredientByName(objName).saveDisplaySettings()
         self.initialiseAxes()
         self.runHook(self.hooks['changeImageStackColorMap_Slot_End'])
 
 
+    def setStackSlabMode_Slot(self, mode, axes):
+        """
+        Set the slab projection mode of the selected image stack along the listed axes
+        mode is None (single plane), 'max', 'mean', or 'min'
+        """
+        ingredient = self.returnIngredientByName(self.selectedStackName())
+        if ingredient == False:
+            return
+        ingredient.setSlabMode(mode, axes)
+        self.initialiseAxes()
+
+
     def deleteLayerStack_Slot(self):
         """
         Remove an imagestack ingredient and list item
@@ -1223,10 +1310,17 @@ class lasagna(QtGui.QMainWindow, lasagna_mainWindow.Ui_lasagna_mainWindow):
             if objectName != self.selectedStackName():  # TODO: LAYERS
                 continue
 
-            for thisAxis in self.axes2D:
-                img = lasHelp.findPyQtGraphObjectNameInPlotWidget(thisAxis.view, objectName)
-                img.setLevels([minX, maxX])  # Sets levels immediately
-                thisImageStack.minMax = [minX, maxX]  # ensures levels stay set during all plot updates that follow
+            # Sets levels immediately by swapping each axis's look-up table. The levels stay set during all plot updates that follow
+            thisImageStack.setLevels([minX, maxX])
+
+
+    def saveStackDisplaySettings_Slot(self):
+        """
+        Store the levels of the selected stack once the user has finished dragging the intensity region
+        """
+        ingredient = self.returnIngredientByName(self.selectedStackName())
+        if ingredient != False:
+            ingredient.saveDisplaySettings()
 
 
     def mouseMoved(self, evt):
@@ -1252,22 +1346,79 @@ class lasagna(QtGui.QMainWindow, lasagna_mainWindow.Ui_lasagna_mainWindow):
             (self.mouseX, self.mouseY) = self.axes2D[axisID].getMousePositionInCurrentView(pos)
             # Record the current axis in which the mouse is in and the position of the mouse in the stack
             self.inAxis=axisID
-            voxelPosition = [self.axes2D[axisID].currentSlice, self.mouseX, self.mouseY]
-            if axisID==1:
-                voxelPosition = [voxelPosition[1], voxelPosition[0], voxelPosition[2]]
-            elif axisID==2:
-                voxelPosition = [voxelPosition[2], voxelPosition[1], voxelPosition[0]]
+            if self.axes2D[axisID].obliquePlane is not None:
+                #mouseX and mouseY are in plane coordinates
+                voxelPosition = self.axes2D[axisID].obliquePositionInStack(self.mouseX, self.mouseY)
+            else:
+                voxelPosition = [self.axes2D[axisID].currentSlice, self.mouseX, self.mouseY]
+                if axisID==1:
+                    voxelPosition = [voxelPosition[1], voxelPosition[0], voxelPosition[2]]
+                elif axisID==2:
+                    voxelPosition = [voxelPosition[2], voxelPosition[1], voxelPosition[0]]
 
             self.mousePositionInStack = voxelPosition
 
             if QtGui.QApplication.keyboardModifiers() == QtCore.Qt.ControlModifier and self.axes2D[axisID].view.getViewBox().controlDrag:
-                self.axes2D[axisID].updateDisplayedSlices_2D(self.ingredientList, (self.mouseX, self.mouseY))
+                if self.axes2D[axisID].obliquePlane is not None:
+                    self.moveLinkedAxesToVoxel(axisID, voxelPosition)
+                else:
+                    self.axes2D[axisID].updateDisplayedSlices_2D(self.ingredientList, (self.mouseX, self.mouseY))
             self.updateMainWindowOnMouseMove(self.axes2D[axisID])
 
 
+    def moveLinkedAxesToVoxel(self, axisID, voxelPosition):
+        """
+        Show the slices that pass through voxelPosition (z,x,y) in all axes other than axisID
+        """
+        for (ii,thisAxis) in enumerate(self.axes2D):
+            if ii == axisID or thisAxis.obliquePlane is not None:
+                continue
+            thisAxis.updatePlotItems_2D(self.ingredientList, sliceToPlot=voxelPosition[thisAxis.axisToPlot])
+
+
 # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
-def main(imStackFnamesToLoad=None, sparsePointsToLoad=None, linesToLoad=None, pluginToStart=None, embedConsole=False):
+def parseArguments(argv=None):
+    """
+    Parse command-line input arguments. This is only done when lasagna is run as a script
+    so that importing lasagna neither reads sys.argv nor downloads anything.
+    """
+    import argparse
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-D", help="Load demo images", action="store_true")  # Store true makes it zero by default
+    parser.add_argument("-im", nargs='+', help="file name(s) of image stacks to load")
+    parser.add_argument("-S", nargs='+', help="file names of sparse points file(s) to load")
+    parser.add_argument("-L", nargs='+', help="file names of lines file(s) to load")
+    parser.add_argument("-T", nargs='+', help="file names of tree file(s) to load")
+    parser.add_argument("-C", help="start a ipython console", action='store_true')
+    parser.add_argument("-P", help="start plugin of this name. use string from plugins menu as the argument")
+    parser.add_argument("--profileStartup", help="report the time taken by imports and each start-up phase", action='store_true')
+    return parser.parse_args(argv)
+
+
+def downloadDemoStacks():
+    """
+    Download the demo stacks to the temporary directory if they are not already there.
+    Returns a list of the stack file names.
+    """
+    import tempfile
+    import urllib.request, urllib.parse, urllib.error
+
+    imStackFnamesToLoad = [tempfile.gettempdir()+os.path.sep+'reference.tiff',
+              tempfile.gettempdir()+os.path.sep+'sample.tiff']
+
+    loadUrl = 'http://mouse.vision/lasagna/'
+    for fname in imStackFnamesToLoad:
+        if not os.path.exists(fname):
+            url = loadUrl + fname.split(os.path.sep)[-1]
+            print(('Downloading %s to %s' % (url,fname)))
+            urllib.request.urlretrieve(url,fname)
+
+    return imStackFnamesToLoad
+
+
+def main(imStackFnamesToLoad=None, sparsePointsToLoad=None, linesToLoad=None, treesToLoad=None, pluginToStart=None, embedConsole=False):
     app = QtGui.QApplication([])
+    startupProfiler.phase('create QApplication')
 
     tasty = lasagna()
     tasty.app = app
@@ -1294,6 +1445,7 @@ def main(imStackFnamesToLoad=None, sparsePointsToLoad=None, linesToLoad=None, pl
             tasty.loadActions['tree_reader'].showLoadDialog(thisFname)
 
     tasty.initialiseAxes()
+    startupProfiler.phase('load data')
 
     if pluginToStart != None:
         if pluginToStart in tasty.plugins:
@@ -1319,9 +1471,24 @@ def main(imStackFnamesToLoad=None, sparsePointsToLoad=None, linesToLoad=None, pl
         from IPython import embed
         embed()
 
+    # The report is printed once the event loop starts, which is after the window is first painted
+    if startupProfiler.enabled():
+        def reportStartup():
+            startupProfiler.phase('first paint')
+            startupProfiler.report()
+        QtCore.QTimer.singleShot(0, reportStartup)
+
     sys.exit(app.exec_())
 
 # Start Qt event loop unless running in interactive mode.
 if __name__ == '__main__':
-    main(imStackFnamesToLoad=imStackFnamesToLoad, sparsePointsToLoad=sparsePointsToLoad, linesToLoad=linesToLoad,
-         pluginToStart=pluginToStart, embedConsole=args.C)
+    args = parseArguments()
+
+    # Either load the demo stacks or a user-specified stacks
+    if args.D == True:
+        imStackFnamesToLoad = downloadDemoStacks()
+    else:
+        imStackFnamesToLoad = args.im
+
+    main(imStackFnamesToLoad=imStackFnamesToLoad, sparsePointsToLoad=args.S, linesToLoad=args.L, treesToLoad=args.T,
+         pluginToStart=args.P, embedConsole=args.C)
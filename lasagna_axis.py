@@ -4,7 +4,9 @@ this file describes a class that handles the axis behavior for the lasagna viewe
 
 import lasagna_helperFunctions as lasHelp
 import pyqtgraph as pg
+import numpy as np
 import ingredients
+from imageProcessing import obliqueSlice
 
 class projection2D():
 
@@ -44,9 +46,22 @@ class projection2D():
         #The currently plotted slice
         self.currentSlice=None
 
+        #Large image planes are cropped to the visible area plus a margin before they are plotted. 
+        #cropRect is the region (xMin,xMax,yMin,yMax) used for the last redraw. See visibleCropRect.
+        self.cropRect=None
+        self.cropMargin=lasHelp.readPreference('viewCropMargin')
+        self._recropping=False
+
+        #An oblique plane may be shown instead of the slices along axisToPlot. This is None or a dictionary
+        #with keys 'normal', 'offset' and 'interpolate' (see setObliquePlane and imageProcessing.obliqueSlice)
+        self.obliquePlane=None
+
         #Link the progressLayer signal to a slot that will move through image layers as the wheel is turned
         self.view.getViewBox().progressLayer.connect(self.wheel_layer_slot)
 
+        #Oblique planes are sampled only where they are visible so we re-sample on pan and zoom
+        self.view.getViewBox().sigRangeChanged.connect(self.viewRangeChanged_slot)
+
 
     def addItemToPlotWidget(self,ingredient):
         """
@@ -173,6 +188,12 @@ class projection2D():
         """
         verbose=False 
 
+        if self.obliquePlane is not None:
+            self.updateObliquePlotItems_2D(ingredientsList)
+            return
+
+        self.cropRect = self.visibleCropRect()
+
         # loop through all plot items searching for imagestack items (these need to be plotted first)
         for thisIngredient in ingredientsList:
             if isinstance(thisIngredient, ingredients.imagestack.imagestack):
@@ -199,7 +220,8 @@ class projection2D():
                 thisIngredient.plotIngredient(
                                             pyqtObject=lasHelp.findPyQtGraphObjectNameInPlotWidget(self.view,thisIngredient.objectName,verbose=verbose), 
                                             axisToPlot=self.axisToPlot, 
-                                            sliceToPlot=self.currentSlice
+                                            sliceToPlot=self.currentSlice,
+                                            cropRect=self.cropRect
                                             )
                 # * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * *
 
@@ -216,6 +238,77 @@ class projection2D():
                                               sliceToPlot=self.currentSlice
                                               )
 
+    def updatePlotItem_2D(self, thisIngredient):
+        """
+        Redraw one non-image ingredient on the current slice, leaving the other plot items as they are
+        """
+        if self.obliquePlane is not None or self.currentSlice is None:
+            return
+        thisIngredient.plotIngredient(pyqtObject=lasHelp.findPyQtGraphObjectNameInPlotWidget(self.view,thisIngredient.objectName),
+                                      axisToPlot=self.axisToPlot,
+                                      sliceToPlot=self.currentSlice)
+
+
+    def updateObliquePlotItems_2D(self, ingredientsList):
+        """
+        Draw the image stacks sampled along self.obliquePlane. Only the visible part of the plane is
+        sampled, with one sample per screen pixel (but never more than one per voxel). Points and lines 
+        are defined in the stack's coordinates so they are hidden whilst an oblique plane is shown.
+        """
+        viewBox = self.view.getViewBox()
+        viewRange = viewBox.viewRange()
+        step = max(1.0, min(viewBox.viewPixelSize()))
+
+        for thisIngredient in ingredientsList:
+            pyqtObject = lasHelp.findPyQtGraphObjectNameInPlotWidget(self.view,thisIngredient.objectName)
+            if pyqtObject == False:
+                continue
+
+            if isinstance(thisIngredient, ingredients.imagestack.imagestack):
+                thisIngredient.plotObliquePlane(pyqtObject, self.obliquePlane, viewRange=viewRange, step=step)
+            else:
+                pyqtObject.setVisible(False)
+
+
+    def setObliquePlane(self, normal, offset, interpolate=True):
+        """
+        Show the plane dot(normal,p)==offset in this axis instead of slices along self.axisToPlot.
+        normal and offset are in voxel coordinates of the image stacks (z,x,y). If interpolate is
+        False, nearest voxel sampling is used. This is faster, so is useful whilst the plane is 
+        being moved interactively.
+        """
+        self.obliquePlane = dict(normal=obliqueSlice.normalise(normal), offset=float(offset), interpolate=interpolate)
+        self.updatePlotItems_2D(self.lasagna.ingredientList)
+
+
+    def setObliquePlaneFromPoints(self, p1, p2, p3, interpolate=True):
+        """
+        Show the plane that passes through three points defined in voxel coordinates (z,x,y)
+        """
+        (normal,offset) = obliqueSlice.planeFromPoints(p1,p2,p3)
+        self.setObliquePlane(normal, offset, interpolate)
+
+
+    def clearObliquePlane(self):
+        """
+        Go back to showing slices along self.axisToPlot
+        """
+        if self.obliquePlane is None:
+            return
+        self.obliquePlane = None
+        for thisItem in self.items:
+            thisItem.setVisible(True) #ingredients hide their own items again if they have nothing to show
+        self.updatePlotItems_2D(self.lasagna.ingredientList)
+
+
+    def obliquePositionInStack(self, X, Y):
+        """
+        Convert a position (X,Y) in the oblique plane to a voxel position (z,x,y) in the image stacks
+        """
+        position = obliqueSlice.planeToVolume(self.obliquePlane['normal'], self.obliquePlane['offset'], X, Y)
+        return [int(round(p)) for p in position]
+
+
     def updateDisplayedSlices_2D(self, ingredients, slicesToPlot):
         """
         Update the image planes shown in each of the axes
@@ -237,11 +330,56 @@ class projection2D():
         return (X,Y)
 
 
+    def visibleCropRect(self):
+        """
+        Return (xMin,xMax,yMin,yMax), the visible area of the view expanded on each side by 
+        self.cropMargin times its width and height. Image planes are cropped to this region.
+        """
+        ((xMin,xMax),(yMin,yMax)) = self.view.getViewBox().viewRange()
+        xPad = (xMax-xMin)*self.cropMargin
+        yPad = (yMax-yMin)*self.cropMargin
+        return (int(np.floor(xMin-xPad)), int(np.ceil(xMax+xPad)), 
+                int(np.floor(yMin-yPad)), int(np.ceil(yMax+yPad)))
+
+
+    def cropRectNeedsUpdate(self):
+        """
+        True if the view has moved outside of the cropped region last plotted or if it has zoomed in
+        so far that the cropped region is much larger than it needs to be
+        """
+        if self.cropRect is None:
+            return True
+
+        ((xMin,xMax),(yMin,yMax)) = self.view.getViewBox().viewRange()
+        (cropXmin,cropXmax,cropYmin,cropYmax) = self.cropRect
+        if xMin<cropXmin or xMax>cropXmax or yMin<cropYmin or yMax>cropYmax:
+            return True
+
+        (newXmin,newXmax,newYmin,newYmax) = self.visibleCropRect()
+        return (cropXmax-cropXmin)*(cropYmax-cropYmin) > 4*(newXmax-newXmin)*(newYmax-newYmin)
+
+
+    def dataExtent(self):
+        """
+        Return the (width,height) of the largest image plane shown in this axis or None if there are no image stacks
+        """
+        stacks = self.lasagna.returnIngredientByType('imagestack')
+        if stacks == False or len(stacks)==0:
+            return None
+        shapes = [thisStack.data(self.axisToPlot).shape[1:3] for thisStack in stacks]
+        return (max([s[0] for s in shapes]), max([s[1] for s in shapes]))
+
+
     def resetAxes(self):
         """
         Set the X and Y limits of the axis to nicely frame the data 
         """
-        self.view.autoRange()
+        #The image items may be cropped so we frame the full extent of the data rather than the items
+        extent = self.dataExtent()
+        if extent is None or self.obliquePlane is not None:
+            self.view.autoRange()
+            return
+        self.view.getViewBox().setRange(xRange=(0,extent[0]), yRange=(0,extent[1]))
 
 
     #------------------------------------------------------
@@ -251,7 +389,49 @@ class projection2D():
         Handle the wheel action that allows the user to move through stack layers
         """
 
+        if self.obliquePlane is not None:
+            #Move the oblique plane along its normal
+            self.obliquePlane['offset'] += self.view.getViewBox().progressBy
+            self.updatePlotItems_2D(self.lasagna.ingredientList)
+            return
+
         self.updatePlotItems_2D(self.lasagna.ingredientList,sliceToPlot=round(self.currentSlice + self.view.getViewBox().progressBy)) #round creates an int that supresses a warning in p3
 
 
+    def viewRangeChanged_slot(self):
+        """
+        Re-sample the oblique plane (if one is shown) when the visible area changes. Otherwise
+        re-extract the image planes only if the view has left the cropped region and redraw
+        lines whose level of detail depends on the zoom.
+        """
+        if self.obliquePlane is not None:
+            self.updatePlotItems_2D(self.lasagna.ingredientList)
+            return
+
+        if self.currentSlice is None:
+            return
+
+        #Lines are simplified when zoomed out, so a zoom may call for a different level of detail
+        pixelSize = max(self.view.getViewBox().viewPixelSize())
+        for thisIngredient in self.lasagna.ingredientList:
+            if hasattr(thisIngredient,'needsRedraw') and thisIngredient.needsRedraw(self.axisToPlot, pixelSize):
+                thisIngredient.plotIngredient(pyqtObject=lasHelp.findPyQtGraphObjectNameInPlotWidget(self.view,thisIngredient.objectName),
+                                              axisToPlot=self.axisToPlot,
+                                              sliceToPlot=self.currentSlice)
+
+        if not self.cropRectNeedsUpdate():
+            return
+
+        #Replacing the images changes their bounds, which can change the range of an auto-ranging view
+        if self._recropping:
+            return
+        self._recropping = True
+        try:
+            stacks = [thisIngredient for thisIngredient in self.lasagna.ingredientList 
+                        if isinstance(thisIngredient, ingredients.imagestack.imagestack)]
+            self.updatePlotItems_2D(stacks, sliceToPlot=self.currentSlice)
+        finally:
+            self._recropping = False
+
+
 
@@ -7,7 +7,12 @@ Helper functions for lasagna. Functions in this file are involved in the followi
 
 import os
 import string
+import copy
+import tempfile
+import atexit
+import threading
 import yaml   #Preferences are stored in a YAML file
+import pyqtgraph as pg
 
 
 # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
@@ -67,6 +72,26 @@ def findPyQtGraphObjectNameInPlotWidget(PlotWidget,itemName,regex=False,verbose=
     return False
 
 
+# - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+def imageItemIndexAtViewPosition(imageItem,X,Y):
+    """
+    Return the (row,column) of imageItem.image that lies under position (X,Y) in view coordinates
+    or None if the position is outside the image. This takes account of the image's position in 
+    the view, which is not (0,0) if the image has been cropped (see imagestack.plotIngredient).
+    """
+    if imageItem.image is None:
+        return None
+
+    point = imageItem.mapFromView(pg.QtCore.QPointF(X+0.5,Y+0.5)) #The middle of the pixel at X,Y
+    row = int(point.x()//1)
+    column = int(point.y()//1)
+    imShape = imageItem.image.shape
+    if row<0 or column<0 or row>=imShape[0] or column>=imShape[1]:
+        return None
+
+    return (row,column)
+
+
 # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
 # Functions that find and define paths for handling plugins and preferences
 def getHomeDir():
@@ -162,6 +187,8 @@ def defaultPreferences():
                              absPathToLasagna()+'ARA'], #must be asbolute paths
             'defaultAxisRatios' : [1,2,0.5],         #The default axis ratios
             'defaultPointZSpread' : [5,5,3],         #The range of layers over which points or lines are visible
+            'defaultSlabHalfWidth' : [5,5,5],        #Slab projections cover the current layer +/- this many layers
+            'viewCropMargin' : 0.5,                  #Image planes are cropped to the visible area plus this fraction of its size on each side
             'showCrossHairs' : True,                 #Whether or not to show the cross hairs 
             'colorOrder' : ['red','green','blue','magenta','cyan','yellow','gray'], #The order in which colors appear by default (see imagestack class)
             'symbolOrder' : ['o','s','t','d','+'],
@@ -187,28 +214,150 @@ main lasagna preferences file. However, this can be over-ridden so that indiviua
 their own preferences files and still use these functions. 
 """
 
+class preferenceFile(object):
+    """
+    The contents of one preferences file, held in memory and shared by everything in the process
+    that reads or writes that file. The file is only re-read if its modification time changes 
+    (e.g. if the user edits it). Changes are written after a short delay, so that a burst of 
+    changes results in a single write, and when lasagna exits. Writes are atomic: the YAML is 
+    written to a temporary file that then replaces the preferences file.
+    Use preferenceFileFor() rather than making instances directly.
+    """
+    writeDelay = 0.5 #seconds
+
+    def __init__(self,prefFName):
+        self.prefFName = prefFName
+        self.preferences = None
+        self.mtime = None
+        self.dirty = False #True if there are changes not yet written to disk
+        self._timer = None
+        self._lock = threading.RLock()
+
+
+    def read(self,defaultPref=None):
+        """
+        Return the preferences dictionary (not a copy). If the file is missing it is created from defaultPref.
+        """
+        with self._lock:
+            if self.dirty: #The in-memory copy is newer than the file
+                return self.preferences
+
+            if not os.path.exists(self.prefFName):
+                if defaultPref is None:
+                    defaultPref = defaultPreferences()
+                print("PREF FILE")
+                print(self.prefFName)
+                self.preferences = copy.deepcopy(defaultPref)
+                self.dirty = True
+                self.flush() #Write straight away so the user can find and edit the file
+                print("Created default preferences file in " + self.prefFName)
+                return self.preferences
+
+            mtime = os.stat(self.prefFName).st_mtime_ns
+            if self.preferences is None or mtime != self.mtime:
+                with open(self.prefFName, 'r') as stream: 
+                    self.preferences = yaml.load(stream, Loader=getattr(yaml,'FullLoader',yaml.Loader))
+                if self.preferences is None: #empty file
+                    self.preferences = dict()
+                self.mtime = mtime
+
+            return self.preferences
+
+
+    def set(self,preferenceName,newValue):
+        with self._lock:
+            self.read()
+            self.preferences[preferenceName] = copy.deepcopy(newValue)
+            self.dirty = True
+            self.scheduleWrite()
+
+
+    def replace(self,preferences):
+        with self._lock:
+            self.preferences = copy.deepcopy(preferences)
+            self.dirty = True
+            self.scheduleWrite()
+
+
+    def scheduleWrite(self):
+        """
+        Write to disk after writeDelay seconds. Further changes within this time postpone the write.
+        """
+        with self._lock:
+            if self._timer is not None:
+                self._timer.cancel()
+            self._timer = threading.Timer(self.writeDelay, self.flush)
+            self._timer.daemon = True
+            self._timer.start()
+
+
+    def flush(self):
+        """
+        Write any unsaved changes to disk now
+        """
+        with self._lock:
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+            if not self.dirty:
+                return
+
+            #A unique temporary file so that several lasagna processes can not clash
+            tmpFName = None
+            try:
+                (handle,tmpFName) = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(self.prefFName)), suffix='.tmp')
+                with os.fdopen(handle, 'w') as stream:
+                    yaml.dump(self.preferences, stream)
+                os.replace(tmpFName, self.prefFName)
+            except Exception as e:
+                #The preferences stay dirty, so flushPreferences tries again on exit
+                print("Failed to write preferences file %s: %s" % (self.prefFName,str(e)))
+                if tmpFName is not None and os.path.exists(tmpFName):
+                    os.remove(tmpFName)
+                return
+
+            self.mtime = os.stat(self.prefFName).st_mtime_ns
+            self.dirty = False
+
+
+_preferenceFiles = dict() #preferenceFile instances keyed by absolute file name
+_preferenceFilesLock = threading.Lock()
+
+def preferenceFileFor(prefFName=getLasagnaPrefFile()):
+    """
+    Return the shared preferenceFile instance that handles the file prefFName
+    """
+    prefFName = os.path.abspath(prefFName)
+    with _preferenceFilesLock:
+        if prefFName not in _preferenceFiles:
+            _preferenceFiles[prefFName] = preferenceFile(prefFName)
+        return _preferenceFiles[prefFName]
+
+
+def flushPreferences():
+    """
+    Write all unsaved preference changes to disk. This is run automatically when lasagna exits.
+    """
+    for thisFile in list(_preferenceFiles.values()):
+        thisFile.flush()
+
+atexit.register(flushPreferences)
+
+
 def loadAllPreferences(prefFName=getLasagnaPrefFile(),defaultPref=defaultPreferences()):
     """
     Load the preferences YAML file. If the file is missing, we create it using the default
     preferences defined above. Preferences are returned as a dictionary.
+    The file is only read from disk if it has changed since it was last read. The returned
+    dictionary is a copy, so changing it does not change the preferences.
     """
-    #print "loading from pref file %s" % prefFName
-    #Generate a default preferences file if no preferences file exists
-    if os.path.exists(prefFName) == False:
-        print("PREF FILE")
-        print(prefFName)
-        writeAllPreferences(defaultPref,prefFName=prefFName)
-        print("Created default preferences file in " + prefFName)
-
-    #Load preferences YAML file as a dictionary
-    with open(prefFName, 'r') as stream: 
-        return yaml.load(stream)
+    return copy.deepcopy(preferenceFileFor(prefFName).read(defaultPref))
 
 
 
 def readPreference(preferenceName,prefFName=getLasagnaPrefFile(), preferences=getLasagnaPrefFile()):
     """
-    Read preferences with key "preferenceName" from YAML file prefFName on disk.
+    Read preferences with key "preferenceName" from YAML file prefFName.
     If the key is abstent, call defaultPreferences and search for the key. If it
     is present, add to preferences file and return the value. If absent, raise a
     warning and return None. The caller function needs to decide what to do with 
@@ -217,10 +366,10 @@ def readPreference(preferenceName,prefFName=getLasagnaPrefFile(), preferences=ge
     
     #TODO: need some sort of check as to whether the preference value is valid
     
-    #Check on disk
-    preferences = loadAllPreferences(prefFName)
+    #Check the (cached) file
+    preferences = preferenceFileFor(prefFName).read()
     if preferenceName in preferences:
-        return preferences[preferenceName]
+        return copy.deepcopy(preferences[preferenceName])
     else:
         print("Did not find preference %s on disk. Looking in defaultPreferencesa" % preferenceName)
 
@@ -237,13 +386,10 @@ def readPreference(preferenceName,prefFName=getLasagnaPrefFile(), preferences=ge
 def writeAllPreferences(preferences,prefFName=getLasagnaPrefFile()):
     """
     Save the dictionary "preferences" as a YAML file in the .lasagna directory located in the 
-    user's home directory. 
+    user's home directory. The file is written shortly afterwards (see preferenceFile).
     """
     assert isinstance(preferences,dict)
-
-    #TODO: check ability to write to the file before proceeding
-    with open(prefFName, 'w') as stream:
-        yaml.dump(preferences, stream)
+    preferenceFileFor(prefFName).replace(preferences)
 
 
 def preferenceWriter(preferenceName,newValue,prefFName=getLasagnaPrefFile()):
@@ -252,11 +398,8 @@ def preferenceWriter(preferenceName,newValue,prefFName=getLasagnaPrefFile()):
     Saves updates dictionary to the preferences file
     """
     print("Writing preference data for: %s\n" % preferenceName)
-    preferences = loadAllPreferences(prefFName)
-    if preferenceName in preferences:
-        preferences[preferenceName] = newValue
-    else:
+    thisFile = preferenceFileFor(prefFName)
+    if preferenceName not in thisFile.read():
         print("Adding missing preference %s to preferences file" % preferenceName)
-        preferences[preferenceName] = newValue
 
-    writeAllPreferences(preferences,prefFName)
+    thisFile.set(preferenceName,newValue)
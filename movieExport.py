@@ -0,0 +1,210 @@
+#! /usr/bin/env python3
+
+"""
+Export fly-through movies that sweep through image stacks, with points and lines overlaid.
+
+Frames are rendered by snapshot.renderView on the compute pool (see backgroundWorker) and written
+in order, as they finish, to a movie encoder (ffmpeg) or to a numbered sequence of PNG files. Only a
+few frames are held in memory at once, whatever the length of the sweep.
+
+From the command line:
+python movieExport.py -im sample.tiff reference.tiff --luts red gray -S cells.csv --axes 1 2 3 -o sweep.mp4
+From the GUI use the "movieExport" plugin.
+"""
+
+import os
+import shutil
+import subprocess
+import collections
+import numpy as np
+
+import backgroundWorker
+import imageStackLoader
+import snapshot
+
+
+movieExtensions = ('.mp4', '.avi', '.mov', '.mkv')
+
+
+class imageSequenceWriter(object):
+    """
+    Writes each frame to a numbered PNG file in directory outDir
+    """
+    def __init__(self, outDir, stem='frame'):
+        self.outDir = outDir
+        self.stem = stem
+        self.nFrames = 0
+        if not os.path.exists(outDir):
+            os.makedirs(outDir)
+
+    def write(self, rgb):
+        snapshot.writePNG(os.path.join(self.outDir, "%s_%05d.png" % (self.stem,self.nFrames)), rgb)
+        self.nFrames += 1
+
+    def close(self):
+        pass
+
+
+class ffmpegWriter(object):
+    """
+    Streams frames into an ffmpeg process that encodes the movie fname. ffmpeg is started
+    when the first frame arrives, as that is when the frame size is known.
+    """
+    def __init__(self, fname, fps=25, ffmpeg='ffmpeg'):
+        self.fname = fname
+        self.fps = fps
+        self.ffmpeg = ffmpeg
+        self.process = None
+        self.nFrames = 0
+
+    def write(self, rgb):
+        if self.process is None:
+            (height,width) = rgb.shape[:2]
+            command = [self.ffmpeg, '-y', '-loglevel', 'error',
+                       '-f', 'rawvideo', '-pix_fmt', 'rgb24', '-s', '%dx%d' % (width,height), '-r', str(self.fps), '-i', '-',
+                       '-vf', 'pad=ceil(iw/2)*2:ceil(ih/2)*2', '-pix_fmt', 'yuv420p', self.fname] #most codecs need even sizes
+            self.process = subprocess.Popen(command, stdin=subprocess.PIPE)
+        self.process.stdin.write(np.ascontiguousarray(rgb).tobytes())
+        self.nFrames += 1
+
+    def close(self):
+        if self.process is None:
+            return
+        self.process.stdin.close()
+        if self.process.wait() != 0:
+            print("movieExport: ffmpeg failed to write %s" % self.fname)
+        self.process = None
+
+
+def frameWriter(fname, fps=25):
+    """
+    Return a writer for fname. Movie files (see movieExtensions) are encoded with ffmpeg if it is
+    installed. Otherwise frames are written as a PNG sequence to a directory named after fname.
+    """
+    (stem,extension) = os.path.splitext(fname)
+    if extension.lower() in movieExtensions:
+        ffmpeg = shutil.which('ffmpeg')
+        if ffmpeg is not None:
+            return ffmpegWriter(fname, fps=fps, ffmpeg=ffmpeg)
+        print("movieExport: ffmpeg not found. Writing frames to %s instead of a movie" % stem)
+        return imageSequenceWriter(stem, stem=os.path.basename(stem))
+
+    return imageSequenceWriter(fname)
+
+
+def renderSweep(stacks, axisToPlot, slices, writer, points=(), lines=(), maxFramesInFlight=None,
+                progress=None, cancelled=None, **viewArgs):
+    """
+    Render the view along axisToPlot at each slice in slices and pass the frames, in order, to writer.
+    stacks, points, lines, viewArgs - as for snapshot.renderView
+    maxFramesInFlight - the most frames rendered but not yet written. Defaults to twice the number of workers.
+    progress - optional function called with the number of frames written so far
+    cancelled - optional function that returns True to stop the sweep early
+    Frames are rendered on the compute pool, so this must not itself run on the compute pool.
+    Returns the number of frames written.
+    """
+    stacks = [snapshot.prepareStack(thisStack) for thisStack in stacks] #Once here rather than once per frame
+    if maxFramesInFlight is None:
+        maxFramesInFlight = 2*backgroundWorker.numWorkers()
+
+    pool = backgroundWorker.computePool()
+    pending = collections.deque()
+    nWritten = 0
+
+    def writeOldest():
+        nonlocal nWritten
+        writer.write(pending.popleft().result())
+        nWritten += 1
+        if progress is not None:
+            progress(nWritten)
+
+    for sliceToPlot in slices:
+        if cancelled is not None and cancelled():
+            break
+        pending.append(pool.submit(snapshot.renderView, stacks, axisToPlot, sliceToPlot, points, lines, **viewArgs))
+        if len(pending) >= maxFramesInFlight:
+            writeOldest()
+
+    while len(pending) > 0:
+        if cancelled is not None and cancelled():
+            for thisFrame in pending:
+                thisFrame.cancel()
+            break
+        writeOldest()
+
+    return nWritten
+
+
+def sweepFileName(fname, axisToPlot, nAxes):
+    """
+    The output name for a sweep along axisToPlot. If more than one axis is swept each gets its own file.
+    """
+    if nAxes == 1:
+        return fname
+    (stem,extension) = os.path.splitext(fname)
+    return "%s_view%d%s" % (stem,axisToPlot+1,extension)
+
+
+def exportSweeps(stacks, axes, fname, sliceRange=None, step=1, fps=25, points=(), lines=(),
+                 progress=None, cancelled=None, **viewArgs):
+    """
+    Sweep along each axis in axes, writing one movie (or frame sequence) per axis.
+    sliceRange - (first,last) slice, inclusive. Defaults to the whole of the first stack.
+    Returns a list of the files or directories written.
+    """
+    written = []
+    for axisToPlot in axes:
+        nSlices = stacks[0]['data'].shape[axisToPlot]
+        (first,last) = (0,nSlices-1) if sliceRange is None else sliceRange
+        slices = range(max(first,0), min(last,nSlices-1)+1, max(step,1))
+
+        thisFname = sweepFileName(fname, axisToPlot, len(axes))
+        writer = frameWriter(thisFname, fps=fps)
+        try:
+            renderSweep(stacks, axisToPlot, slices, writer, points=points, lines=lines,
+                        progress=progress, cancelled=cancelled, **viewArgs)
+        finally:
+            writer.close()
+        written.append(thisFname if isinstance(writer,ffmpegWriter) else writer.outDir)
+
+        if cancelled is not None and cancelled():
+            break
+
+    return written
+
+
+# - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+def main(argv=None):
+    import argparse
+    parser = argparse.ArgumentParser(description="Export fly-through movies of image stacks")
+    parser.add_argument("-im", nargs='+', required=True, help="file name(s) of image stacks to add together")
+    parser.add_argument("--luts", nargs='+', default=[], help="colour map of each stack (default gray)")
+    parser.add_argument("-S", nargs='+', default=[], help="file names of sparse points file(s) to overlay")
+    parser.add_argument("-L", nargs='+', default=[], help="file names of lines file(s) to overlay")
+    parser.add_argument("-o", required=True, help="movie file (e.g. sweep.mp4) or directory for a PNG sequence")
+    parser.add_argument("--axes", nargs='+', type=int, default=[1], help="the views to sweep through (1, 2 and/or 3)")
+    parser.add_argument("--range", nargs=2, type=int, default=None, help="first and last slice")
+    parser.add_argument("--step", type=int, default=1, help="slices between frames")
+    parser.add_argument("--fps", type=float, default=25, help="frames per second")
+    parser.add_argument("--zoom", type=int, default=1, help="output pixels per voxel")
+    args = parser.parse_args(argv)
+
+    stacks = []
+    for (ii,fname) in enumerate(args.im):
+        volume = imageStackLoader.loadStack(fname)
+        if volume is False or volume is None:
+            print("movieExport failed to load %s" % fname)
+            return
+        lut = args.luts[ii] if ii < len(args.luts) else 'gray'
+        stacks.append({'data':volume, 'minMax':snapshot.stackLevels(fname,volume), 'lut':lut})
+
+    points = [{'data':snapshot.readPoints(fname)} for fname in args.S]
+    lines = [{'data':snapshot.readLines(fname)} for fname in args.L]
+
+    written = exportSweeps(stacks, [ax-1 for ax in args.axes], args.o, sliceRange=args.range, step=args.step, fps=args.fps,
+                           points=points, lines=lines, zoom=args.zoom)
+    print("Wrote %s" % ", ".join(written))
+
+
+if __name__ == '__main__':
+    main()
@@ -1,9 +1,17 @@
 
 """
 Methods to handle finding of plugins, etc
+
+Plugins are not imported at startup. Instead, each plugin file is parsed (without being run)
+to find what is needed to build the menus. This information is stored in a manifest file in 
+the lasagna preferences directory so files are only re-parsed when they change. A plugin's 
+module is imported when the plugin is first started.
 """
 
-from os import path, listdir 
+from os import path, listdir, stat, replace
+import ast
+import json
+import lasagna_helperFunctions as lasHelp
 
 def findPlugins(pluginPaths):
     """
@@ -48,3 +56,158 @@ def getPluginInstanceFromFileName(fileName,attributeToImport='plugin'):
         returnedAttribute = importedModule
 
     return (returnedAttribute, moduleName) #return the plugin object and optionally the module name
+
+
+
+# - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - 
+# Plugin manifest
+manifestVersion = 1
+
+def manifestFileName():
+    return lasHelp.getLasagna_prefDir() + 'pluginManifest.json'
+
+
+def describePlugin(fileName):
+    """
+    Parse (but do not import) the plugin file fileName and return a dictionary describing it:
+    kind - 'plugin' if the file defines a plugin class, 'loader' if it defines an IO loaderClass, otherwise None
+    objectName, menuText, icon - for loaders, the values assigned to self.objectName, 
+                                 passed to setText, and passed to QPixmap. None if not found.
+    """
+    description = dict(kind=None, objectName=None, menuText=None, icon=None)
+    try:
+        with open(fileName, 'r') as stream:
+            tree = ast.parse(stream.read(), fileName)
+    except (SyntaxError, UnicodeDecodeError) as e:
+        print("Failed to parse plugin %s: %s" % (fileName,str(e)))
+        return description
+
+    classNames = [node.name for node in tree.body if isinstance(node, ast.ClassDef)]
+    if 'loaderClass' in classNames:
+        description['kind'] = 'loader'
+    elif 'plugin' in classNames:
+        description['kind'] = 'plugin'
+        return description
+    else:
+        return description
+
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Assign) and _isString(node.value):
+            for target in node.targets:
+                if isinstance(target, ast.Attribute) and target.attr == 'objectName' and description['objectName'] is None:
+                    description['objectName'] = _stringValue(node.value)
+
+        elif isinstance(node, ast.Call) and isinstance(node.func, ast.Attribute) and len(node.args)>0 and _isString(node.args[0]):
+            if node.func.attr == 'setText' and description['menuText'] is None:
+                description['menuText'] = _stringValue(node.args[0])
+            elif node.func.attr == 'QPixmap' and description['icon'] is None:
+                description['icon'] = _stringValue(node.args[0])
+
+    return description
+
+
+def _isString(node):
+    return (isinstance(node, ast.Constant) and isinstance(node.value, str)) or type(node).__name__ == 'Str'
+
+
+def _stringValue(node):
+    return node.value if isinstance(node, ast.Constant) else node.s
+
+
+def pluginManifest(pluginPaths):
+    """
+    Return a list of dictionaries, one per plugin file in pluginPaths, describing each plugin (see describePlugin)
+    plus the keys 'file', 'module', 'directory', and 'dirName'. Descriptions are read from the manifest file
+    and only files that have changed since the manifest was written are parsed.
+    """
+    manifestFile = manifestFileName()
+    cached = dict()
+    if path.exists(manifestFile):
+        try:
+            with open(manifestFile, 'r') as stream:
+                contents = json.load(stream)
+            if contents.get('version') == manifestVersion:
+                cached = contents['plugins']
+        except (ValueError, KeyError, IOError) as e:
+            print("Ignoring unreadable plugin manifest %s: %s" % (manifestFile,str(e)))
+
+    (plugins,pluginDirectories) = findPlugins(pluginPaths)
+
+    entries = []
+    changed = False
+    for thisDirectory in pluginDirectories:
+        for thisPlugin in sorted(listdir(thisDirectory)):
+            if thisPlugin not in plugins or not thisPlugin.endswith('_plugin.py'):
+                continue
+
+            fileName = path.abspath(path.join(thisDirectory,thisPlugin))
+            mtime = stat(fileName).st_mtime_ns
+
+            entry = cached.get(fileName)
+            if entry is None or entry['mtime'] != mtime:
+                entry = describePlugin(fileName)
+                entry['mtime'] = mtime
+                changed = True
+            cached[fileName] = entry
+
+            entry = dict(entry)
+            entry['file'] = thisPlugin
+            entry['module'] = thisPlugin[:-len('.py')]
+            entry['directory'] = thisDirectory
+            entry['dirName'] = thisDirectory.split(path.sep)[-1]
+            entries.append(entry)
+
+    if changed:
+        try:
+            tmpFile = manifestFile + '.tmp'
+            with open(tmpFile, 'w') as stream:
+                json.dump({'version':manifestVersion, 'plugins':cached}, stream, indent=1)
+            replace(tmpFile, manifestFile)
+        except IOError as e:
+            print("Failed to write plugin manifest %s: %s" % (manifestFile,str(e)))
+
+    return entries
+
+
+class lazyLoaders(object):
+    """
+    Dictionary-like access to IO loader instances, keyed by the loader's objectName. 
+    Each loader module is imported and the loader instantiated the first time it is requested.
+    Loaders add their own load action to the menu when they are instantiated. lasagna has already 
+    added a placeholder action for each loader, so the loader's own action is removed. 
+    """
+    def __init__(self,lasagna):
+        self.lasagna = lasagna
+        self.entries = dict() #manifest entries of loaders not yet instantiated
+        self.instances = dict()
+
+
+    def addEntry(self,entry):
+        self.entries[entry['objectName']] = entry
+
+
+    def addInstance(self,instance):
+        self.instances[instance.objectName] = instance
+
+
+    def __getitem__(self,objectName):
+        if objectName not in self.instances:
+            entry = self.entries[objectName]
+            IOclass, IOname = getPluginInstanceFromFileName(entry['file'],attributeToImport='loaderClass')
+            instance = IOclass(self.lasagna)
+            self.lasagna.menuLoad_ingredient.removeAction(instance.loadAction)
+            self.instances[objectName] = instance
+            print("Imported %s" % IOname)
+        return self.instances[objectName]
+
+
+    def __contains__(self,objectName):
+        return objectName in self.instances or objectName in self.entries
+
+
+    def keys(self):
+        return list(set(self.entries.keys()) | set(self.instances.keys()))
+
+
+    def __iter__(self):
+        return iter(self.keys())
@@ -0,0 +1,367 @@
+#! /usr/bin/env python3
+
+"""
+Render orthogonal views of image stacks, with points and lines overlaid, to PNG files without a window.
+
+This is intended for batch quality control, e.g. of many brains registered to the same atlas:
+python snapshot.py -im brain1.tiff brain2.tiff -S cells.csv -L tracts.csv -o ./qc -j 4
+
+Each image file is one job. Jobs run in parallel worker processes and each writes one PNG per view.
+Images are coloured with the same look-up tables as the GUI (see imageProcessing.display), so a
+snapshot shows what lasagna would show at one pixel per voxel. The display range is the one last
+chosen in lasagna for that file (see statsCache) or, failing that, lasagna's default range.
+Stacks are added together as in the GUI. Points and lines are drawn as in the GUI, fading with
+distance from the plotted slice.
+"""
+
+import os
+import zlib
+import struct
+import numpy as np
+
+import imageStackLoader
+import statsCache
+import lasagna_helperFunctions as lasHelp
+from imageProcessing import histogram, display, sliceIndex
+from IO.text_io import read_numeric_text
+from IO.points_io import lines_from_series
+
+
+# - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+# Loading
+def readPoints(fname):
+    """
+    Read a sparse points file (z,x,y[,series] per row) and return an n by 3 array
+    """
+    if fname.endswith('.pts'):
+        from IO.elastix_io import read_pts_file
+        return np.asarray(read_pts_file(fname)[0], dtype=float).reshape(-1,3)
+    data = read_numeric_text(fname)
+    if data is None or (len(data)>0 and data.shape[1]<3):
+        raise ValueError("%s should have at least three values (z,x,y) in every row" % fname)
+    return data[:,:3]
+
+
+def readLines(fname):
+    """
+    Read a lines file (series,z,x,y per row) and return an n by 3 array with a row of NaNs between series
+    """
+    data = read_numeric_text(fname)
+    if data is None or (len(data)>0 and data.shape[1]!=4):
+        raise ValueError("%s should have four values (series,z,x,y) in every row" % fname)
+    return lines_from_series(data[:,1:], data[:,0])
+
+
+def stackLevels(fname, volume):
+    """
+    Return the display range lasagna would use for this stack: the levels last chosen by the user if
+    these were cached, otherwise the default range computed from the (cached) intensity statistics.
+    """
+    cached = statsCache.load(fname) or dict()
+    if 'levels' in cached:
+        return cached['levels']
+
+    if 'stats' in cached and cached['stats']['dtype'] == str(volume.dtype):
+        stats = cached['stats']
+    else:
+        stats = histogram.volumeStats(volume)
+        statsCache.save(fname, stats=stats) #So the GUI does not need to compute these again
+    return [0, stats['autoRange']]
+
+
+def overlayColor(index, nColors=6):
+    """
+    The default colour of the index-th points or lines ingredient, as chosen by the ingredients themselves
+    """
+    from matplotlib import cm #imported here as matplotlib is slow to import and only needed for this
+    color = cm.jet(np.linspace(0, 1, nColors)[index % nColors])
+    return [color[0]*255, color[1]*255, color[2]*255]
+
+
+# - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+# Rendering. Images are built as (x,y,RGB) float arrays and oriented for writing by toRGB
+def prepareStack(stack):
+    """
+    Add the display quantisation and look-up table to a stack dictionary (see renderView) unless it has them 
+    already. This avoids repeating a pass through the volume for every frame of a movie.
+    """
+    if 'quantisation' not in stack:
+        stack['quantisation'] = display.displayQuantisation(stack['data'])
+    if 'displayLUT' not in stack:
+        lut = stack.get('lut','gray')
+        colors = lut if isinstance(lut,np.ndarray) else display.colorMapLUT(lut)
+        stack['displayLUT'] = display.levelsLUT(colors, stack['minMax'], stack['quantisation'])
+    return stack
+
+
+def renderStack(stack, axisToPlot, sliceToPlot, zoom=1):
+    """
+    Return the colours of one plane of a stack (see renderView) as an (x,y,3) premultiplied float array, 
+    ready to be added to other stacks
+    """
+    stack = prepareStack(stack)
+    plane = stack['data'].swapaxes(0,axisToPlot)[sliceToPlot] #as imagestack.data
+    rgba = stack['displayLUT'][display.quantise(plane, stack['quantisation'])].astype(np.float32)
+
+    rgb = rgba[...,:3]
+    if rgba.shape[-1] == 4:
+        rgb = rgb * (rgba[...,3:]/255.0)
+
+    if zoom > 1:
+        rgb = rgb.repeat(zoom,axis=0).repeat(zoom,axis=1)
+    return rgb
+
+
+def projectOverlay(data, axisToPlot):
+    """
+    Return the in-plane (x,y) coordinates of an n by 3 array of points, as ingredients.sparsepoints.data
+    """
+    data = np.delete(data,axisToPlot,1)
+    if axisToPlot==2:
+        data = np.fliplr(data)
+    return data
+
+
+def discOffsets(diameter):
+    """
+    Return the (dx,dy) pixel offsets covered by a disc of the given diameter
+    """
+    radius = max(diameter,1)/2.0
+    r = int(np.ceil(radius))
+    (dx,dy) = np.mgrid[-r:r+1, -r:r+1]
+    inside = dx**2 + dy**2 <= radius**2
+    return (dx[inside], dy[inside])
+
+
+def stampDiscs(coverage, xy, diameters, alphas):
+    """
+    Draw discs centred on xy (in pixels) into the coverage (opacity) image. Where discs overlap the most opaque wins.
+    """
+    for thisDiameter in np.unique(diameters):
+        ind = diameters == thisDiameter
+        (dx,dy) = discOffsets(thisDiameter)
+        x = (np.round(xy[ind,0])[:,None] + dx[None,:]).astype(np.intp).ravel()
+        y = (np.round(xy[ind,1])[:,None] + dy[None,:]).astype(np.intp).ravel()
+        a = np.repeat(alphas[ind], len(dx))
+        keep = (x>=0) & (y>=0) & (x<coverage.shape[0]) & (y<coverage.shape[1])
+        np.maximum.at(coverage, (x[keep],y[keep]), a[keep])
+
+
+def blend(image, coverage, color):
+    """
+    Paint color over image with the opacity in coverage (0 to 255)
+    """
+    opacity = (coverage/255.0)[...,None]
+    image *= 1-opacity
+    image += opacity*np.asarray(color[:3],dtype=np.float32)
+
+
+def renderPoints(image, points, axisToPlot, sliceToPlot, zSpread, color, symbolSize=8, alpha=200, zoom=1):
+    """
+    Draw sparse points onto image. As in the GUI, points within zSpread-1 slices of sliceToPlot are
+    shown, getting smaller and more transparent with distance from the plotted slice.
+    """
+    z = np.round(points[:,axisToPlot])
+    distance = np.abs(z-sliceToPlot)
+    keep = distance <= zSpread-1
+    if not np.any(keep):
+        return
+
+    xy = projectOverlay(points,axisToPlot)[keep]*zoom
+    distance = distance[keep]
+    sizes = np.maximum(symbolSize - distance*2, 1)
+    alphas = np.maximum(alpha - distance*20, 10)
+
+    coverage = np.zeros(image.shape[:2], dtype=np.float32)
+    stampDiscs(coverage, xy, sizes, alphas.astype(np.float32))
+    blend(image, coverage, color)
+
+
+def renderLines(image, lines, axisToPlot, sliceToPlot, zSpread, color, lineWidth=2, alpha=200, zoom=1):
+    """
+    Draw lines onto image. As in the GUI, line segments are clipped to the slices within zSpread-1 of
+    sliceToPlot (see imageProcessing.sliceIndex.segmentIndex). Rows of NaN break the line.
+    """
+    #One pass over the segments, as each frame is rendered only once
+    starts = sliceIndex.segmentStarts(lines)
+    (zLow,zHigh) = (sliceToPlot-(zSpread-1)-0.5, sliceToPlot+(zSpread-1)+0.5)
+    z0 = lines[starts,axisToPlot]
+    z1 = lines[starts+1,axisToPlot]
+    starts = starts[(np.minimum(z0,z1) <= zHigh) & (np.maximum(z0,z1) >= zLow)]
+    xy = sliceIndex.clipSegments(lines, starts, axisToPlot, zLow, zHigh)*zoom
+
+    finite = np.all(np.isfinite(xy),axis=1)
+    segments = np.flatnonzero(finite[:-1] & finite[1:])
+    if len(segments) == 0:
+        return
+
+    #Sample each segment every half pixel and draw a disc of the line width at each sample
+    starts = xy[segments]
+    steps = xy[segments+1]-starts
+    nSamples = np.ceil(np.hypot(steps[:,0],steps[:,1])*2).astype(np.intp) + 1
+    segmentOfSample = np.repeat(np.arange(len(segments)), nSamples)
+    firstSample = np.cumsum(nSamples)-nSamples
+    fraction = (np.arange(nSamples.sum()) - firstSample[segmentOfSample]) / np.maximum(nSamples-1,1)[segmentOfSample]
+    samples = starts[segmentOfSample] + steps[segmentOfSample]*fraction[:,None]
+
+    coverage = np.zeros(image.shape[:2], dtype=np.float32)
+    stampDiscs(coverage, samples, np.full(len(samples),lineWidth), np.full(len(samples),alpha,dtype=np.float32))
+    blend(image, coverage, color)
+
+
+def toRGB(image):
+    """
+    Convert an (x,y,3) float image to a (rows,columns,3) uint8 image with y increasing upwards, as in the GUI
+    """
+    return np.clip(np.rint(image),0,255).astype(np.uint8).transpose(1,0,2)[::-1]
+
+
+def renderView(stacks, axisToPlot, sliceToPlot, points=(), lines=(), zSpread=None, symbolSize=None, lineWidth=None, alpha=None, zoom=1):
+    """
+    Render one view and return it as a (rows,columns,3) uint8 image.
+    stacks - list of dictionaries with keys 'data', 'minMax' and, optionally, 'lut' (default 'gray').
+             The keys 'quantisation' and 'displayLUT' are added by prepareStack if missing.
+    points, lines - lists of dictionaries with keys 'data' (n by 3 array) and, optionally, 'color',
+                    'size' (symbol size or line width) and 'alpha'
+    zSpread, symbolSize, lineWidth, alpha - defaults taken from the preferences file
+    """
+    if zSpread is None:
+        zSpread = lasHelp.readPreference('defaultPointZSpread')[axisToPlot]
+    if symbolSize is None:
+        symbolSize = lasHelp.readPreference('defaultSymbolSize')
+    if lineWidth is None:
+        lineWidth = lasHelp.readPreference('defaultLineWidth')
+    if alpha is None:
+        alpha = lasHelp.readPreference('defaultSymbolOpacity')
+
+    image = None
+    for thisStack in stacks:
+        rgb = renderStack(thisStack, axisToPlot, sliceToPlot, zoom=zoom)
+        image = rgb if image is None else image+rgb #additive, like QPainter.CompositionMode_Plus
+    image = np.minimum(image,255)
+
+    overlays = [(thisItem,renderPoints,symbolSize) for thisItem in points] + [(thisItem,renderLines,lineWidth) for thisItem in lines]
+    for (ii,(thisItem,renderFunction,size)) in enumerate(overlays):
+        if len(thisItem['data']) == 0:
+            continue
+        color = thisItem.get('color') or overlayColor(ii)
+        renderFunction(image, thisItem['data'], axisToPlot, sliceToPlot, zSpread, color,
+                       thisItem.get('size',size), thisItem.get('alpha',alpha), zoom)
+
+    return toRGB(image)
+
+
+# - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+# Writing
+def writePNG(fname, rgb):
+    """
+    Write a (rows,columns,3) uint8 image to a PNG file. This needs no image library so is safe in worker processes.
+    """
+    (height,width) = rgb.shape[:2]
+    rows = np.zeros((height, width*3+1), dtype=np.uint8) #each row starts with a filter type byte (0: none)
+    rows[:,1:] = rgb.reshape(height,-1)
+
+    def chunk(kind, payload):
+        return struct.pack('>I',len(payload)) + kind + payload + struct.pack('>I', zlib.crc32(kind+payload) & 0xffffffff)
+
+    with open(fname,'wb') as fid:
+        fid.write(b'\x89PNG\r\n\x1a\n')
+        fid.write(chunk(b'IHDR', struct.pack('>IIBBBBB', width, height, 8, 2, 0, 0, 0)))
+        fid.write(chunk(b'IDAT', zlib.compress(rows.tobytes(), 6)))
+        fid.write(chunk(b'IEND', b''))
+
+
+def snapshotJob(job):
+    """
+    Render and write the views of one job. Returns a list of the files written.
+    job is a dictionary with keys:
+    'stacks' - list of {'fname', optionally 'lut' and 'minMax'}. The first stack names the output files.
+    'points', 'lines' - lists of file names
+    'axes' - the axes to render (e.g. [0,1,2])
+    'position' - the slice to render along each axis as a fraction of the stack size (0.5 is the middle)
+    'outDir', 'zoom'
+    """
+    stacks = []
+    for thisStack in job['stacks']:
+        volume = imageStackLoader.loadStack(thisStack['fname'])
+        if volume is False or volume is None:
+            print("snapshot failed to load %s" % thisStack['fname'])
+            return []
+        minMax = thisStack.get('minMax') or stackLevels(thisStack['fname'], volume)
+        stacks.append({'data':volume, 'minMax':minMax, 'lut':thisStack.get('lut','gray')})
+
+    points = [{'data':readPoints(fname)} for fname in job.get('points',[])]
+    lines = [{'data':readLines(fname)} for fname in job.get('lines',[])]
+
+    stem = os.path.splitext(os.path.basename(job['stacks'][0]['fname']))[0]
+    written = []
+    for axisToPlot in job.get('axes',(0,1,2)):
+        sliceToPlot = int(round((stacks[0]['data'].shape[axisToPlot]-1) * job.get('position',0.5)))
+        rgb = renderView(stacks, axisToPlot, sliceToPlot, points=points, lines=lines, zoom=job.get('zoom',1))
+        fname = os.path.join(job['outDir'], "%s_view%d_slice%04d.png" % (stem,axisToPlot+1,sliceToPlot))
+        writePNG(fname, rgb)
+        written.append(fname)
+
+    return written
+
+
+def _safeSnapshotJob(job):
+    try:
+        return snapshotJob(job)
+    except Exception as e:
+        print("snapshot of %s failed: %s" % (job['stacks'][0]['fname'],str(e)))
+        return []
+
+
+def renderBatch(jobs, nProcesses=None):
+    """
+    Run snapshotJob on each job in parallel worker processes. Returns a list of all files written.
+    A job that fails is reported and skipped.
+    """
+    if len(jobs) == 0:
+        return []
+    for thisJob in jobs:
+        if not os.path.exists(thisJob['outDir']):
+            os.makedirs(thisJob['outDir'])
+
+    if nProcesses == 1 or len(jobs) == 1:
+        results = [_safeSnapshotJob(thisJob) for thisJob in jobs]
+    else:
+        from concurrent.futures import ProcessPoolExecutor
+        with ProcessPoolExecutor(max_workers=nProcesses) as pool:
+            results = list(pool.map(_safeSnapshotJob, jobs))
+
+    return [fname for thisResult in results for fname in thisResult]
+
+
+# - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+def main(argv=None):
+    import argparse
+    parser = argparse.ArgumentParser(description="Render orthogonal views of image stacks to PNG files. Each stack is one job.")
+    parser.add_argument("-im", nargs='+', required=True, help="file name(s) of image stacks to render")
+    parser.add_argument("-R", help="reference stack (e.g. the atlas) added beneath every stack")
+    parser.add_argument("-S", nargs='+', default=[], help="file names of sparse points file(s) to overlay")
+    parser.add_argument("-L", nargs='+', default=[], help="file names of lines file(s) to overlay")
+    parser.add_argument("-o", default='.', help="directory in which to write the images")
+    parser.add_argument("--lut", default='gray', help="colour map of the stacks")
+    parser.add_argument("--referenceLut", default='gray', help="colour map of the reference stack")
+    parser.add_argument("--axes", nargs='+', type=int, default=[1,2,3], help="the views to render (1, 2 and/or 3)")
+    parser.add_argument("--position", type=float, default=0.5, help="slice to render as a fraction of the stack size")
+    parser.add_argument("--zoom", type=int, default=1, help="output pixels per voxel")
+    parser.add_argument("-j", type=int, default=None, help="number of worker processes")
+    args = parser.parse_args(argv)
+
+    jobs = []
+    for fname in args.im:
+        stacks = [{'fname':fname, 'lut':args.lut}]
+        if args.R is not None:
+            stacks.append({'fname':args.R, 'lut':args.referenceLut})
+        jobs.append({'stacks':stacks, 'points':args.S, 'lines':args.L, 'axes':[ax-1 for ax in args.axes],
+                     'position':args.position, 'outDir':args.o, 'zoom':args.zoom})
+
+    written = renderBatch(jobs, nProcesses=args.j)
+    print("Wrote %d images to %s" % (len(written),args.o))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,81 @@
+"""
+Measure where lasagna spends its time during start-up.
+
+Run lasagna with --profileStartup to enable. This module then records:
+1. The cumulative time taken by each module imported after enable() is called. The
+   time of a module includes the time taken to import the modules it imports.
+2. The time taken by each phase of start-up, as marked by calls to phase().
+A report is printed once the Qt event loop first runs (i.e. when the window is painted).
+
+This module must not import anything heavy itself as it is imported before everything else.
+"""
+
+import sys
+import time
+import builtins
+
+
+_enabled = False
+_startTime = time.perf_counter()
+_lastPhaseTime = _startTime
+_phases = [] #list of (name, duration)
+_imports = dict() #module name: cumulative import time
+_originalImport = builtins.__import__
+
+
+def enabled():
+    return _enabled
+
+
+def enable():
+    """
+    Start timing imports. Call this as early as possible.
+    """
+    global _enabled
+    if _enabled:
+        return
+    _enabled = True
+    builtins.__import__ = _timedImport
+
+
+def _timedImport(name, globals=None, locals=None, fromlist=(), level=0):
+    #Only time the first import of a module. Later imports are a dictionary look-up.
+    if level != 0 or name in sys.modules:
+        return _originalImport(name, globals, locals, fromlist, level)
+
+    start = time.perf_counter()
+    try:
+        return _originalImport(name, globals, locals, fromlist, level)
+    finally:
+        _imports[name] = time.perf_counter() - start
+
+
+def phase(name):
+    """
+    Mark the end of a start-up phase called name. Its duration is the time since the previous phase ended.
+    """
+    global _lastPhaseTime
+    if not _enabled:
+        return
+    now = time.perf_counter()
+    _phases.append((name, now-_lastPhaseTime))
+    _lastPhaseTime = now
+
+
+def report(nImports=25):
+    """
+    Print the slowest imports and the duration of each start-up phase
+    """
+    if not _enabled:
+        return
+    builtins.__import__ = _originalImport
+
+    print("\n- - - Start-up profile - - -")
+    print("Slowest imports (cumulative, including the modules they import):")
+    for (name,duration) in sorted(_imports.items(), key=lambda item: -item[1])[:nImports]:
+        print("  %7.1f ms  %s" % (duration*1E3, name))
+
+    print("Start-up phases:")
+    for (name,duration) in _phases:
+        print("  %7.1f ms  %s" % (duration*1E3, name))
+    print("  %7.1f ms  TOTAL\n" % ((time.perf_counter()-_startTime)*1E3))
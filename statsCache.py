@@ -0,0 +1,188 @@
+"""
+A cache of image stack statistics and display settings so that re-opening a stack needs no full-volume scan.
+
+One small .npz file is kept per image file in the statsCache directory within the lasagna preferences
+directory. Entries are keyed by the absolute path of the image file and store its size and modification
+time. An entry is ignored if the file has changed since it was written.
+
+An entry may hold:
+stats - the intensity statistics from imageProcessing.histogram.volumeStats
+axisRatios - the voxel spacing ratios (see imageStackLoader.getVoxelSpacing)
+levels - the display range last chosen by the user
+lut - the name of the colour map last chosen by the user
+"""
+
+import os
+import hashlib
+import tempfile
+import numpy as np
+import lasagna_helperFunctions as lasHelp
+
+
+maxCachedCounts = 2**16 #Value counts longer than this are not cached (see imageProcessing.histogram.valueCounts)
+
+
+def cacheDir():
+    """
+    Return the path to the cache directory, making it if needed
+    """
+    path = os.path.join(lasHelp.getLasagna_prefDir(), 'statsCache')
+    if not os.path.exists(path):
+        os.makedirs(path)
+    return path
+
+
+def cacheFileName(fname):
+    absPath = os.path.abspath(fname)
+    return os.path.join(cacheDir(), hashlib.sha1(absPath.encode('utf-8')).hexdigest() + '.npz')
+
+
+def fileSignature(fname):
+    """
+    Return (path,size,mtime) of fname or None if it is not a file. The image data of an MHD 
+    file are in a separate raw file, so this is included in the size and modification time.
+    """
+    if not fname or not os.path.isfile(fname):
+        return None
+
+    files = [fname]
+    if fname.lower().endswith('.mhd'):
+        stem = os.path.splitext(fname)[0]
+        files += [stem+ext for ext in ('.raw','.zraw') if os.path.isfile(stem+ext)]
+
+    info = [os.stat(thisFile) for thisFile in files]
+    return (os.path.abspath(fname), sum([i.st_size for i in info]), max([i.st_mtime_ns for i in info]))
+
+
+def load(fname):
+    """
+    Return the cache entry for fname as a dictionary or None if there is no valid entry.
+    Keys are a subset of: stats, axisRatios, levels, lut
+    """
+    signature = fileSignature(fname)
+    if signature is None:
+        return None
+
+    cacheFile = cacheFileName(fname)
+    if not os.path.exists(cacheFile):
+        return None
+
+    try:
+        with np.load(cacheFile, allow_pickle=False) as arrays:
+            arrays = dict(arrays)
+    except Exception as e:
+        print("statsCache failed to read %s: %s" % (cacheFile,str(e)))
+        return None
+
+    if (str(arrays['path']), int(arrays['size']), int(arrays['mtime'])) != signature:
+        return None
+
+    entry = dict()
+    if 'stats_min' in arrays:
+        entry['stats'] = arraysToStats(arrays)
+    if 'axisRatios' in arrays:
+        entry['axisRatios'] = arrays['axisRatios'].tolist()
+    if 'levels' in arrays:
+        entry['levels'] = arrays['levels'].tolist()
+    if 'lut' in arrays:
+        entry['lut'] = str(arrays['lut'])
+    return entry
+
+
+def save(fname, stats=None, axisRatios=None, levels=None, lut=None):
+    """
+    Add the supplied items to the cache entry for fname. Items that are None are left as they are.
+    The cache file is replaced atomically so a crash can not leave a half-written entry.
+    """
+    signature = fileSignature(fname)
+    if signature is None:
+        return False
+
+    arrays = dict()
+    cacheFile = cacheFileName(fname)
+    if load(fname) is not None: #Keep what was already cached for this version of the file
+        with np.load(cacheFile, allow_pickle=False) as existing:
+            arrays = dict(existing)
+
+    arrays['path'] = np.array(signature[0])
+    arrays['size'] = np.array(signature[1])
+    arrays['mtime'] = np.array(signature[2])
+
+    if stats is not None:
+        arrays = dict([(key,value) for (key,value) in arrays.items() if not key.startswith('stats_')])
+        arrays.update(statsToArrays(stats))
+    if axisRatios is not None:
+        arrays['axisRatios'] = np.asarray(axisRatios, dtype=np.float64)
+    if levels is not None:
+        arrays['levels'] = np.asarray(levels, dtype=np.float64)
+    if lut is not None and isinstance(lut,str):
+        arrays['lut'] = np.array(lut)
+
+    tmpName = None
+    try:
+        (handle,tmpName) = tempfile.mkstemp(dir=cacheDir(), suffix='.npz')
+        with os.fdopen(handle,'wb') as stream:
+            np.savez(stream, **arrays)
+        os.replace(tmpName, cacheFile)
+    except Exception as e:
+        print("statsCache failed to write %s: %s" % (cacheFile,str(e)))
+        if tmpName is not None and os.path.exists(tmpName):
+            os.remove(tmpName) #Do not leave a partly written file in the cache directory
+        return False
+
+    return True
+
+
+def statsToArrays(stats):
+    """
+    Flatten a volumeStats dictionary into arrays that can be stored in an npz file
+    """
+    percentiles = sorted(stats['percentiles'].keys())
+
+    arrays = {
+            'stats_histX' : stats['histogram']['x'],
+            'stats_histY' : stats['histogram']['y'],
+            'stats_min' : np.array(stats['min']),
+            'stats_max' : np.array(stats['max']),
+            'stats_autoRange' : np.array(stats['autoRange']),
+            'stats_percentileKeys' : np.array(percentiles, dtype=np.float64),
+            'stats_percentileValues' : np.array([stats['percentiles'][p] for p in percentiles], dtype=np.float64),
+            'stats_dtype' : np.array(stats['dtype']),
+            'stats_sampled' : np.array(stats['sampled']),
+            }
+
+    if stats['counts'] is not None and len(stats['counts'][2]) <= maxCachedCounts:
+        (firstValue,binWidth,counts) = stats['counts']
+        arrays['stats_firstValue'] = np.array(firstValue)
+        arrays['stats_binWidth'] = np.array(binWidth)
+        arrays['stats_counts'] = counts
+
+    for (key,values) in stats['slices'].items():
+        arrays['stats_slices_' + key] = values
+
+    return arrays
+
+
+def arraysToStats(arrays):
+    """
+    The inverse of statsToArrays
+    """
+    if 'stats_counts' in arrays:
+        binWidth = arrays['stats_binWidth'].item()
+        if arrays['stats_binWidth'].dtype.kind in 'iu':
+            binWidth = int(binWidth) #integer counts are exact (see imageProcessing.histogram.isExact)
+        counts = (arrays['stats_firstValue'].item(), binWidth, arrays['stats_counts'])
+    else:
+        counts = None
+
+    return {
+            'histogram' : {'x':arrays['stats_histX'], 'y':arrays['stats_histY']},
+            'min' : arrays['stats_min'].item(),
+            'max' : arrays['stats_max'].item(),
+            'autoRange' : arrays['stats_autoRange'].item(),
+            'percentiles' : dict(zip(arrays['stats_percentileKeys'].tolist(), arrays['stats_percentileValues'].tolist())),
+            'dtype' : str(arrays['stats_dtype']),
+            'sampled' : bool(arrays['stats_sampled']),
+            'counts' : counts,
+            'slices' : dict([(key[len('stats_slices_'):],value) for (key,value) in arrays.items() if key.startswith('stats_slices_')]),
+            }
@@ -6,6 +6,10 @@ Defines a tree and a node class as well as functions for importing data
 (_ROOT, _DEPTH, _WIDTH) = list(range(3)) #Used by classes to navigate the tree
 
 import os.path
+from array import array
+from collections import deque
+from collections.abc import Mapping, MutableMapping
+import numpy as np
 import dataTypeFromString
 
 def importData(fname, displayTree=False, colSep=',', headerLine=False, verbose=False):
@@ -32,6 +36,10 @@ def importData(fname, displayTree=False, colSep=',', headerLine=False, verbose=F
                 headerLine can also be a CSV string or a list that defines the column headings. Must have the
                 same number of columns as the rest of the file.
     verbose - prints diagnositic info to screen if true
+
+    The type of each data column (int, float or str) is inferred once and the column is stored as 
+    an array in tree.columns, indexed by node position. tree[nodeID].data is a dictionary-like view
+    of the node's row.
     """
 
 
@@ -51,7 +59,7 @@ def importData(fname, displayTree=False, colSep=',', headerLine=False, verbose=F
         fid.close()
 
     elif isinstance(fname,list):
-        contents=fname #assume that fname is data rather than a file name
+        contents=list(fname) #assume that fname is data rather than a file name. Copied as the header may be removed.
 
 
     #Get header data if present
@@ -66,43 +74,41 @@ def importData(fname, displayTree=False, colSep=',', headerLine=False, verbose=F
         header = False
 
 
-    data = []
-    for line in contents:
-        if len(line)==0:
-            continue
-
-        dataLine = line.split(colSep)
-        if len(header) !=len(dataLine):
-            print("\nTree file appears corrupt! header length is %d but data line length is %d.\ntree.importData is aborting.\n" % (len(header),len(dataLine)))
+    #Every line must have nCols cells, so all lines can be split into cells at once and every nCols-th cell taken to get each column
+    lines = [line for line in contents if len(line)>0]
+    nCols = len(header) if header != False else (lines[0].count(colSep)+1 if len(lines)>0 else 2)
+    for line in lines:
+        if line.count(colSep)+1 != nCols:
+            print("\nTree file appears corrupt! header length is %d but data line length is %d.\ntree.importData is aborting.\n" % (nCols,line.count(colSep)+1))
             return False
-
-        theseData = list(map(int,dataLine[0:2])) #add index and parent to the first two columns
-
-        #Add data to the third column. Either as a list or as a dictionary (if header names were provided)
-        if header != False: #add as dictionary
-            dataCol = dict()
-
-            for ii in range(len(header)-2):
-                ii+=2
-                dataCol[header[ii]]=dataTypeFromString.convertString(dataLine[ii])
-
-        else:
-            dataCol = dataLine[2:] #add as list of strings
-
-
-        theseData.append(dataCol) 
-        data.append(theseData)
+    cells = colSep.join(lines).split(colSep) if len(lines)>0 else []
+    columns = [cells[ii::nCols] for ii in range(nCols)]
 
     if verbose:
-        print("tree.importData read %d rows of data from %s" % (len(data),fname))
+        print("tree.importData read %d rows of data from %s" % (len(lines),fname))
 
+    identifiers = dataTypeFromString.convertColumn(columns[0])
+    parents = dataTypeFromString.convertColumn(columns[1])
+    if len(lines)>0 and (identifiers.dtype != np.int64 or parents.dtype != np.int64):
+        print("\nTree file appears corrupt! Node and parent IDs should be integers.\ntree.importData is aborting.\n")
+        return False
 
-    #Build tree
+    #Build tree. Node data are stored as typed columns if header names were provided, otherwise as a list of strings
     tree = Tree()
     tree.add_node(0)
-    for thisNode in data:
-        tree.add_node(thisNode[0],thisNode[1])
-        tree[thisNode[0]].data = thisNode[2]
+    try:
+        if header != False:
+            tree.add_nodes(identifiers.tolist(), parents.tolist(),
+                           columns=dict([(header[ii], dataTypeFromString.convertColumn(columns[ii])) for ii in range(2,nCols)]))
+        else:
+            tree.add_nodes(identifiers.tolist(), parents.tolist(),
+                           data=[list(thisRow) for thisRow in zip(*columns[2:])] if nCols>2 else [[] for line in lines])
+    except ValueError as e: #Repeated node IDs
+        print("\nTree file appears corrupt! %s.\ntree.importData is aborting.\n" % str(e))
+        return False
+    except KeyError as e:
+        print("\nTree file appears corrupt! Parent node %s is not in the file.\ntree.importData is aborting.\n" % str(e))
+        return False
 
 
     #Optionally dump the tree to screen (unlikely to be useful for large trees)
@@ -125,38 +131,210 @@ def importData(fname, displayTree=False, colSep=',', headerLine=False, verbose=F
 class Tree(object):
     """
     A simple tree class
+
+    Nodes are stored by position (the order in which they were added) in flat arrays of the
+    parent, first child, last child and next sibling of each node, with -1 for none. Node identifiers
+    can be any hashable value and are mapped to positions by a dictionary. tree[identifier] returns a
+    lightweight Node that reads from these arrays. Traversals are iterative, so deep trees (e.g. neuron
+    tracings) do not exhaust the recursion limit.
     """
 
     def __init__(self):
-        self.__nodes = {}
+        self._ids = []        #position: identifier
+        self._position = {}   #identifier: position
+        self._parent = array('q')
+        self._firstChild = array('q')
+        self._lastChild = array('q')
+        self._nextSibling = array('q')
+        self._data = []       #position: the node's data payload
+        self._numpyArrays = None #cached numpy copies of the arrays. see arrays()
+        self._eulerIndex = None  #cached (order, entry, exit). see eulerIndex()
+        self._valueIndex = {}    #column name: {value: identifier}. see findByValue()
+        self.columns = {}     #column name: array of node data indexed by position. see add_nodes
+        self._columnRange = (0,0) #the positions that have rows in columns
+
 
     @property
     def nodes(self):
-        return self.__nodes
+        return _nodeView(self)
+
+
+    def __len__(self):
+        return len(self._ids)
+
+
+    def __contains__(self, identifier):
+        return identifier in self._position
+
+
+    def add_node(self, identifier, parent=None, data=None):
+        if identifier in self._position:
+            raise ValueError("Tree already has a node %s" % str(identifier))
+        parentPosition = -1 if parent is None else self._position[parent]
+
+        position = len(self._ids)
+        self._ids.append(identifier)
+        self._position[identifier] = position
+        self._parent.append(parentPosition)
+        self._firstChild.append(-1)
+        self._lastChild.append(-1)
+        self._nextSibling.append(-1)
+        self._data.append(data)
+        self._numpyArrays = None
+        self._eulerIndex = None
+
+        if parentPosition >= 0:
+            if self._firstChild[parentPosition] < 0:
+                self._firstChild[parentPosition] = position
+            else:
+                self._nextSibling[self._lastChild[parentPosition]] = position
+            self._lastChild[parentPosition] = position
+
+        return Node(self, position)
+
+
+    def add_nodes(self, identifiers, parents, data=None, columns=None):
+        """
+        Add many nodes at once. Parents can be anywhere in the tree or amongst the new nodes, in any order.
+        Children are added after any the parent already has, in the order given.
+
+        identifiers - list of node identifiers
+        parents - list of the identifier of each node's parent (None for a root)
+        data - optional list of data payloads, one per node
+        columns - optional dictionary of arrays holding the nodes' data, one row per node (see Node.data).
+                  Columns can only be added to one batch of nodes.
+        """
+        start = len(self._ids)
+        n = len(identifiers)
+        if len(set(identifiers)) != n or any([thisID in self._position for thisID in identifiers]):
+            raise ValueError("Tree node identifiers must be unique")
+        if columns is not None and len(self.columns) > 0:
+            raise ValueError("Tree already has data columns")
+
+        self._position.update(zip(identifiers, range(start, start+n)))
+        self._ids.extend(identifiers)
+        self._data.extend([None]*n if data is None else data)
+        parentPosition = np.array([-1 if thisParent is None else self._position[thisParent] for thisParent in parents],
+                                  dtype=np.int64).reshape(-1)
+
+        #Link children to their parents in numpy and then write the arrays back
+        (parent, firstChild, lastChild, nextSibling) = [np.concatenate((np.array(thisArray, dtype=np.int64), np.full(n, -1, dtype=np.int64)))
+                                                        for thisArray in (self._parent, self._firstChild, self._lastChild, self._nextSibling)]
+        positions = np.arange(start, start+n)
+        parent[positions] = parentPosition
+
+        hasParent = parentPosition >= 0
+        order = np.lexsort((positions[hasParent], parentPosition[hasParent])) #by parent, then the order added
+        children = positions[hasParent][order]
+        childParent = parentPosition[hasParent][order]
+        if len(children) > 0:
+            newGroup = np.concatenate(([True], childParent[1:] != childParent[:-1]))
+            lastInGroup = np.concatenate((newGroup[1:], [True]))
+            nextSibling[children[~lastInGroup]] = children[1:][~lastInGroup[:-1]]
+
+            groupParents = childParent[newGroup]
+            (groupFirst, groupLast) = (children[newGroup], children[lastInGroup])
+            hadChildren = firstChild[groupParents] >= 0
+            nextSibling[lastChild[groupParents[hadChildren]]] = groupFirst[hadChildren]
+            firstChild[groupParents[~hadChildren]] = groupFirst[~hadChildren]
+            lastChild[groupParents] = groupLast
+
+        (self._parent, self._firstChild, self._lastChild, self._nextSibling) = [array('q', thisArray.tobytes())
+                                                        for thisArray in (parent, firstChild, lastChild, nextSibling)]
+        self._numpyArrays = None
+        self._eulerIndex = None
+
+        if columns is not None:
+            for (name, values) in columns.items():
+                values = np.asarray(values)
+                if len(values) != n:
+                    raise ValueError("Column %s has %d rows for %d nodes" % (name, len(values), n))
+                column = np.zeros(start+n, dtype=values.dtype) #Nodes before this batch have no row
+                column[start:] = values
+                self.columns[name] = column
+            self._columnRange = (start, start+n)
+            self._valueIndex = {}
+
+
+    def arrays(self):
+        """
+        Return (parent, firstChild, nextSibling) as numpy arrays of positions, with -1 for none.
+        These are read-only copies that are made again only after nodes are added.
+        """
+        if self._numpyArrays is None:
+            self._numpyArrays = tuple([np.array(thisArray, dtype=np.int64) for thisArray in
+                                       (self._parent, self._firstChild, self._nextSibling)])
+            for thisArray in self._numpyArrays:
+                thisArray.setflags(write=False)
+        return self._numpyArrays
+
+
+    def positionOf(self, identifier):
+        return self._position[identifier]
+
 
-    def add_node(self, identifier, parent=None):
-        node = Node(identifier,parent=parent)
-        self[identifier] = node
+    def identifiers(self, positions):
+        """
+        Return a list of the identifiers of the nodes at positions
+        """
+        return [self._ids[thisPosition] for thisPosition in positions]
+
+
+    def childPositions(self, position):
+        children = []
+        child = self._firstChild[position]
+        while child >= 0:
+            children.append(child)
+            child = self._nextSibling[child]
+        return children
 
-        if parent is not None:
-            self[parent].add_child(identifier)
 
-        return node
+    def numChildren(self):
+        """
+        Return an array with the number of children of each node, by position
+        """
+        parent = self.arrays()[0]
+        return np.bincount(parent[parent>=0], minlength=len(parent))
+
 
     #TODO: replace with  __repr__(self): ?
     def display(self, identifier, depth=_ROOT):
         """
         Very (very) simple tree display
         """
-        children = self[identifier].children
-        if depth == _ROOT:
-            print(("{0}".format(identifier)))
-        else:
-            print(("    "*depth, "{0}".format(identifier)))
+        stack = [(self._position[identifier], depth)]
+        while stack:
+            (position, depth) = stack.pop()
+            if depth == _ROOT:
+                print(("{0}".format(self._ids[position])))
+            else:
+                print(("    "*depth, "{0}".format(self._ids[position])))
+            stack += [(child, depth+1) for child in reversed(self.childPositions(position))]
 
-        depth += 1
-        for child in children:
-            self.display(child, depth)  # recursive call
+
+    def traversePositions(self, position, mode=_DEPTH):
+        """
+        Yield the positions of the nodes below the one at position (included) in depth first or width first order
+        """
+        if mode == _WIDTH:
+            queue = deque([position])
+            while queue:
+                position = queue.popleft()
+                yield position
+                queue.extend(self.childPositions(position))
+        else:
+            (firstChild, nextSibling) = (self._firstChild, self._nextSibling)
+            stack = [position]
+            while stack:
+                position = stack.pop()
+                yield position
+                #Push the children so the first is popped first
+                child = firstChild[position]
+                start = len(stack)
+                while child >= 0:
+                    stack.append(child)
+                    child = nextSibling[child]
+                stack[start:] = stack[start:][::-1]
 
 
     def traverse(self, identifier, mode=_DEPTH):
@@ -164,16 +342,85 @@ class Tree(object):
         traverse the tree in depth first or width first modes
         using a yield-based generator
         """
-        # Python generator using yield
-        yield identifier #return the root of this list
-        queue = self[identifier].children
-        while queue:
-            yield queue[0]
-            expansion = self[queue[0]].children
-            if mode == _DEPTH:
-                queue = expansion + queue[1:]  # depth-first
-            elif mode == _WIDTH:
-                queue = queue[1:] + expansion  # width-first
+        ids = self._ids
+        for position in self.traversePositions(self._position[identifier], mode):
+            yield ids[position]
+
+
+    def eulerIndex(self):
+        """
+        Return (order, entry, exit) as read-only numpy arrays. order holds the positions of all nodes in
+        depth-first order, one root after another. The subtree of the node at position p is
+        order[entry[p]:exit[p]], so node q is below node p if entry[p] < entry[q] < exit[p].
+        The index is made again only after nodes are added.
+        """
+        if self._eulerIndex is None:
+            roots = np.flatnonzero(self.arrays()[0] < 0)
+            order = array('q')
+            for root in roots.tolist():
+                order.extend(self.traversePositions(root))
+
+            #Each node's subtree size is added to its parent's, children before parents
+            parent = self._parent
+            size = array('q', [1])*len(order)
+            for position in reversed(order):
+                if parent[position] >= 0:
+                    size[parent[position]] += size[position]
+
+            order = np.array(order, dtype=np.int64)
+            entry = np.empty(len(order), dtype=np.int64)
+            entry[order] = np.arange(len(order))
+            exit = entry + np.array(size, dtype=np.int64)
+            self._eulerIndex = (order, entry, exit)
+            for thisArray in self._eulerIndex:
+                thisArray.setflags(write=False)
+        return self._eulerIndex
+
+
+    def subtreeRange(self, identifier):
+        """
+        Return (start, stop): the subtree of node identifier is eulerIndex()[0][start:stop]
+        """
+        (order, entry, exit) = self.eulerIndex()
+        position = self._position[identifier]
+        return (int(entry[position]), int(exit[position]))
+
+
+    def isDescendant(self, identifier, ancestor):
+        """
+        True if node identifier is below node ancestor. A node is not its own descendant.
+        """
+        (order, entry, exit) = self.eulerIndex()
+        (position, ancestorPosition) = (self._position[identifier], self._position[ancestor])
+        return bool(entry[ancestorPosition] < entry[position] < exit[ancestorPosition])
+
+
+    def subtreePositions(self, fromNode):
+        """
+        Return an array of the positions of the nodes below fromNode (included), in depth-first order
+        """
+        (start, stop) = self.subtreeRange(fromNode)
+        return self.eulerIndex()[0][start:stop]
+
+
+    def descendants(self, identifier):
+        """
+        Return a list of the nodes below node identifier (not included), in depth-first order
+        """
+        return self.identifiers(self.subtreePositions(identifier)[1:])
+
+
+    def findByValue(self, column, value):
+        """
+        Return the first node, in the order added, whose value in data column is value, or None if there is none.
+        A dictionary of each column's values is built the first time the column is searched.
+        """
+        if column not in self._valueIndex:
+            (first, last) = self._columnRange
+            values = self.columns[column][first:last].tolist()
+            #Reversed so that the first node with a value is the one kept
+            self._valueIndex[column] = dict(zip(reversed(values), reversed(self._ids[first:last])))
+        return self._valueIndex[column].get(value)
 
 
     def isLeaf(self,identifier):
@@ -181,16 +428,7 @@ class Tree(object):
         Is the node indexed by 'identifier' a leaf?
         returns True or False
         """
-        n=0
-        for nodeID in self.traverse(identifier):
-            n += 1
-            if n>1:
-                break
-
-        if n==1:
-            return True
-        else:
-            return False
+        return self._firstChild[self._position[identifier]] < 0
 
 
     def findLeaves(self,fromNode=0):
@@ -199,12 +437,8 @@ class Tree(object):
         the node "fromNode". To find all leaves, fromNode should 
         be the root node.
         """
-        nodesThatAreLeaves = []
-        for nodeID in self.traverse(fromNode):
-            if self.isLeaf(nodeID):
-                nodesThatAreLeaves.append(nodeID)
-
-        return nodesThatAreLeaves
+        positions = self.subtreePositions(fromNode)
+        return self.identifiers(positions[self.arrays()[1][positions] < 0])
 
 
     def findBranches(self,fromNode=0):
@@ -213,12 +447,37 @@ class Tree(object):
         A branch is defined as a node with more than two children
         To find all branches, fromNode should be the root node.
         """
-        nodesThatAreBranches = []
-        for nodeID in self.traverse(fromNode):
-            if self.nodes[nodeID].isbranch():
-                nodesThatAreBranches.append(nodeID)
+        positions = self.subtreePositions(fromNode)
+        return self.identifiers(positions[self.numChildren()[positions] > 1])
+
+
+    def segmentPositions(self,linkSegments=1,fromNode=0):
+        """
+        Return the unique segments of the tree below fromNode as index arrays: (positions, starts).
+        positions holds the node positions of all segments, one after the other, and starts the index
+        in positions at which each segment begins. See findSegments.
+
+        In depth-first order a segment is a contiguous run of nodes: it begins at fromNode or at a
+        child of a branch, and continues through nodes with one child. So the segments are found by
+        splitting the depth-first order rather than by following each one.
+        """
+        positions = self.subtreePositions(fromNode)
+        parent = self.arrays()[0]
+        numChildren = self.numChildren()
+
+        isStart = np.zeros(len(positions), dtype=bool)
+        isStart[0] = True
+        hasParent = parent[positions] >= 0
+        isStart[hasParent] |= numChildren[parent[positions[hasParent]]] > 1
+        starts = np.flatnonzero(isStart)
+
+        if linkSegments:
+            #Add the parent of each segment's first node to the start of the segment
+            link = hasParent[starts]
+            positions = np.insert(positions, starts[link], parent[positions[starts[link]]])
+            starts = starts + np.cumsum(np.concatenate(([0], link[:-1])))
 
-        return nodesThatAreBranches
+        return (positions, starts)
 
 
     def findSegments(self,linkSegments=1,nodeID=0,segments=()):
@@ -229,28 +488,8 @@ class Tree(object):
         it possible to plot the data without gaps appearing. This is the default. 
         If linksegments is 0, then the no duplicate points are returned.
         """
-        #print "Calling find segments with nodeID %d" % nodeID
-
-        if linkSegments and nodeID>0:
-            thisPath = [self.nodes[nodeID].parent]
-        else:
-            thisPath = []
-
-        if isinstance(nodeID,int):
-            nodeID = [nodeID]
-
-        while len(nodeID)==1:
-            #print "appending node %d" % nodeID[0]
-            thisPath.append(nodeID[0])
-            nodeID = self.nodes[nodeID[0]].children
-            
-        segments = segments + (thisPath,) #Store this segment
-
-        #Go into the branches with a recursive call
-        for thisNode in nodeID:
-            segments=self.findSegments(linkSegments,thisNode,segments)
-
-        return segments
+        (positions, starts) = self.segmentPositions(linkSegments, nodeID)
+        return tuple(segments) + tuple([self.identifiers(thisSegment) for thisSegment in np.split(positions, starts[1:])])
 
 
     def pathToRoot(self, fromNode):
@@ -261,21 +500,89 @@ class Tree(object):
         trivial and quick. No nee to exhaustively search the tree for the 
         fastest path.
         """
-        currentNode=fromNode
+        position = self._position[fromNode]
         path = [fromNode]
-        while self.nodes[currentNode].parent != None:
-            path.append(self.nodes[currentNode].parent)
-            currentNode = self.nodes[currentNode].parent
+        while self._parent[position] >= 0:
+            position = self._parent[position]
+            path.append(self._ids[position])
 
         return path
 
 
     def __getitem__(self, key):
-        return self.__nodes[key]
+        return Node(self, self._position[key])
 
 
     def __setitem__(self, key, item):
-        self.__nodes[key] = item
+        """
+        Add item, a Node of this or another tree, as node key. Its parent must already be in the tree.
+        """
+        self.add_node(key, parent=item.parent, data=item.data)
+
+
+
+
+class _nodeView(Mapping):
+    """
+    Read-only dictionary-like view of the nodes of a tree: tree.nodes[identifier] is a Node
+    """
+    __slots__ = ('_tree',)
+
+    def __init__(self, tree):
+        self._tree = tree
+
+    def __getitem__(self, key):
+        return self._tree[key]
+
+    def __contains__(self, key):
+        return key in self._tree._position
+
+    def __iter__(self):
+        return iter(self._tree._ids)
+
+    def __len__(self):
+        return len(self._tree._ids)
+
+
+
+
+class _rowView(MutableMapping):
+    """
+    Dictionary-like view of one node's row in the columns of a tree. Changes are written to the columns.
+    """
+    __slots__ = ('_tree', '_position')
+
+    def __init__(self, tree, position):
+        self._tree = tree
+        self._position = position
+
+    def __getitem__(self, key):
+        value = self._tree.columns[key][self._position]
+        return value.item() if isinstance(value, np.generic) else value
+
+    def __setitem__(self, key, value):
+        columns = self._tree.columns
+        if key not in columns:
+            columns[key] = np.full(self._tree._columnRange[1], None, dtype=object)
+        column = columns[key]
+        if column.dtype != object and not np.can_cast(np.asarray(value).dtype, column.dtype, 'same_kind'):
+            #Widen the column (e.g. int to float, or to object for text) rather than truncate value
+            newType = np.result_type(column.dtype, np.asarray(value).dtype) if np.isscalar(value) and not isinstance(value, str) else object
+            column = columns[key] = column.astype(newType)
+        column[self._position] = value
+        self._tree._valueIndex.pop(key, None)
+
+    def __delitem__(self, key):
+        raise TypeError("Columns can not be removed from one node")
+
+    def __iter__(self):
+        return iter(self._tree.columns)
+
+    def __len__(self):
+        return len(self._tree.columns)
+
+    def __repr__(self):
+        return repr(dict(self.items()))
 
 
 
@@ -283,32 +590,48 @@ class Tree(object):
 # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
 class Node(object):
     """
-    A simple node class
+    A simple node class. A node is a view of one position in a Tree.
     """
-    def __init__(self, identifier, data=None, parent=None):
-        self.__identifier = identifier
-        self.__children = []
-        self.__data = data #The node's data payload. Can be anything.
-        self.parent = parent
+    __slots__ = ('_tree', '_position')
+
+    def __init__(self, tree, position):
+        self._tree = tree
+        self._position = position
 
     @property
     def data(self):
-        return self.__data
+        """
+        The node's data payload. If the tree's data are stored in columns, this is a 
+        dictionary-like view of the node's row.
+        """
+        value = self._tree._data[self._position]
+        (first, last) = self._tree._columnRange
+        if value is None and first <= self._position < last:
+            return _rowView(self._tree, self._position)
+        return value
 
     @data.setter
     def data(self,value):
-        self.__data = value
+        self._tree._data[self._position] = value
     
     @property
     def identifier(self):
-        return self.__identifier
+        return self._tree._ids[self._position]
+
+    @property
+    def parent(self):
+        parent = self._tree._parent[self._position]
+        return None if parent < 0 else self._tree._ids[parent]
 
     @property
     def children(self):
-        return self.__children
+        return self._tree.identifiers(self._tree.childPositions(self._position))
 
     def add_child(self, identifier):
-        self.__children.append(identifier)
+        """
+        Add a new node, identifier, as the last child of this node
+        """
+        self._tree.add_node(identifier, parent=self.identifier)
 
     def isbranch(self):
         """
@@ -316,11 +639,14 @@ class Node(object):
         A branch is defined as a node with more than two children
         returns True or False
         """
+        firstChild = self._tree._firstChild[self._position]
+        return firstChild >= 0 and self._tree._nextSibling[firstChild] >= 0
 
-        if len(self.children) > 1:
-            return True
-        else:
-            return False
+    def __eq__(self, other):
+        return isinstance(other, Node) and other._tree is self._tree and other._position == self._position
+
+    def __hash__(self):
+        return hash((id(self._tree), self._position))
 
 
 
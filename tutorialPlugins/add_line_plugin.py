@@ -6,7 +6,9 @@ from lasagna_plugin import lasagna_plugin
 import add_line_UI
 from PyQt5 import QtGui, QtCore
 import sys
+import os
 import numpy as np
+from IO.points_io import write_points
 
 
 import lasagna_helperFunctions            # A potentially temporary module that houses general-purpose helper functions
@@ -51,6 +53,11 @@ class plugin(lasagna_plugin, QtGui.QWidget, add_line_UI.Ui_addLine): #must inher
         self.add_pushButton.clicked.connect(self.add_line)
         self.interactive_checkBox.clicked.connect(self.fit_line)
 
+        #Save the current points (and fit) to a binary point set file. Not in the designer file.
+        self.save_pushButton = QtGui.QPushButton('save')
+        self.horizontalLayout_2.addWidget(self.save_pushButton)
+        self.save_pushButton.clicked.connect(self.save_line)
+
 
 
     #self.lasagna.updateMainWindowOnMouseMove is run each time the axes are updated. So we can hook into it 
@@ -95,6 +102,31 @@ class plugin(lasagna_plugin, QtGui.QWidget, add_line_UI.Ui_addLine): #must inher
             self.lasagna.returnIngredientByName(lineName).addToPlots() #Add item to all three 2D plots
         self.clear_line()
 
+    def save_line(self):
+        """Save the current points and, if there is one, the fitted line
+
+        The points are written to a binary point set file (see IO.points_io). The fit is
+        written alongside, with "_fit" appended to the file name.
+
+        :return:
+        """
+        coords = self.get_points_coord()
+        if not len(coords):
+            print('No points to save')
+            return
+        path = QtGui.QFileDialog.getSaveFileName(self, 'Save %s' % self.name_lineEdit.text(),
+                                                 '%s.npz' % self.name_lineEdit.text(), "Point set (*.npz)")[0]
+        if not path:
+            return
+
+        path = write_points(path, coords)
+        print('Points saved as %s' % path)
+        if len(self.fit):
+            (stem, ext) = os.path.splitext(path)
+            fit_path = write_points('%s_fit%s' % (stem, ext), self.fit['fit_coords'],
+                                    series=np.zeros(len(self.fit['fit_coords']), dtype=int))
+            print('Fit saved as %s' % fit_path)
+
     def clear_line(self):
         """Clear current line
 
@@ -8,6 +8,7 @@ from lasagna_plugin import lasagna_plugin
 import cross_section_plot_UI
 from PyQt5 import QtGui, QtCore
 import sys
+import numpy as np
 
 
 import lasagna_helperFunctions            # A potentially temporary module that houses general-purpose helper functions
@@ -53,14 +54,20 @@ class plugin(lasagna_plugin, QtGui.QWidget, cross_section_plot_UI.Ui_xSection):
         if ImageItem==False:
             return
 
-        #Extract data from base image
+        #Extract data from base image. The image may be cropped to the visible area, so
+        #we find the row under the mouse and the image's horizontal position in the view
         if ImageItem != None:
-            if ImageItem.image.shape[1]<=Y or Y<0:
+            index = lasagna_helperFunctions.imageItemIndexAtViewPosition(ImageItem,X,Y)
+            if index is None:
                 return
-            xData = ImageItem.image[:,Y]
+            xData = ImageItem.image[:,index[1]]
+            stack = self.lasagna.returnIngredientByName(selectedStackName)
+            if stack != False:
+                xData = stack.displayValueToData(xData)
+            xOffset = X - index[0]
 
             self.graphicsView.clear()
-            self.graphicsView.plot(xData)
+            self.graphicsView.plot(np.arange(len(xData))+xOffset, xData)
 
         #Link the x axis of the cross-section view with the x axis of the image view
         #Do not use self.graphicsView.setXLink() as it is bidirectional 
@@ -0,0 +1,252 @@
+"""
+Export a fly-through movie that sweeps through the loaded image stacks, with points and lines overlaid.
+Frames are rendered away from the GUI thread and streamed to an ffmpeg-encoded movie or, if ffmpeg is
+not installed or a directory is chosen, to a numbered sequence of PNG images. See movieExport.py
+"""
+
+from lasagna_plugin import lasagna_plugin
+from PyQt5 import QtGui, QtCore
+import backgroundWorker
+import movieExport
+
+
+class plugin(lasagna_plugin, QtGui.QWidget): #must inherit lasagna_plugin first
+
+    def __init__(self,lasagna,parent=None):
+        super(plugin,self).__init__(lasagna) #This calls the lasagna_plugin constructor which in turn calls subsequent constructors
+
+        #re-define some default properties that were originally defined in lasagna_plugin
+        self.pluginShortName='Movie export' #Appears on the menu
+        self.pluginLongName='export a fly-through movie of the current view' #Can be used for other purposes (e.g. tool-tip)
+        self.pluginAuthor='Rob Campbell'
+
+        #The export runs in the background. These are shared with the worker thread.
+        self.exportFuture = None
+        self.cancelRequested = False
+        self.closed = False #True once the window is closed. An export may still finish after this (see exportFinished)
+        self.framesWritten = 0
+
+        #Polls the number of frames written so the progress bar is only touched on the GUI thread
+        self.progressTimer = QtCore.QTimer()
+        self.progressTimer.setInterval(200)
+        self.progressTimer.timeout.connect(self.updateProgress)
+
+        self.setupUi()
+        self.updateSliceRange()
+        self.show()
+
+
+    def setupUi(self):
+        """
+        Make the widgets. This plugin is simple enough not to need a designer file.
+        """
+        self.setWindowTitle(self.pluginShortName)
+        layout = QtGui.QFormLayout(self)
+
+        self.view_comboBox = QtGui.QComboBox()
+        self.view_comboBox.addItems(['View 1','View 2','View 3','All views'])
+        layout.addRow('Sweep through', self.view_comboBox)
+
+        self.first_spinBox = QtGui.QSpinBox()
+        self.last_spinBox = QtGui.QSpinBox()
+        sliceRange = QtGui.QHBoxLayout()
+        sliceRange.addWidget(self.first_spinBox)
+        sliceRange.addWidget(self.last_spinBox)
+        layout.addRow('Slices', sliceRange)
+
+        self.step_spinBox = QtGui.QSpinBox()
+        self.step_spinBox.setRange(1,1000)
+        layout.addRow('Step', self.step_spinBox)
+
+        self.fps_spinBox = QtGui.QSpinBox()
+        self.fps_spinBox.setRange(1,120)
+        self.fps_spinBox.setValue(25)
+        layout.addRow('Frames per second', self.fps_spinBox)
+
+        self.zoom_spinBox = QtGui.QSpinBox()
+        self.zoom_spinBox.setRange(1,16)
+        self.zoom_spinBox.setSuffix(' pixels per voxel')
+        layout.addRow('Zoom', self.zoom_spinBox)
+
+        self.fname_lineEdit = QtGui.QLineEdit('sweep.mp4')
+        self.browse_pushButton = QtGui.QPushButton('...')
+        fname = QtGui.QHBoxLayout()
+        fname.addWidget(self.fname_lineEdit)
+        fname.addWidget(self.browse_pushButton)
+        layout.addRow('Save to', fname)
+
+        self.progressBar = QtGui.QProgressBar()
+        layout.addRow(self.progressBar)
+
+        self.export_pushButton = QtGui.QPushButton('Export')
+        self.cancel_pushButton = QtGui.QPushButton('Cancel')
+        self.cancel_pushButton.setEnabled(False)
+        buttons = QtGui.QHBoxLayout()
+        buttons.addWidget(self.export_pushButton)
+        buttons.addWidget(self.cancel_pushButton)
+        layout.addRow(buttons)
+
+        self.view_comboBox.currentIndexChanged.connect(self.updateSliceRange)
+        self.browse_pushButton.released.connect(self.browse_slot)
+        self.export_pushButton.released.connect(self.export_slot)
+        self.cancel_pushButton.released.connect(self.cancel_slot)
+
+
+    def axesToSweep(self):
+        index = self.view_comboBox.currentIndex()
+        if index == 3:
+            return [thisAxis.axisToPlot for thisAxis in self.lasagna.axes2D]
+        return [self.lasagna.axes2D[index].axisToPlot]
+
+
+    def visibleIngredients(self, kind):
+        ingredients = self.lasagna.returnIngredientByType(kind)
+        if ingredients == False:
+            return []
+        return [thisIngredient for thisIngredient in ingredients if thisIngredient.enable]
+
+
+    def updateSliceRange(self):
+        """
+        Limit the slice range to the size of the first stack along the chosen axis (the largest if all views are chosen)
+        """
+        stacks = self.visibleIngredients('imagestack')
+        if len(stacks)==0:
+            return
+        nSlices = max([stacks[0].raw_data().shape[axisToPlot] for axisToPlot in self.axesToSweep()])
+        for thisSpinBox in (self.first_spinBox, self.last_spinBox):
+            thisSpinBox.setRange(0,nSlices-1)
+        self.last_spinBox.setValue(nSlices-1)
+
+
+    def sweepContents(self):
+        """
+        Describe what is shown, as it is shown, in the form used by snapshot.renderView.
+        The display look-up tables are taken from the stacks so the movie matches the views.
+        """
+        stacks = [{'data':thisStack.raw_data(),
+                   'minMax':list(thisStack.minMax),
+                   'quantisation':thisStack.displayQuantisation(),
+                   'displayLUT':thisStack.displayLUT()} for thisStack in self.visibleIngredients('imagestack')]
+
+        points = [{'data':thisItem.raw_data(), 'color':thisItem.color, 'size':thisItem.symbolSize, 'alpha':thisItem.alpha}
+                  for thisItem in self.visibleIngredients('sparsepoints')]
+        lines = [{'data':thisItem.raw_data(), 'color':thisItem.color, 'size':thisItem.lineWidth, 'alpha':thisItem.alpha}
+                 for thisItem in self.visibleIngredients('lines')]
+
+        return (stacks,points,lines)
+
+
+    #------------------------------------------------------
+    #slots
+    def browse_slot(self):
+        fname = QtGui.QFileDialog.getSaveFileName(self, 'Save movie as', self.fname_lineEdit.text(),
+                                                  "Movies (*.mp4 *.avi *.mov *.mkv);;Image sequence directory (*)")[0]
+        if fname:
+            self.fname_lineEdit.setText(fname)
+
+
+    def export_slot(self):
+        if self.exportFuture is not None:
+            return
+
+        (stacks,points,lines) = self.sweepContents()
+        if len(stacks)==0:
+            self.lasagna.statusBar.showMessage("Movie export: no image stacks to export")
+            return
+
+        #Read the settings here, on the GUI thread
+        axes = self.axesToSweep()
+        settings = {'fname' : self.fname_lineEdit.text(),
+                    'sliceRange' : (self.first_spinBox.value(), self.last_spinBox.value()),
+                    'step' : self.step_spinBox.value(),
+                    'fps' : self.fps_spinBox.value(),
+                    'zoom' : self.zoom_spinBox.value(),
+                    'zSpread' : [thisSpinBox.value() for thisSpinBox in self.lasagna.viewZ_spinBoxes]}
+        (first,last) = settings['sliceRange']
+        nFrames = sum([len(range(first, min(last,stacks[0]['data'].shape[axisToPlot]-1)+1, settings['step'])) for axisToPlot in axes])
+
+        self.cancelRequested = False
+        self.framesWritten = 0
+        self.progressBar.setRange(0,max(nFrames,1))
+        self.progressBar.setValue(0)
+        self.export_pushButton.setEnabled(False)
+        self.cancel_pushButton.setEnabled(True)
+        self.progressTimer.start()
+
+        self.exportFuture = backgroundWorker.runInBackground(self.runExport, stacks, points, lines, axes, settings,
+                                                             onFinished=self.exportFinished)
+
+
+    def runExport(self, stacks, points, lines, axes, settings):
+        """
+        Runs in the task pool. Must not touch Qt objects. Errors are reported here so that exportFinished always runs.
+        """
+        written = []
+        completedFrames = 0
+        for axisToPlot in axes:
+            def progress(nWritten):
+                self.framesWritten = completedFrames + nWritten
+            try:
+                written += movieExport.exportSweeps(stacks, [axisToPlot],
+                                                    movieExport.sweepFileName(settings['fname'], axisToPlot, len(axes)),
+                                                    sliceRange=settings['sliceRange'], step=settings['step'], fps=settings['fps'],
+                                                    points=points, lines=lines, progress=progress,
+                                                    cancelled=lambda: self.cancelRequested,
+                                                    zSpread=settings['zSpread'][axisToPlot], zoom=settings['zoom'])
+            except Exception as e:
+                print("Movie export failed: %s" % str(e))
+                break
+            completedFrames = self.framesWritten
+            if self.cancelRequested:
+                break
+        return written
+
+
+    def exportFinished(self, written):
+        self.exportFuture = None
+        self.progressTimer.stop()
+        if self.closed: #The widgets may have been deleted
+            self.lasagna.statusBar.showMessage("Movie export stopped after %d frames as its window was closed" % self.framesWritten)
+            return
+        self.updateProgress()
+        self.export_pushButton.setEnabled(True)
+        self.cancel_pushButton.setEnabled(False)
+        if self.cancelRequested:
+            self.lasagna.statusBar.showMessage("Movie export cancelled after %d frames" % self.framesWritten)
+        else:
+            self.lasagna.statusBar.showMessage("Movie export wrote " + ", ".join(written))
+
+
+    def cancel_slot(self):
+        self.cancelRequested = True
+
+
+    def updateProgress(self):
+        if self.closed:
+            return
+        self.progressBar.setValue(self.framesWritten)
+
+
+    #------------------------------------------------------
+    #The following methods are involved in shutting down the plugin window
+    def closePlugin(self):
+        """
+        This method is called by lasagna when the user unchecks the plugin in the menu.
+        """
+        self.cancelRequested = True
+        self.closed = True
+        self.progressTimer.stop()
+        self.detachHooks()
+        self.close()
+
+
+    #We define this here because we can't assume all plugins will have QWidget::closeEvent
+    def closeEvent(self, event):
+        """
+        This event is executed when the user presses the close window (cross) button in the title bar
+        """
+        self.lasagna.stopPlugin(self.__module__) #This will call self.closePlugin
+        self.lasagna.pluginActions[self.__module__].setChecked(False) #Uncheck the menu item associated with this plugin's name
+        self.deleteLater()
+        event.accept()
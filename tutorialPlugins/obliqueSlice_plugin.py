@@ -0,0 +1,198 @@
+"""
+Shows an oblique plane through the image stacks in one of the three views.
+The plane is tilted away from the view's normal slicing axis by an angle (tilt) in a
+direction (azimuth) and can be moved along its normal with the offset box or the mouse wheel.
+Alternatively, click three points in any of the views to show the plane that passes through them.
+"""
+
+from lasagna_plugin import lasagna_plugin
+from PyQt5 import QtGui, QtCore
+import numpy as np
+from imageProcessing import obliqueSlice
+
+
+class plugin(lasagna_plugin, QtGui.QWidget): #must inherit lasagna_plugin first
+
+    def __init__(self,lasagna,parent=None):
+        super(plugin,self).__init__(lasagna) #This calls the lasagna_plugin constructor which in turn calls subsequent constructors
+
+        #re-define some default properties that were originally defined in lasagna_plugin
+        self.pluginShortName='Oblique slice' #Appears on the menu
+        self.pluginLongName='show an arbitrary plane through the image stacks' #Can be used for other purposes (e.g. tool-tip)
+        self.pluginAuthor='Rob Campbell'
+
+        self.pickedPoints = [] #voxel positions clicked whilst picking a plane from three points
+
+        #Whilst the plane is being moved we sample the nearest voxel. Once the user stops, this timer
+        #triggers a re-draw with trilinear interpolation.
+        self.interpolateTimer = QtCore.QTimer()
+        self.interpolateTimer.setSingleShot(True)
+        self.interpolateTimer.setInterval(250)
+        self.interpolateTimer.timeout.connect(self.drawInterpolated)
+
+        self.setupUi()
+        self.show()
+
+
+    def setupUi(self):
+        """
+        Make the widgets. This plugin is simple enough not to need a designer file.
+        """
+        self.setWindowTitle(self.pluginShortName)
+        layout = QtGui.QFormLayout(self)
+
+        self.view_comboBox = QtGui.QComboBox()
+        self.view_comboBox.addItems(['View 1','View 2','View 3'])
+        layout.addRow('Show in', self.view_comboBox)
+
+        self.tilt_spinBox = QtGui.QDoubleSpinBox()
+        self.tilt_spinBox.setRange(-89,89)
+        self.tilt_spinBox.setSuffix(' deg')
+        layout.addRow('Tilt', self.tilt_spinBox)
+
+        self.azimuth_spinBox = QtGui.QDoubleSpinBox()
+        self.azimuth_spinBox.setRange(-180,180)
+        self.azimuth_spinBox.setWrapping(True)
+        self.azimuth_spinBox.setSuffix(' deg')
+        layout.addRow('Azimuth', self.azimuth_spinBox)
+
+        self.offset_spinBox = QtGui.QDoubleSpinBox()
+        self.offset_spinBox.setRange(-1E5,1E5)
+        self.offset_spinBox.setDecimals(1)
+        layout.addRow('Offset', self.offset_spinBox)
+
+        self.pick_pushButton = QtGui.QPushButton('Pick 3 points')
+        self.pick_pushButton.setCheckable(True)
+        self.reset_pushButton = QtGui.QPushButton('Reset view')
+        buttons = QtGui.QHBoxLayout()
+        buttons.addWidget(self.pick_pushButton)
+        buttons.addWidget(self.reset_pushButton)
+        layout.addRow(buttons)
+
+        self.tilt_spinBox.valueChanged.connect(self.anglesChanged_slot)
+        self.azimuth_spinBox.valueChanged.connect(self.anglesChanged_slot)
+        self.offset_spinBox.valueChanged.connect(self.anglesChanged_slot)
+        self.view_comboBox.currentIndexChanged.connect(self.viewChanged_slot)
+        self.pick_pushButton.toggled.connect(self.pick_pushButton_slot)
+        self.reset_pushButton.released.connect(self.resetView)
+
+
+    def axis(self):
+        """
+        The lasagna axis in which the oblique plane is shown
+        """
+        return self.lasagna.axes2D[self.view_comboBox.currentIndex()]
+
+
+    def planeFromAngles(self):
+        """
+        Return (normal,offset) for the current tilt and azimuth. These are angles relative to
+        the normal slicing axis of the chosen view. The offset is measured along the normal
+        from the centre of the stack so that tilting pivots around the middle of the volume.
+        """
+        axis = self.axis()
+        (axisU,axisV) = obliqueSlice.inPlaneAxes[axis.axisToPlot]
+        tilt = np.radians(self.tilt_spinBox.value())
+        azimuth = np.radians(self.azimuth_spinBox.value())
+
+        normal = np.zeros(3)
+        normal[axis.axisToPlot] = np.cos(tilt)
+        normal[axisU] = np.sin(tilt)*np.cos(azimuth)
+        normal[axisV] = np.sin(tilt)*np.sin(azimuth)
+
+        return (normal, np.dot(normal,self.stackCentre()) + self.offset_spinBox.value())
+
+
+    def stackCentre(self):
+        stacks = self.lasagna.returnIngredientByType('imagestack')
+        if stacks == False or len(stacks)==0:
+            return np.zeros(3)
+        return (np.array(stacks[0].raw_data().shape[:3])-1)/2.0
+
+
+    #------------------------------------------------------
+    #slots
+    def anglesChanged_slot(self):
+        if self.lasagna.stacksInTreeList() == False:
+            return
+        (normal,offset) = self.planeFromAngles()
+        self.axis().setObliquePlane(normal, offset, interpolate=False)
+        self.interpolateTimer.start()
+
+
+    def viewChanged_slot(self):
+        for thisAxis in self.lasagna.axes2D:
+            thisAxis.clearObliquePlane()
+        self.anglesChanged_slot()
+
+
+    def drawInterpolated(self):
+        axis = self.axis()
+        if axis.obliquePlane is None:
+            return
+        axis.setObliquePlane(axis.obliquePlane['normal'], axis.obliquePlane['offset'], interpolate=True)
+
+
+    def pick_pushButton_slot(self, checked):
+        self.pickedPoints = []
+        if checked:
+            self.lasagna.statusBar.showMessage("Click three points to define the oblique plane")
+
+
+    def resetView(self):
+        self.pick_pushButton.setChecked(False)
+        self.axis().clearObliquePlane()
+        for thisSpinBox in (self.tilt_spinBox, self.azimuth_spinBox, self.offset_spinBox):
+            thisSpinBox.blockSignals(True)
+            thisSpinBox.setValue(0)
+            thisSpinBox.blockSignals(False)
+
+
+    #------------------------------------------------------
+    #hooks
+    def hook_axisClicked(self, axis):
+        """
+        Collect points whilst in pick mode. The third point defines the plane.
+        """
+        if not self.pick_pushButton.isChecked():
+            return
+
+        pos = self.lasagna.mousePositionInStack
+        if len(pos) != 3:
+            return
+
+        self.pickedPoints.append(list(pos))
+        self.lasagna.statusBar.showMessage("Oblique slice: picked point %d of 3" % len(self.pickedPoints))
+        if len(self.pickedPoints) < 3:
+            return
+
+        points = self.pickedPoints #unchecking the button clears pickedPoints (see pick_pushButton_slot)
+        self.pick_pushButton.setChecked(False)
+        try:
+            self.axis().setObliquePlaneFromPoints(*points)
+        except ValueError:
+            self.lasagna.statusBar.showMessage("Oblique slice: the three points lie on a line. Please pick again.")
+
+
+    #------------------------------------------------------
+    #The following methods are involved in shutting down the plugin window
+    def closePlugin(self):
+        """
+        This method is called by lasagna when the user unchecks the plugin in the menu.
+        """
+        self.interpolateTimer.stop()
+        for thisAxis in self.lasagna.axes2D:
+            thisAxis.clearObliquePlane()
+        self.detachHooks()
+        self.close()
+
+
+    #We define this here because we can't assume all plugins will have QWidget::closeEvent
+    def closeEvent(self, event):
+        """
+        This event is executed when the user presses the close window (cross) button in the title bar
+        """
+        self.lasagna.stopPlugin(self.__module__) #This will call self.closePlugin
+        self.lasagna.pluginActions[self.__module__].setChecked(False) #Uncheck the menu item associated with this plugin's name
+        self.deleteLater()
+        event.accept()